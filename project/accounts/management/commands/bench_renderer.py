@@ -0,0 +1,86 @@
+import json
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.response import Response
+
+from accounts.renderers import UserRenderer
+
+
+def legacy_render(data):
+    """UserRenderer.render as it was: a str() scan for ErrorDetail, then json.dumps."""
+    if 'ErrorDetail' in str(data):
+        return json.dumps({'errors': data})
+    return json.dumps(data)
+
+
+def payloads(size):
+    start = date(2020, 1, 1)
+    graph = [
+        {"date": (start + timedelta(days=i)).isoformat(), "wpm": round(random.uniform(20, 120), 2),
+         "accuracy": round(random.uniform(80, 100), 2)}
+        for i in range(size)
+    ]
+    rooms = [
+        {"code": f"R{i:07d}", "created_at": f"2024-05-01T12:{i % 60:02d}:00.123456Z", "is_active": i % 3 == 0}
+        for i in range(size)
+    ]
+    errors = {
+        "detail": "Invalid session data. Please check your input.",
+        "errors": {f"field_{i}": [ErrorDetail("This field is required.", code="required")] for i in range(size)},
+    }
+    return {"graph": (graph, 200), "room_history": (rooms, 200), "validation_errors": (errors, 400)}
+
+
+class Command(BaseCommand):
+    help = "Compare UserRenderer against the previous str()-scan renderer on large payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=10_000, help="Elements per payload.")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def measure(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return sorted(timings)[len(timings) // 2] * 1000, peak / 1024
+
+    def handle(self, *args, **options):
+        if options["size"] < 1 or options["repeat"] < 1:
+            raise CommandError("--size and --repeat must be positive.")
+        random.seed(0)
+        renderer = UserRenderer()
+
+        for name, (data, status_code) in payloads(options["size"]).items():
+            context = {"response": Response(data, status=status_code)}
+            new = renderer.render(data, renderer_context=context)
+            if new != legacy_render(data).encode():
+                raise CommandError(f"{name}: output differs from the previous renderer")
+
+            old_ms, old_kib = self.measure(lambda: legacy_render(data).encode(), options["repeat"])
+            new_ms, new_kib = self.measure(lambda: renderer.render(data, renderer_context=context), options["repeat"])
+            self.stdout.write(
+                f"{name} ({len(new) / 1024:.0f} KiB): previous {old_ms:.2f} ms / {old_kib:.0f} KiB peak, "
+                f"now {new_ms:.2f} ms / {new_kib:.0f} KiB peak ({old_ms / new_ms:.1f}x)"
+            )
+            if isinstance(data, list):
+                chunks = list(renderer.iter_render(data))
+                if b"".join(chunks) != new:
+                    raise CommandError(f"{name}: streamed output differs")
+                stream_ms, stream_kib = self.measure(
+                    lambda: max(len(chunk) for chunk in renderer.iter_render(data)), options["repeat"]
+                )
+                self.stdout.write(
+                    f"  streamed in {len(chunks)} chunk(s): {stream_ms:.2f} ms / {stream_kib:.0f} KiB peak"
+                )
+        self.stdout.write(self.style.SUCCESS("Output is byte-identical to the previous renderer."))
@@ -1,9 +1,14 @@
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
+from django.utils import timezone
 
 # Custom User Manager
 class MyUserManager(BaseUserManager):
-    def create_user(self, email, username, password=None):
+    def create_user(self, email, username, password=None, **extra_fields):
         """
         Creates and saves a User with the given email, username, and password.
         """
@@ -16,6 +21,7 @@ class MyUserManager(BaseUserManager):
         user = self.model(
             email=email,
             username=username,
+            **extra_fields,
         )
 
         user.set_password(password)
@@ -48,6 +54,7 @@ class User(AbstractBaseUser):
     )
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
+    timezone = models.CharField(max_length=64, default=settings.TIME_ZONE)  # IANA name, days of practice are counted in it
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -57,9 +64,19 @@ class User(AbstractBaseUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    class Meta:
+        indexes = [
+            # case-insensitive username login, see UserLoginSerializer
+            models.Index(Lower("username"), name="user_username_lower"),
+        ]
+
     def __str__(self):
         return self.username
 
+    def local_date(self, moment=None):
+        """The calendar day `moment` (default now) falls on in the user's timezone."""
+        return timezone.localdate(moment or timezone.now(), ZoneInfo(self.timezone))
+
     def has_perm(self, perm, obj=None):
         "Does the user have a specific permission?"
         return self.is_admin
@@ -1,14 +1,55 @@
 from rest_framework import renderers
-import json
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.utils.encoders import JSONEncoder
+
+# same output as json.dumps() with default arguments, but also handles
+# dates, decimals and lazy strings the way DRF does
+_encoder = JSONEncoder(ensure_ascii=True)
+
+
+def _has_error_detail(data):
+  if isinstance(data, ErrorDetail):
+    return True
+  if isinstance(data, dict):
+    return any(_has_error_detail(value) for value in data.values())
+  if isinstance(data, (list, tuple)):
+    return any(_has_error_detail(value) for value in data)
+  return False
+
 
 class UserRenderer(renderers.JSONRenderer):
   charset = 'UTF-8'
+  stream_chunk_size = 1000  # list items encoded per chunk by iter_render()
 
   def render(self, data, accepted_media_type = None, renderer_context = None):
-    response = ""
-    if 'ErrorDetail' in str(data):
-      response = json.dumps({'errors':data})
-    else:
-      response = json.dumps(data)
-    return response
+    if self.is_error(data, renderer_context):
+      data = {'errors': data}
+    return _encoder.encode(data).encode('ascii')
+
+  @staticmethod
+  def is_error(data, renderer_context=None):
+    """
+    Errors are wrapped in {"errors": ...}. Responses built by the exception
+    handler always are; other responses only when they are 4xx/5xx and
+    carry validation details, which are small enough to walk.
+    """
+    response = (renderer_context or {}).get('response')
+    if response is None:
+      return False
+    if getattr(response, 'exception', False):
+      return True
+    return response.status_code >= 400 and _has_error_detail(data)
 
+  def iter_render(self, items):
+    """Yield a successful list payload as JSON bytes in chunks, for StreamingHttpResponse."""
+    yield b'['
+    chunk = []
+    separator = ''
+    for item in items:
+      chunk.append(item)
+      if len(chunk) >= self.stream_chunk_size:
+        yield (separator + _encoder.encode(chunk)[1:-1]).encode('ascii')
+        chunk, separator = [], ', '
+    if chunk:
+      yield (separator + _encoder.encode(chunk)[1:-1]).encode('ascii')
+    yield b']'
@@ -1,6 +1,10 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import update_last_login
+from django.db.models import Value
+from django.db.models.functions import Lower
 from rest_framework.exceptions import AuthenticationFailed
 
 from email_validator import validate_email, EmailNotValidError
@@ -13,11 +17,18 @@ from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 
 
+def validate_timezone(value):
+    try:
+        ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise serializers.ValidationError("Unknown timezone, use an IANA name such as 'Europe/Berlin'.")
+    return value
+
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['email', 'username', 'password']
+        fields = ['email', 'username', 'password', 'timezone']
         extra_kwargs = {
             'password': {'write_only': True}
         }
@@ -74,6 +85,9 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("This email is already registered.")
         
         return email
+
+    def validate_timezone(self, value):
+        return validate_timezone(value)
     
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
@@ -99,7 +113,10 @@ class UserLoginSerializer(serializers.Serializer):
             user = authenticate(username=login_field, password=password)  
         else:
             try:
-                user_obj = User.objects.get(username__iexact=login_field)
+                # compared through LOWER() so the user_username_lower index applies
+                user_obj = User.objects.alias(username_lower=Lower('username')).get(
+                    username_lower=Lower(Value(login_field))
+                )
                 user = authenticate(username=user_obj.email, password=password)
             except User.DoesNotExist:
                 user = None
@@ -118,7 +135,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = User
-        fields = ["id", "email", "username"]
+        fields = ["id", "email", "username", "timezone"]
+        read_only_fields = ["id", "email", "username"]
+
+    def validate_timezone(self, value):
+        return validate_timezone(value)
 
 class UserChangePasswordSerializer(serializers.Serializer):
     # old_password = serializers.CharField(write_only=True, style={'input_type': 'password'})
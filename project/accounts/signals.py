@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from core import cache as tagged_cache
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, created, **kwargs):
+    if not created:
+        tagged_cache.bump_on_commit(tagged_cache.user_tag(instance.pk))
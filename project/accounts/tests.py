@@ -1 +1,107 @@
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.response import Response
 from rest_framework.test import APITestCase
+
+from core.testing import QueryPlanMixin
+from .models import User
+from .renderers import UserRenderer
+
+
+class QueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(email=f"u{i}@example.com", username=f"User{i}", password="!") for i in range(500)
+        )
+        cls.analyze()
+
+    def test_login_by_username(self):
+        # the lookup UserLoginSerializer does for a login without "@"
+        self.assertUsesIndex(
+            User.objects.alias(username_lower=Lower("username")).filter(username_lower=Lower(Value("user42"))),
+            "user_username_lower",
+        )
+
+
+class ProfileTimezoneTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="tz@example.com", username="tz", password="secret-pass-1")
+        self.client.force_authenticate(self.user)
+
+    def test_update_timezone(self):
+        response = self.client.patch(reverse("profile"), {"timezone": "America/New_York"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["timezone"], "America/New_York")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.timezone, "America/New_York")
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_profile_is_replaced_after_an_update(self):
+        self.assertEqual(self.client.get(reverse("profile")).json()["timezone"], settings.TIME_ZONE)
+        with self.captureOnCommitCallbacks(execute=True):  # the User post_save signal bumps the user's tag
+            self.client.patch(reverse("profile"), {"timezone": "America/New_York"}, format="json")
+        self.assertEqual(self.client.get(reverse("profile")).json()["timezone"], "America/New_York")
+
+    def test_unknown_timezone_is_rejected(self):
+        response = self.client.patch(reverse("profile"), {"timezone": "Mars/Olympus"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("timezone", response.data)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.timezone, settings.TIME_ZONE)
+
+
+def previous_render(data):
+    # UserRenderer.render() before the one-pass rewrite
+    if 'ErrorDetail' in str(data):
+        return json.dumps({'errors': data}).encode()
+    return json.dumps(data).encode()
+
+
+class RendererCompatibilityTests(APITestCase):
+    def assertSameBytes(self, response, status_code):
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(response.content, previous_render(response.data))
+
+    def test_exception_handler_responses(self):
+        self.assertSameBytes(self.client.get(reverse("profile")), 401)
+        self.assertSameBytes(self.client.post(reverse("login"), {}, format="json"), 400)
+        self.assertSameBytes(self.client.post(reverse("register"), {
+            "email": "not an email", "username": "Zoë", "password": "a", "password2": "b",
+        }, format="json"), 400)
+        self.assertSameBytes(
+            self.client.post(reverse("login"), "{broken", content_type="application/json"), 400
+        )
+        self.client.force_authenticate(User.objects.create_user(email="r@example.com", username="r", password="pw"))
+        self.assertSameBytes(self.client.delete(reverse("profile")), 405)
+        self.assertSameBytes(self.client.post(reverse("sessions-batch"), {"sessions": []}, format="json"), 400)
+
+    def test_error_responses_built_by_views(self):
+        self.client.force_authenticate(User.objects.create_user(email="v@example.com", username="v", password="pw"))
+        self.assertSameBytes(self.client.get(reverse("session-keystrokes", args=[999])), 404)
+        self.assertSameBytes(self.client.get(reverse("graph"), {"bucket": "year"}), 400)
+        self.assertSameBytes(
+            self.client.patch(reverse("profile"), {"timezone": "Mars/Olympus"}, format="json"), 400
+        )
+
+    def test_payloads(self):
+        renderer = UserRenderer()
+        for data, status_code in (
+            ({"name": "Zoë ✓", "when": "2025-03-10", "values": [1, 2.5, None, True]}, 200),
+            ([{"username": "a"}, {"username": "b"}], 200),
+            ({"detail": "Not here."}, 404),
+            ({"field": [ErrorDetail("Required.", code="required")]}, 400),
+            ({"results": [{"errors": {"speed": ["A valid number is required."]}}]}, 201),
+        ):
+            with self.subTest(data):
+                context = {"response": Response(data, status=status_code)}
+                self.assertEqual(renderer.render(data, renderer_context=context), previous_render(data))
+        # the one encoder difference: dates are encoded where json.dumps() would fail
+        self.assertEqual(renderer.render({"day": date(2025, 3, 10)}), b'{"day": "2025-03-10"}')
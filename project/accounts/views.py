@@ -5,7 +5,8 @@ from .serializers import *
 from .renderers import UserRenderer
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.core.cache import cache
+from core import cache as tagged_cache
+from core import prerender
 
 
 class CustomToken(RefreshToken):
@@ -72,15 +73,21 @@ class UserProfileView(APIView):
 
     def get(self, request, format=None):
         user_id = request.user.id
-        cache_key = f"user_profile:{user_id}"
-        data = cache.get(cache_key)
+        cache_key, rendered = tagged_cache.get("user_profile", user_id, [tagged_cache.user_tag(user_id)])
 
-        if not data:
+        if not rendered:
             serializer = UserProfileSerializer(request.user)
-            data = serializer.data
-            cache.set(cache_key, data, timeout=60 * 5)  # Cache for 5 minutes
+            rendered = prerender.render(serializer.data)
+            tagged_cache.set(cache_key, rendered)
 
-        return Response(data, status=status.HTTP_200_OK)
+        return prerender.respond(request, rendered)
+
+    def patch(self, request, format=None):
+        # only the timezone is writable; sessions already recorded keep the day they were counted on
+        serializer = UserProfileSerializer(request.user, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
     
 
 class UserChangePasswordView(APIView):
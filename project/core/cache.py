@@ -0,0 +1,332 @@
+"""
+Tagged, versioned cache keys.
+
+Every cached value depends on one or more tags ("user:<id>", "room:<code>",
+"leaderboard"). Each tag has a version counter in the cache and the full
+key embeds the current versions, so bumping a tag makes every dependent key
+unreachable at once without scanning or deleting anything; the orphans age
+out through their TTL. That lets TTLs be hours instead of minutes.
+
+get_or_compute() adds stampede protection for hot keys: one caller
+recomputes under a short lock while everyone else is served the stale
+value (or waits briefly on a cold key), and entries are refreshed a little
+before they expire with a probability that grows as expiry nears (XFetch).
+
+Families listed in IMMUTABLE_CACHE_FAMILIES (values that never change once
+written, like room text) also get a bounded in-process LRU tier in front of
+the shared cache through get_or_load(), so repeat reads skip the network
+round-trip and unpickling.
+
+Hit and miss counts are kept per key family ("all_time_stats", "graph_data",
+...) in-process and flushed to a shared Redis hash every STATS_FLUSH_INTERVAL
+seconds.
+"""
+import logging
+import math
+import pickle
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "cache:family_stats"
+STATS_FLUSH_INTERVAL = 10
+LOCK_TIMEOUT = 5  # seconds a recomputation may hold the lock
+WAIT_INTERVAL = 0.02  # seconds between polls while another caller fills a cold key
+EARLY_REFRESH_BETA = 1.0  # > 1 refreshes earlier, < 1 later
+
+
+def _tag_key(tag):
+    return f"cache:tag:{tag}"
+
+
+def user_tag(user_id):
+    return f"user:{user_id}"
+
+
+def room_tag(code):
+    return f"room:{code}"
+
+
+LEADERBOARD_TAG = "leaderboard"
+
+
+def bump(*tags):
+    """Invalidate every key depending on any of `tags`."""
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key)
+        except Exception as e:
+            logger.warning(f"Could not bump cache tag {tag}: {e}")
+
+
+def bump_on_commit(*tags):
+    """Bump `tags` once the current transaction commits, so no reader caches pre-commit data under the new version."""
+    transaction.on_commit(lambda: bump(*tags))
+
+
+def versioned_key(family, key, tags=()):
+    versions = cache.get_many([_tag_key(tag) for tag in tags]) if tags else {}
+    suffix = ".".join(str(versions.get(_tag_key(tag), 0)) for tag in tags)
+    return f"{family}:{key}:v{suffix}"
+
+
+class FamilyStats:
+    """Per-family hit/miss counters, shared through Redis when it is available."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # field -> count not yet flushed
+        self._local = {}    # field -> count since process start
+        self._flushed_at = time.monotonic()
+
+    def record(self, family, hit, tier=None):
+        """Count a lookup; `tier` ("local_hits", "remote_hits") says where a two-tier hit was served from."""
+        fields = [f"{family}:{'hits' if hit else 'misses'}"]
+        if tier is not None:
+            fields.append(f"{family}:{tier}")
+        with self._lock:
+            for field in fields:
+                self._pending[field] = self._pending.get(field, 0) + 1
+                self._local[field] = self._local.get(field, 0) + 1
+            due = time.monotonic() - self._flushed_at >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        client = get_redis()
+        if client is None or not pending:
+            return
+        try:
+            pipe = client.pipeline()
+            for field, count in pending.items():
+                pipe.hincrby(STATS_KEY, field, count)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not flush cache statistics: {e}")
+
+    def totals(self):
+        """
+        Return {family: {"hits", "misses", "hit_ratio", ...tier hits}} across
+        processes when Redis is available.
+        """
+        self.flush()
+        client = get_redis()
+        if client is not None:
+            raw = {field.decode(): int(count) for field, count in client.hgetall(STATS_KEY).items()}
+        else:
+            with self._lock:
+                raw = dict(self._local)
+
+        families = {}
+        for field, count in raw.items():
+            family, kind = field.rsplit(":", 1)
+            families.setdefault(family, {"hits": 0, "misses": 0})[kind] = count
+        for counts in families.values():
+            total = counts["hits"] + counts["misses"]
+            counts["hit_ratio"] = round(counts["hits"] / total, 4) if total else 0.0
+        return families
+
+    def reset(self):
+        with self._lock:
+            self._pending, self._local = {}, {}
+        client = get_redis()
+        if client is not None:
+            client.delete(STATS_KEY)
+
+
+family_stats = FamilyStats()
+
+
+def get(family, key, tags=()):
+    """
+    Look up a tagged value. Returns (versioned key, value) with value None on
+    a miss; pass the same key to set() so a value computed while a tag was
+    bumped is stored under the old, already unreachable version.
+    """
+    full_key = versioned_key(family, key, tags)
+    value = cache.get(full_key)
+    family_stats.record(family, value is not None)
+    return full_key, value
+
+
+def set(full_key, value, timeout=None):
+    cache.set(full_key, value, timeout=timeout or settings.TAGGED_CACHE_TIMEOUT)
+
+
+def _should_refresh(expires_at, delta):
+    # XFetch: expiry is pulled forward by delta * beta * -log(U), U ~ (0, 1]
+    return time.time() - delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random()) >= expires_at
+
+
+def _fill(full_key, compute, timeout):
+    started = time.time()
+    value = compute()
+    delta = time.time() - started
+    # kept past its soft expiry so waiters have a stale value to fall back on
+    stale_grace = max(timeout // 10, 60)
+    cache.set(full_key, (value, started + delta + timeout, delta), timeout=timeout + stale_grace)
+    return value
+
+
+def get_or_compute(family, key, tags, compute, timeout=None):
+    """
+    Return the cached value of `compute()`, recomputing it in one caller only.
+
+    While a fresh value is being computed, other callers get the previous
+    (stale) one; on a cold key they poll for up to LOCK_TIMEOUT seconds
+    before computing it themselves. None is cached like any other value.
+    """
+    timeout = timeout or settings.TAGGED_CACHE_TIMEOUT
+    full_key = versioned_key(family, key, tags)
+    lock_key = f"lock:{full_key}"
+
+    entry = cache.get(full_key)
+    if entry is not None and not _should_refresh(entry[1], entry[2]):
+        family_stats.record(family, True)
+        return entry[0]
+
+    if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        try:
+            # another caller may have filled the key between our read and the lock
+            latest = cache.get(full_key)
+            if latest is not None and (entry is None or latest[1] != entry[1]):
+                family_stats.record(family, True)
+                return latest[0]
+            family_stats.record(family, False)
+            return _fill(full_key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        family_stats.record(family, True)
+        return entry[0]
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(full_key)
+        if entry is not None:
+            family_stats.record(family, True)
+            return entry[0]
+
+    logger.warning(f"Gave up waiting for {full_key}, computing it without the lock")
+    family_stats.record(family, False)
+    return _fill(full_key, compute, timeout)
+
+
+class LocalLRU:
+    """Thread-safe LRU bounded by the approximate byte size of its values, with a per-entry TTL."""
+
+    def __init__(self, max_bytes, timeout):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.size = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def sizeof(value):
+        if isinstance(value, (str, bytes)):
+            return sys.getsizeof(value)
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.timeout)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self, family=None):
+        """Drop everything, or only the keys of one family."""
+        with self._lock:
+            if family is None:
+                self._entries.clear()
+                self.size = 0
+                return
+            prefix = f"{family}:"
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._pop(key)
+
+
+local_cache = LocalLRU(settings.LOCAL_CACHE_MAX_BYTES, settings.LOCAL_CACHE_TIMEOUT)
+
+
+def get_or_load(family, key, load, timeout=None):
+    """
+    Read through the local LRU tier (immutable families only), then the
+    shared cache, then `load()`. A None result is not cached.
+    """
+    full_key = f"{family}:{key}"
+    local = family in settings.IMMUTABLE_CACHE_FAMILIES
+
+    if local:
+        value = local_cache.get(full_key)
+        if value is not None:
+            family_stats.record(family, True, "local_hits")
+            return value
+
+    value = cache.get(full_key)
+    if value is not None:
+        family_stats.record(family, True, "remote_hits")
+    else:
+        family_stats.record(family, False)
+        value = load()
+        if value is None:
+            return None
+        cache.set(full_key, value, timeout=timeout or settings.TAGGED_CACHE_TIMEOUT)
+
+    if local:
+        local_cache.set(full_key, value)
+    return value
+
+
+def forget(family, key):
+    """Drop one key from the shared cache and this process's local tier."""
+    full_key = f"{family}:{key}"
+    cache.delete(full_key)
+    local_cache.delete(full_key)
@@ -0,0 +1,79 @@
+"""
+Responses cached as already-rendered bytes.
+
+render() runs the data through UserRenderer once, when the cache is filled,
+and keeps the body, its ETag and (for larger bodies) a gzipped copy.
+respond() then answers a request from those bytes: a matching
+If-None-Match gets a 304 and anything else the stored body, so cache hits
+never touch a serializer, renderer or compressor. The gzipped body is a
+different representation, so it is sent with its own ETag (suffixed -gz).
+"""
+import gzip
+import hashlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from accounts.renderers import UserRenderer
+
+Rendered = namedtuple("Rendered", ["status", "body", "etag", "gzipped"])
+
+CONTENT_TYPE = f"{UserRenderer.media_type}; charset={UserRenderer.charset}"
+
+
+def render(data, status=200):
+    body = UserRenderer().render(data)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    gzipped = None
+    if settings.RESPONSE_CACHE_GZIP and len(body) >= settings.RESPONSE_CACHE_GZIP_MIN_BYTES:
+        gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+    return Rendered(status, body, etag, gzipped)
+
+
+def _gzip_etag(etag):
+    return f'{etag[:-1]}-gz"'
+
+
+def _accepts_gzip(request):
+    """Whether Accept-Encoding allows gzip; q=0 refuses it, "*" covers codings not listed."""
+    qualities = {}
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = (item.strip() for item in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def _etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def respond(request, rendered):
+    gzipped = rendered.gzipped is not None and _accepts_gzip(request)
+    etag = _gzip_etag(rendered.etag) if gzipped else rendered.etag
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    elif gzipped:
+        response = HttpResponse(rendered.gzipped, status=rendered.status, content_type=CONTENT_TYPE)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(rendered.body, status=rendered.status, content_type=CONTENT_TYPE)
+
+    response["ETag"] = etag
+    # whether a body is compressed depends on its size, so every response varies
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
@@ -0,0 +1,24 @@
+def get_redis():
+    """
+    Return the raw Redis client behind the default cache, or None when the
+    cache is not Redis backed (tests, local development without Redis).
+    """
+    from django_redis import get_redis_connection
+
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+def backend_getter(redis_backend, memory_backend):
+    """
+    Return a get_backend() for a feature stored in Redis: it builds
+    redis_backend(client) while the cache is Redis backed, and otherwise
+    returns memory_backend, one in-process instance with the same interface.
+    """
+    def get_backend():
+        client = get_redis()
+        return redis_backend(client) if client is not None else memory_backend
+
+    return get_backend
@@ -0,0 +1,43 @@
+"""
+Serializer-free row building for high-volume read endpoints.
+
+The coercions below produce exactly what the matching DRF read-only fields
+return, so rows built from values()/values_list() render to the same bytes
+as the serializers they replace, without instantiating models or fields.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+
+def as_float(value):
+    return None if value is None else float(value)
+
+
+def as_str(value):
+    return None if value is None else str(value)
+
+
+def as_bool(value):
+    return None if value is None else bool(value)
+
+
+def as_date(value):
+    if not value or isinstance(value, str):
+        return value or None
+    return value.isoformat()
+
+
+def as_datetime(value, tz=None):
+    """Same output as serializers.DateTimeField(): current time zone, ISO 8601, "Z" for UTC."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        return value
+    if settings.USE_TZ:
+        tz = tz or timezone.get_current_timezone()
+        value = value.astimezone(tz) if timezone.is_aware(value) else timezone.make_aware(value, tz)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
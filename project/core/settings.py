@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 
 
 
@@ -52,9 +53,11 @@ INSTALLED_APPS = [
     'accounts',
     'practice',
     'multiplayer',
+    'monitoring',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
@@ -122,6 +125,13 @@ CACHES = {
     }
 }
 
+TAGGED_CACHE_TIMEOUT = 60 * 60 * 6  # tagged keys are invalidated by version bumps, the TTL only reclaims memory
+IMMUTABLE_CACHE_FAMILIES = ("room_text", "text_snippet")  # also kept in the in-process LRU tier
+LOCAL_CACHE_MAX_BYTES = 32 * 1024 * 1024  # per process
+LOCAL_CACHE_TIMEOUT = 60 * 10  # seconds an entry may live in the in-process tier
+RESPONSE_CACHE_GZIP = True  # store a gzipped copy of cached responses for clients that accept it
+RESPONSE_CACHE_GZIP_MIN_BYTES = 1024  # smaller bodies are not worth compressing
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -213,11 +223,42 @@ SIMPLE_JWT = {
     "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
 }
 
+# Practice
+SNIPPET_POOL_CHECK_INTERVAL = 30  # seconds between snippet corpus version checks per process
+SESSION_BATCH_MAX_SIZE = 500  # sessions accepted per batch upload
+SESSION_BATCH_MAX_AGE_DAYS = 30  # oldest client_timestamp accepted in a batch upload
+KEYSTROKE_MAX_EVENTS = 20000  # keystrokes accepted per session timeline
+STATS_COALESCE_WINDOW = 2  # seconds a dirty user waits so bursts share one statistics update
+STATS_CLAIM_LEASE = 300  # seconds before a drain's unfinished claim is taken for a crashed drain's
+SESSION_ARCHIVE_DIR = Path(os.environ.get("SESSION_ARCHIVE_DIR", BASE_DIR / "archive"))  # monthly session archive files
+SESSION_ARCHIVE_AFTER_DAYS = 365  # raw sessions older than this move to the archive
+SESSION_ARCHIVE_CHUNK_ROWS = 20000  # sessions read per archive block
+SESSION_ARCHIVE_DELETE_ROWS = 1000  # archived sessions deleted per transaction
+
+# Multiplayer
+RACE_TICK_SECONDS = 0.2  # interval of the batched progress broadcast to a room
+RACE_COUNTDOWN_SECONDS = 5  # from the host's start to the race
+RACE_AUTH_TIMEOUT_SECONDS = 5  # for the auth frame of a connection without an Authorization header
+RACE_SEND_BUFFER = 64  # frames queued for a connection before it is closed as too slow
+
+# Monitoring
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"  # per-route metrics served on /metrics
+METRICS_FLUSH_INTERVAL = 5  # seconds a process buffers metrics before adding them to the shared registry
+METRICS_SLOW_REQUEST_SECONDS = float(os.environ.get("METRICS_SLOW_REQUEST_SECONDS", "1.0"))
+METRICS_SLOW_REQUEST_QUERIES = 5  # slowest queries logged with a slow request
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # scrapers may send it as "Authorization: Bearer <token>"
+# addresses or networks allowed to scrape /metrics without the token; none by default, since behind a
+# reverse proxy on the same host every request comes from 127.0.0.1
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "").split(",") if ip.strip()]
+
 # Celery configuration for development
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 # CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "False") == "True"
 CELERY_TASK_ALWAYS_EAGER = True
+CELERY_BEAT_SCHEDULE = {
+    "archive-sessions": {"task": "practice.tasks.archive_sessions_task", "schedule": crontab(hour=3, minute=30)},
+}
 # # Celery configuration
 # CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 # CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
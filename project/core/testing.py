@@ -0,0 +1,71 @@
+"""Test helpers shared by the apps' test suites."""
+import re
+
+from django.db import connection
+
+# "SCAN <table>" without an index is a full table scan in SQLite plans
+_SQLITE_FULL_SCAN = re.compile(r"\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)")
+# a sort step after the rows are read, i.e. the index does not deliver the ORDER BY
+_SORTS = {
+    "sqlite": re.compile(r"USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY"),
+    "postgresql": re.compile(r"^\s*(?:->\s*)?(?:Incremental )?Sort\b", re.MULTILINE),
+}
+
+
+class QueryPlanMixin:
+    """
+    assertIndexed() fails when EXPLAIN shows a query falling back to a full
+    table scan; assertUsesIndex() also requires a given index and no sort step.
+    """
+
+    @staticmethod
+    def analyze():
+        """Refresh planner statistics after seeding, as a production database would have them."""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    @staticmethod
+    def index_name(model, name):
+        """
+        The database's name for the index behind `name`, a model index or
+        unique constraint. SQLite creates unique constraints inline in the
+        table and names their indexes sqlite_autoindex_<table>_<n>.
+        """
+        constraint = next((c for c in model._meta.constraints if c.name == name), None)
+        if connection.vendor != "sqlite" or constraint is None:
+            return name
+        table = model._meta.db_table
+        columns = [model._meta.get_field(field).column for field in constraint.fields]
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA index_list("{table}")')
+            for index in [row[1] for row in cursor.fetchall()]:
+                cursor.execute(f'PRAGMA index_info("{index}")')
+                if [row[2] for row in cursor.fetchall()] == columns:
+                    return index
+        return name
+
+    def full_scans(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == "sqlite":
+            return plan, _SQLITE_FULL_SCAN.findall(plan)
+        if connection.vendor == "postgresql":
+            # tiny test tables are cheaper to scan, so only ask whether an index is usable
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+            plan = queryset.explain()
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+            return plan, re.findall(r"Seq Scan on (\w+)", plan)
+        self.skipTest(f"No plan parser for {connection.vendor}")
+
+    def assertIndexed(self, queryset, name=""):
+        plan, scans = self.full_scans(queryset)
+        self.assertFalse(scans, f"{name or queryset.query} does a full scan of {', '.join(scans)}:\n{plan}")
+
+    def assertUsesIndex(self, queryset, index, name=""):
+        plan, scans = self.full_scans(queryset)
+        name = name or queryset.query
+        self.assertFalse(scans, f"{name} does a full scan of {', '.join(scans)}:\n{plan}")
+        self.assertIn(index, plan, f"{name} does not use {index}:\n{plan}")
+        if queryset.ordered:
+            self.assertIsNone(_SORTS[connection.vendor].search(plan), f"{name} sorts after {index}:\n{plan}")
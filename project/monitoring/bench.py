@@ -0,0 +1,389 @@
+"""
+In-process endpoint benchmark with query, cache and latency budgets.
+
+seed() creates a configurable volume of users, sessions, rooms and
+participants, run() requests every URL of the accounts, practice and
+multiplayer apps through the test client and records p50/p95 latency, SQL
+queries and cache operations per endpoint, and check() compares the
+results with budgets.json. isolated() wraps a run in a rolled-back
+transaction, a private in-memory cache and the locmem mail backend, so it
+is safe to point at a development database and does not need Redis.
+"""
+import json
+import math
+import subprocess
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+
+import email_validator
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from core import cache as tagged_cache
+from multiplayer.models import Participant, Room
+from practice import dispatch, keystrokes, leaderboard
+from practice.features import snippet_features, to_bytes
+from practice.models import (
+    STATISTICS_VERSION, AllTimeStatistics, DailyStatistics, PracticeSession, Streak, TextSnippet,
+)
+from practice.recommend import snippet_index
+from practice.snippets import bump_version, snippet_pool
+from practice.utils import DAILY_FIELDS, ROLLUPS, _rollup
+from .instrument import QueryLog, cache_op_total, count_cache_ops
+
+BUDGETS_PATH = Path(__file__).with_name("budgets.json")
+APPS = ("accounts", "practice", "multiplayer")
+PASSWORD = "bench-Passw0rd!"
+HISTORY_DAYS = 90  # daily rows of the benchmark user, enough to unlock the graph
+SNIPPETS = 200
+BATCH_SIZE = 5000
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven zebras quietly vex an exhausted "
+    "juggler who keeps typing sixty words per minute without looking at the keyboard"
+).split()
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+Fixture = namedtuple("Fixture", "user other room keystroke_session volumes")
+
+# build(fixture, i) returns the request of the i-th repetition as a dict of
+# optional "kwargs" (URL), "data" (JSON body or query string) and "auth" (user).
+Endpoint = namedtuple("Endpoint", "app url_name method status build")
+
+
+@contextmanager
+def isolated():
+    """Run against a rolled-back transaction, a private cache and the locmem mail backend."""
+    previous = email_validator.TEST_ENVIRONMENT
+    # registration checks MX records; the .test addresses used here have none
+    email_validator.TEST_ENVIRONMENT = True
+    try:
+        with override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench"}},
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        ):
+            try:
+                with transaction.atomic():
+                    yield
+                    transaction.set_rollback(True)
+            finally:
+                _reset_process_state()
+    finally:
+        email_validator.TEST_ENVIRONMENT = previous
+
+
+def _reset_process_state():
+    """Drop what the run left in per-process pools and the in-memory backends it used."""
+    snippet_pool.invalidate()
+    snippet_index.invalidate()
+    for family in settings.IMMUTABLE_CACHE_FAMILIES:
+        tagged_cache.local_cache.clear(family)
+    leaderboard.get_backend().clear()
+    dispatch.get_backend().clear()
+
+
+def seed(users=1000, sessions=20000, rooms=100, participants=50):
+    """Create the benchmark data set and return its Fixture."""
+    if users < 2 or sessions < 1 or rooms < 1:
+        raise BenchmarkError("Seed at least two users and one session and room.")
+    now = timezone.now()
+    today = timezone.localdate()
+
+    password = make_password(PASSWORD)  # hashed once, shared by every seeded user
+    people = User.objects.bulk_create(
+        (User(email=f"bench{i}@mok.test", username=f"bench{i}", password=password) for i in range(users)),
+        batch_size=BATCH_SIZE,
+    )
+    user, other = people[0], people[1]
+
+    PracticeSession.objects.bulk_create(
+        (
+            PracticeSession(
+                user=people[i % users], timestamp=now - timedelta(minutes=i),
+                session_date=timezone.localdate(now - timedelta(minutes=i)), time_taken=30000 + i % 60000,
+                speed=20 + i % 100, accuracy=80 + i % 20, stats_applied=True,
+            )
+            for i in range(sessions)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    keystroke_session = PracticeSession.objects.create(user=user, time_taken=60000, speed=60, accuracy=97)
+    keys = " ".join(WORDS[:12])
+    keystrokes.record_keystrokes(keystroke_session, keys, [i * 180 for i in range(len(keys))], [3, 17])
+
+    daily = [
+        DailyStatistics(user=user, date=today - timedelta(days=day), lessons_completed=5, total_time=300,
+                        time_taken_sum=300000, speed_sum=5 * (55 + day % 15), accuracy_sum=5 * 95,
+                        top_speed=70 + day % 20, avg_speed=55 + day % 15, top_accuracy=99, avg_accuracy=95)
+        for day in range(HISTORY_DAYS)
+    ]
+    daily += [
+        DailyStatistics(user=person, date=today, lessons_completed=1, total_time=60,
+                        time_taken_sum=60000, speed_sum=25 + i % 80, accuracy_sum=94,
+                        top_speed=30 + i % 90, avg_speed=25 + i % 80, top_accuracy=98, avg_accuracy=94)
+        for i, person in enumerate(people[1:], 1)
+    ]
+    DailyStatistics.objects.bulk_create(daily, batch_size=BATCH_SIZE)
+    # the rollups and streaks apply_sessions() keeps with them
+    by_user = {}
+    for row in daily:
+        by_user.setdefault(row.user_id, {})[row.date] = {field: getattr(row, field) for field in DAILY_FIELDS}
+    for model, date_field, period_of in ROLLUPS[1:]:
+        model.objects.bulk_create(
+            (
+                model(user_id=user_id, **{date_field: period}, **row)
+                for user_id, days in by_user.items() for period, row in _rollup(days, period_of).items()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+    AllTimeStatistics.objects.bulk_create(
+        (
+            AllTimeStatistics(user=person, total_lessons_completed=10 + i % 500, total_time_spent=600,
+                              top_speed=30 + i % 120, avg_speed=25 + i % 90, top_accuracy=99, avg_accuracy=94,
+                              statistics_version=STATISTICS_VERSION)
+            for i, person in enumerate(people)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Streak.objects.bulk_create(
+        [Streak(user=user, current_streak=HISTORY_DAYS, longest_streak=HISTORY_DAYS, last_active_date=today)]
+        + [Streak(user=person, current_streak=1, longest_streak=1, last_active_date=today) for person in people[1:]],
+        batch_size=BATCH_SIZE,
+    )
+
+    first = (TextSnippet.objects.aggregate(last=Max("index"))["last"] or 0) + 1
+    contents = [
+        " ".join(WORDS[i % len(WORDS):] + WORDS[:i % len(WORDS)] + [f"lap {i // len(WORDS)}."])
+        for i in range(SNIPPETS)
+    ]
+    TextSnippet.objects.bulk_create(
+        TextSnippet(index=first + i, content=content, content_hash=TextSnippet.hash_content(content),
+                    features=to_bytes(snippet_features(content)))
+        for i, content in enumerate(contents)
+    )
+
+    hosted = Room.objects.bulk_create(
+        (Room(code=f"B{i:07d}", host=user, text=contents[i % SNIPPETS]) for i in range(rooms)),
+        batch_size=BATCH_SIZE,
+    )
+    room = hosted[0]
+    Participant.objects.bulk_create(
+        (
+            Participant(room=room, user=person, wpm=40 + i % 80, accuracy=85 + i % 15,
+                        finished_at=now - timedelta(seconds=i))
+            for i, person in enumerate(people[:min(participants, users)])
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    # bulk_create skips the signals that normally keep these in step
+    bump_version(reset=True)
+    leaderboard.rebuild()
+    for window in leaderboard.WINDOWS:
+        leaderboard.rebuild_window(window)
+
+    volumes = {"users": users, "sessions": sessions, "rooms": rooms, "participants": participants}
+    return Fixture(user, other, room, keystroke_session, volumes)
+
+
+def _new_session(fx):
+    return PracticeSession.objects.create(user=fx.user, time_taken=45000, speed=62, accuracy=96)
+
+
+def _reset_token(fx):
+    uid = urlsafe_base64_encode(force_bytes(fx.user.pk))
+    return {"uid": uid, "token": PasswordResetTokenGenerator().make_token(User.objects.get(pk=fx.user.pk))}
+
+
+_TIMELINE = " ".join(WORDS[:8])
+_SESSION = {"time_taken": 60000, "speed": 64.5, "accuracy": 96.5}
+
+ENDPOINTS = [
+    # accounts
+    Endpoint("accounts", "token_refresh", "post", 200,
+             lambda fx, i: {"data": {"refresh": str(RefreshToken.for_user(fx.user))}}),
+    Endpoint("accounts", "register", "post", 201,
+             lambda fx, i: {"data": {"email": f"joiner{i}@mok.test", "username": f"joiner{i}", "password": PASSWORD}}),
+    Endpoint("accounts", "login", "post", 200,
+             lambda fx, i: {"data": {"login_field": fx.user.username, "password": PASSWORD}}),
+    Endpoint("accounts", "profile", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("accounts", "profile", "patch", 200,
+             lambda fx, i: {"auth": fx.user, "data": {"timezone": settings.TIME_ZONE}}),
+    Endpoint("accounts", "change_password", "post", 200,
+             lambda fx, i: {"auth": fx.user, "data": {"password": PASSWORD, "password2": PASSWORD}}),
+    Endpoint("accounts", "send_reset_password_email", "post", 200,
+             lambda fx, i: {"data": {"email": fx.user.email}}),
+    Endpoint("accounts", "reset_password", "post", 200,
+             lambda fx, i: {"kwargs": _reset_token(fx), "data": {"password": PASSWORD, "password2": PASSWORD}}),
+    # practice
+    Endpoint("practice", "texts", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "texts-recommended", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "sessions", "post", 201, lambda fx, i: {"auth": fx.user, "data": _SESSION}),
+    Endpoint("practice", "sessions-batch", "post", 201,
+             lambda fx, i: {"auth": fx.user, "data": {"idempotency_key": f"bench-{i}", "sessions": [_SESSION] * 20}}),
+    Endpoint("practice", "session-keystrokes", "post", 201,
+             lambda fx, i: {
+                 "auth": fx.user, "kwargs": {"session_id": _new_session(fx).pk},
+                 "data": {"keys": _TIMELINE, "timestamps": [t * 150 for t in range(len(_TIMELINE))], "errors": [4]},
+             }),
+    Endpoint("practice", "session-keystrokes", "get", 200,
+             lambda fx, i: {"auth": fx.user, "kwargs": {"session_id": fx.keystroke_session.pk}}),
+    Endpoint("practice", "keystroke-heatmap", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "daily_stats", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "all_time_stats", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "streak", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "user_rank", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "graph", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("practice", "leaderboard", "get", 200, lambda fx, i: {}),
+    Endpoint("practice", "leaderboard-around", "get", 200, lambda fx, i: {"auth": fx.user}),
+    # multiplayer
+    Endpoint("multiplayer", "room-create", "post", 201,
+             lambda fx, i: {"auth": fx.user, "data": {"text": fx.room.text}}),
+    Endpoint("multiplayer", "room-history", "get", 200, lambda fx, i: {"auth": fx.user}),
+    Endpoint("multiplayer", "room-join", "post", 200,
+             lambda fx, i: {"auth": fx.other, "kwargs": {"code": fx.room.code}}),
+    Endpoint("multiplayer", "room-text", "get", 200,
+             lambda fx, i: {"auth": fx.other, "kwargs": {"code": fx.room.code}}),
+    Endpoint("multiplayer", "room-results", "post", 200,
+             lambda fx, i: {"auth": fx.user, "kwargs": {"code": fx.room.code}, "data": {"wpm": 71.5, "accuracy": 97}}),
+    Endpoint("multiplayer", "room-leaderboard", "get", 200, lambda fx, i: {"kwargs": {"code": fx.room.code}}),
+]
+
+
+def endpoint_key(endpoint):
+    return f"{endpoint.method.upper()} {endpoint.app}:{endpoint.url_name}"
+
+
+def uncovered():
+    """URL names of the benchmarked apps that no endpoint case requests."""
+    covered = {(endpoint.app, endpoint.url_name) for endpoint in ENDPOINTS}
+    return sorted(
+        f"{app}:{pattern.name}"
+        for app in APPS for pattern in import_module(f"{app}.urls").urlpatterns
+        if (app, pattern.name) not in covered
+    )
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, so a p95 over few requests is an observed request."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def measure(client, endpoint, fx, repeat):
+    timings, queries, query_ms, ops, cache_totals = [], [], [], [], Counter()
+    for i in range(repeat):
+        request = endpoint.build(fx, i)  # fixtures a request needs are created outside the timing
+        path = reverse(endpoint.url_name, kwargs=request.get("kwargs"))
+        auth = request.get("auth")
+        if auth is not None:
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(auth).access_token}")
+        else:
+            client.credentials()
+
+        # the leaderboard's raw Redis client is not counted as cache operations
+        sql = QueryLog()
+        with connection.execute_wrapper(sql), count_cache_ops() as counts:
+            started = time.perf_counter()
+            # on_commit work (cache bumps, leaderboard syncs, eager tasks) runs as it would after a commit
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                response = getattr(client, endpoint.method)(path, request.get("data"), format="json")
+            # streamed bodies run their queries while being consumed
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+            timings.append((time.perf_counter() - started) * 1000)
+
+        if response.status_code != endpoint.status:
+            raise BenchmarkError(
+                f"{endpoint_key(endpoint)} returned {response.status_code}, expected {endpoint.status}: {body[:300]!r}"
+            )
+        queries.append(sql.count)
+        query_ms.append(sql.seconds * 1000)
+        ops.append(cache_op_total(counts))
+        cache_totals.update(counts)
+
+    return {
+        "path": path,
+        "status": endpoint.status,
+        "requests": repeat,
+        "p50_ms": round(percentile(timings, 0.5), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": max(queries),
+        "query_ms": round(percentile(query_ms, 0.5), 3),
+        "cache_ops": max(ops),
+        "cache": dict(sorted(cache_totals.items())),
+        "bytes": len(body),
+    }
+
+
+def run(fx, repeat=20, endpoints=None):
+    """Request every endpoint `repeat` times, returning {key: result}. Call inside isolated()."""
+    missing = uncovered()
+    if missing and endpoints is None:
+        raise BenchmarkError(f"No benchmark case for {', '.join(missing)}")
+    client = APIClient()
+    results = {}
+    for endpoint in endpoints or ENDPOINTS:
+        results[endpoint_key(endpoint)] = measure(client, endpoint, fx, repeat)
+    return results
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def check(results, budgets, latency=True):
+    """Return a message per budget the results exceed; every endpoint needs a budget."""
+    violations = []
+    for key, result in results.items():
+        budget = budgets.get(key)
+        if budget is None:
+            violations.append(f"{key}: no budget in {BUDGETS_PATH.name}")
+            continue
+        limits = [("queries", "queries"), ("cache_ops", "cache operations")]
+        if latency:
+            limits.append(("p95_ms", "ms p95"))
+        for field, unit in limits:
+            if field in budget and result[field] > budget[field]:
+                violations.append(f"{key}: {result[field]} {unit}, budget {budget[field]}")
+    return violations
+
+
+def report(fx, repeat, results):
+    """The JSON document written for comparison across commits."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created_at": timezone.now().isoformat(),
+        "database": connection.vendor,
+        "volumes": fx.volumes,
+        "repeat": repeat,
+        "endpoints": results,
+    }
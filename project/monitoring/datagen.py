@@ -0,0 +1,353 @@
+"""
+Deterministic synthetic data at production scale, for load and scale tests.
+
+Users are generated in chunks, each from its own random stream seeded by
+(seed, chunk), so the data set depends only on the seed, the volumes, the
+chunk size and the end date, never on how many worker processes write it. A chunk's
+sessions are generated as numpy arrays and its daily, weekly, monthly and
+all-time statistics and streak are derived from them, so the rollups agree
+with the raw rows the way apply_sessions() would leave them. Rows are
+written with executemany() in one transaction per chunk, and a process
+holds one chunk at a time, which bounds memory by --chunk-rows.
+"""
+import math
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from zoneinfo import ZoneInfo
+
+import django
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.models import User
+from multiplayer.models import Participant, Room
+from practice.models import (
+    STATISTICS_VERSION, AllTimeStatistics, DailyStatistics, MonthlyStatistics, PracticeSession, Streak,
+    TextSnippet, WeeklyStatistics,
+)
+
+PASSWORD = "load-Passw0rd!"
+DAY = 86400
+ROOM_TEXT = "The quick brown fox jumps over the lazy dog."
+# user timezones, first the server's; their sessions are bucketed into their own local days
+TIMEZONES = ("Asia/Kolkata", "Europe/London", "America/New_York", "America/Los_Angeles", "Asia/Tokyo",
+             "Australia/Sydney")
+
+# everything a worker needs to generate its chunk identically to any other process
+Plan = namedtuple(
+    "Plan",
+    "seed users sessions_per_user years rooms participants chunk_rows "
+    "first_user_id first_room_id end password texts",
+)
+
+
+def plan(seed=0, users=100_000, sessions_per_user=100, years=3, rooms=10_000, participants=20,
+         chunk_rows=200_000, end=None):
+    """Fix the id ranges and the end of the generated history before any rows are written."""
+    end = end or timezone.now()
+    texts = tuple(TextSnippet.objects.order_by("index").values_list("content", flat=True)[:200]) or (ROOM_TEXT,)
+    return Plan(
+        seed, users, sessions_per_user, years, rooms, participants, chunk_rows,
+        (User.objects.aggregate(last=Max("id"))["last"] or 0) + 1,
+        (Room.objects.aggregate(last=Max("id"))["last"] or 0) + 1,
+        end.timestamp(), make_password(PASSWORD), texts,
+    )
+
+
+def user_chunks(p):
+    """(chunk, first, stop) user index ranges holding about chunk_rows sessions each."""
+    size = max(1, p.chunk_rows // max(1, p.sessions_per_user))
+    return [(i, start, min(start + size, p.users)) for i, start in enumerate(range(0, p.users, size))]
+
+
+def room_chunks(p):
+    size = max(1, p.chunk_rows // max(1, p.participants))
+    return [(i, start, min(start + size, p.rooms)) for i, start in enumerate(range(0, p.rooms, size))]
+
+
+def _insert(model, fields, rows):
+    """executemany() an INSERT of `fields`; other columns get their field default."""
+    qn = connection.ops.quote_name
+    rest = [f for f in model._meta.concrete_fields if f.attname not in fields and not f.primary_key]
+    defaults = tuple(f.get_db_prep_save(f.get_default(), connection) for f in rest)
+    columns = [model._meta.get_field(name).column for name in fields] + [f.column for f in rest]
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        qn(model._meta.db_table), ", ".join(qn(column) for column in columns), ", ".join(["%s"] * len(columns))
+    )
+    if defaults:
+        rows = (row + defaults for row in rows)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _datetimes(seconds):
+    """
+    UTC "YYYY-MM-DD HH:MM:SS.ffffff" strings, formatted by numpy rather than
+    per value by the driver. The connection time zone is UTC with USE_TZ on,
+    and SQLite's date functions need the space separator.
+    """
+    stamps = (np.asarray(seconds) * 1e6).astype("datetime64[us]")
+    return np.char.replace(np.datetime_as_string(stamps), "T", " ").tolist()
+
+
+def _dates(days):
+    return np.datetime_as_string(np.asarray(days).astype("datetime64[D]")).tolist()
+
+
+_offsets = {}
+
+
+def _local_days(seconds, start, end, tz):
+    """Day numbers in time zone `tz`, from a table of its UTC offset per hour."""
+    first_hour, last_hour = int(start // 3600), int(end // 3600) + 1
+    key = (str(tz), first_hour, last_hour)
+    if key not in _offsets:
+        if len(_offsets) >= len(TIMEZONES):
+            _offsets.clear()
+        _offsets[key] = np.array([
+            datetime.fromtimestamp(hour * 3600, tz).utcoffset().total_seconds()
+            for hour in range(first_hour, last_hour + 1)
+        ])
+    shifted = seconds + _offsets[key][(seconds // 3600).astype(np.int64) - first_hour]
+    return (shifted // DAY).astype(np.int64)
+
+
+def _groups(*keys):
+    """Start offsets of the runs of equal consecutive keys."""
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def _rollup(starts, lessons, time_sum, speed_sum, accuracy_sum, top_speed, top_accuracy):
+    """Fold per-session or per-period sums into the groups beginning at `starts`."""
+    lessons = np.add.reduceat(lessons, starts)
+    speed_sum = np.add.reduceat(speed_sum, starts)
+    accuracy_sum = np.add.reduceat(accuracy_sum, starts)
+    return {
+        "lessons": lessons,
+        "time_sum": np.add.reduceat(time_sum, starts),
+        "speed_sum": speed_sum,
+        "accuracy_sum": accuracy_sum,
+        "top_speed": np.maximum.reduceat(top_speed, starts),
+        "top_accuracy": np.maximum.reduceat(top_accuracy, starts),
+        "avg_speed": speed_sum / lessons,
+        "avg_accuracy": accuracy_sum / lessons,
+    }
+
+
+def _write_statistics(model, user_ids, stats, period_field=None, periods=None,
+                      time_field="total_time", lessons_field="lessons_completed", constants=None):
+    fields = ["user_id", time_field, lessons_field, "top_speed", "avg_speed", "top_accuracy", "avg_accuracy",
+              "time_taken_sum", "speed_sum", "accuracy_sum"]
+    columns = [
+        user_ids.tolist(), (stats["time_sum"] // 1000).tolist(), stats["lessons"].tolist(),
+        stats["top_speed"].tolist(), stats["avg_speed"].tolist(), stats["top_accuracy"].tolist(),
+        stats["avg_accuracy"].tolist(), stats["time_sum"].tolist(), stats["speed_sum"].tolist(),
+        stats["accuracy_sum"].tolist(),
+    ]
+    if period_field:
+        fields.append(period_field)
+        columns.append(_dates(periods))
+    for field, value in (constants or {}).items():
+        fields.append(field)
+        columns.append([value] * len(user_ids))
+    _insert(model, fields, zip(*columns))
+
+
+def generate_users(p, chunk, first, stop):
+    """Write users [first, stop) with their sessions, statistics and streaks. Returns rows per table."""
+    rng = np.random.default_rng([p.seed, 0, chunk])
+    n = stop - first
+    span = p.years * 365 * DAY
+    start = p.end - span
+
+    # per user: typing skill, accuracy, how active, when they signed up
+    skill = np.clip(rng.lognormal(math.log(45), 0.35, n), 10, 180)
+    steadiness = np.clip(100 - rng.gamma(2.0, 2.5, n), 60, 99.9)
+    activity = rng.lognormal(0, 1, n) / math.exp(0.5)  # mean 1
+    counts = rng.poisson(p.sessions_per_user * activity)
+    signup = p.end - span * rng.beta(1.2, 1.0, n)
+
+    # a stream of its own, so the draws above and below do not depend on it
+    zone = np.random.default_rng([p.seed, 2, chunk]).integers(0, len(TIMEZONES), n)
+
+    ids = np.arange(p.first_user_id + first, p.first_user_id + stop)
+    created = _datetimes(signup)
+    _insert(User, ["id", "password", "email", "username", "is_active", "is_admin", "timezone", "created_at",
+                   "updated_at"], (
+        (user_id, p.password, f"load{user_id}@load.test", f"load{user_id}", True, False, TIMEZONES[z], at, at)
+        for user_id, z, at in zip(ids.tolist(), zone.tolist(), created)
+    ))
+
+    # sessions, ordered by user then time so every rollup below is a contiguous group
+    owner = np.repeat(np.arange(n), counts)
+    m = len(owner)
+    at = signup[owner] + rng.random(m) * (p.end - signup[owner])
+    order = np.lexsort((at, owner))
+    owner, at = owner[order], at[order]
+    progress = (at - signup[owner]) / span  # players get faster the longer they stay
+    speed = np.round(np.clip(skill[owner] * (1 + 0.3 * progress) * rng.normal(1, 0.08, m), 5, 250), 2)
+    accuracy = np.round(np.clip(steadiness[owner] + rng.normal(0, 2, m), 50, 100), 2)
+    time_taken = rng.integers(15_000, 180_000, m)
+    user_id = ids[owner]
+    day = np.zeros(m, dtype=np.int64)
+    for z, name in enumerate(TIMEZONES):
+        local = zone[owner] == z
+        if local.any():
+            day[local] = _local_days(at[local], start, p.end, ZoneInfo(name))
+
+    _insert(PracticeSession, ["user_id", "timestamp", "session_date", "time_taken", "speed", "accuracy",
+                              "stats_applied"], zip(
+        user_id.tolist(), _datetimes(at), _dates(day), time_taken.tolist(), speed.tolist(), accuracy.tolist(),
+        [True] * m,
+    ))
+    written = Counter(users=n, sessions=m)
+    if not m:
+        return written
+
+    starts = _groups(user_id, day)
+    daily = _rollup(starts, np.ones(m, dtype=np.int64), time_taken, speed, accuracy, speed, accuracy)
+    day_user, day = user_id[starts], day[starts]
+    _write_statistics(DailyStatistics, day_user, daily, "date", day)
+    written["daily"] = len(starts)
+
+    epoch_days = day.astype("datetime64[D]")
+    for model, periods in (
+        (WeeklyStatistics, day - (day + 3) % 7),  # 1970-01-01 was a Thursday
+        (MonthlyStatistics, epoch_days.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)),
+    ):
+        period_starts = _groups(day_user, periods)
+        stats = _rollup(period_starts, daily["lessons"], daily["time_sum"], daily["speed_sum"],
+                        daily["accuracy_sum"], daily["top_speed"], daily["top_accuracy"])
+        _write_statistics(model, day_user[period_starts], stats, "period_start", periods[period_starts])
+        written["weekly" if model is WeeklyStatistics else "monthly"] = len(period_starts)
+
+    user_starts = _groups(day_user)
+    total = _rollup(user_starts, daily["lessons"], daily["time_sum"], daily["speed_sum"], daily["accuracy_sum"],
+                    daily["top_speed"], daily["top_accuracy"])
+    _write_statistics(AllTimeStatistics, day_user[user_starts], total,
+                      time_field="total_time_spent", lessons_field="total_lessons_completed",
+                      constants={"statistics_version": STATISTICS_VERSION})
+    written["all_time"] = len(user_starts)
+
+    # streaks: runs of consecutive active days, the current one ends at the last active day
+    run_starts = _groups(day_user, day - np.arange(len(day)))
+    run_length = np.diff(np.append(run_starts, len(day)))
+    run_user = day_user[run_starts]
+    first_run = _groups(run_user)
+    last_run = np.append(first_run[1:], len(run_starts)) - 1
+    last_day = day[np.append(user_starts[1:], len(day)) - 1]
+    _insert(Streak, ["user_id", "current_streak", "longest_streak", "last_active_date"], zip(
+        run_user[first_run].tolist(), run_length[last_run].tolist(),
+        np.maximum.reduceat(run_length, first_run).tolist(), _dates(last_day),
+    ))
+    written["streaks"] = len(first_run)
+    return written
+
+
+def generate_rooms(p, chunk, first, stop):
+    """Write rooms [first, stop) hosted by and filled with generated users. Returns rows per table."""
+    rng = np.random.default_rng([p.seed, 1, chunk])
+    n = stop - first
+    span = p.years * 365 * DAY
+
+    ids = np.arange(p.first_room_id + first, p.first_room_id + stop)
+    hosts = p.first_user_id + rng.integers(0, p.users, n)
+    created = p.end - span * rng.random(n)
+    texts = rng.integers(0, len(p.texts), n)
+    active = created > p.end - DAY
+    # lower case never collides with generate_unique_room_code()
+    _insert(Room, ["id", "code", "host_id", "text", "created_at", "is_active"], zip(
+        ids.tolist(), [f"g{room_id:07x}" for room_id in ids.tolist()], hosts.tolist(),
+        [p.texts[i] for i in texts.tolist()], _datetimes(created), active.tolist(),
+    ))
+
+    sizes = np.clip(rng.poisson(p.participants, n), 1, p.users)
+    members = np.concatenate([rng.choice(p.users, size, replace=False) for size in sizes.tolist()])
+    room = np.repeat(np.arange(n), sizes)
+    m = len(room)
+    finished = rng.random(m) < 0.9
+    wpm = np.where(finished, np.round(rng.lognormal(math.log(50), 0.35, m), 2), np.nan)
+    accuracy = np.where(finished, np.round(np.clip(100 - rng.gamma(2.0, 2.5, m), 50, 100), 2), np.nan)
+    finished_at = created[room] + rng.uniform(30, 300, m)
+
+    def nullable(values, keep):
+        return [value if ok else None for value, ok in zip(values, keep.tolist())]
+
+    _insert(Participant, ["room_id", "user_id", "wpm", "accuracy", "finished_at"], zip(
+        ids[room].tolist(), (p.first_user_id + members).tolist(), nullable(wpm.tolist(), finished),
+        nullable(accuracy.tolist(), finished), nullable(_datetimes(finished_at), finished),
+    ))
+    return Counter(rooms=n, participants=m)
+
+
+def _run(kind, p, chunk, first, stop):
+    # SQLite only takes these outside a transaction, so a caller's atomic() block keeps the defaults
+    if connection.vendor == "sqlite" and not connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout = 600000")  # other workers hold the write lock in turn
+            cursor.execute("PRAGMA synchronous = NORMAL")
+            cursor.execute("PRAGMA cache_size = -65536")  # 64 MiB for index pages
+    generate = generate_users if kind == "users" else generate_rooms
+    # every key written points at a row generated before it, as loaddata assumes for fixtures
+    with connection.constraint_checks_disabled(), transaction.atomic():
+        return generate(p, chunk, first, stop)
+
+
+def generate(p, workers=1, progress=None):
+    """Write the whole plan, users before rooms, and return (rows per table, seconds)."""
+    if connection.vendor == "sqlite" and not connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode = WAL")
+
+    totals = Counter()
+    started = time.perf_counter()
+    phases = [("users", user_chunks(p)), ("rooms", room_chunks(p))]
+    if workers > 1:
+        connection.close()  # workers open their own
+        # spawned workers import this module, so Django must be set up before anything is unpickled
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=django.setup) as pool:
+            for kind, chunks in phases:
+                futures = [pool.submit(_run, kind, p, *chunk) for chunk in chunks]
+                for written in (future.result() for future in futures):
+                    totals.update(written)
+                    if progress:
+                        progress(totals, time.perf_counter() - started)
+    else:
+        for kind, chunks in phases:
+            for chunk in chunks:
+                totals.update(_run(kind, p, *chunk))
+                if progress:
+                    progress(totals, time.perf_counter() - started)
+
+    # explicit ids leave sequences behind on backends that have them
+    statements = connection.ops.sequence_reset_sql(no_style(), [User, Room])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return totals, time.perf_counter() - started
+
+
+def peak_memory_mb():
+    """
+    Peak resident set size of this process and of the largest finished worker
+    (Linux reports KiB), or (None, None) where the resource module is missing.
+    """
+    try:
+        import resource  # POSIX only
+    except ImportError:
+        return None, None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
@@ -0,0 +1,113 @@
+"""
+Counting SQL queries and cache operations, shared by the metrics middleware
+and the endpoint benchmark.
+
+Cache calls are counted by wrappers installed once per cache backend
+instance. They only do work while a count_cache_ops() block is active in
+the current context, so leaving them installed costs a ContextVar lookup
+per call.
+"""
+import heapq
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import caches
+
+# calls on the default cache that reach the backend
+CACHE_OPS = ("get", "set", "add", "delete", "get_many", "set_many", "delete_many", "incr", "decr", "touch")
+
+_counters = ContextVar("cache_counters", default=())
+
+
+def _counted(name, method):
+    if name == "get":
+        def call(key, default=None, *args, **kwargs):
+            value = method(key, default, *args, **kwargs)
+            for counts in _counters.get():
+                counts["get"] += 1
+                counts["hits" if value is not default else "misses"] += 1
+            return value
+    elif name == "get_many":
+        def call(keys, *args, **kwargs):
+            values = method(keys, *args, **kwargs)
+            active = _counters.get()
+            if active:
+                requested = len(keys) if hasattr(keys, "__len__") else len(values)
+                for counts in active:
+                    counts["get_many"] += 1
+                    counts["hits"] += len(values)
+                    counts["misses"] += requested - len(values)
+            return values
+    else:
+        def call(*args, **kwargs):
+            for counts in _counters.get():
+                counts[name] += 1
+            return method(*args, **kwargs)
+    return call
+
+
+def _install(backend):
+    if backend.__dict__.get("_ops_counted"):
+        return
+    for name in CACHE_OPS:
+        setattr(backend, name, _counted(name, getattr(backend, name)))
+    backend._ops_counted = True
+
+
+def start_cache_count():
+    """Begin counting default cache calls in this context; pass the result to stop_cache_count()."""
+    _install(caches["default"])
+    counts = Counter()
+    _counters.set(_counters.get() + (counts,))
+    return counts
+
+
+def stop_cache_count(counts):
+    _counters.set(tuple(active for active in _counters.get() if active is not counts))
+
+
+@contextmanager
+def count_cache_ops():
+    """
+    Count calls per operation on the default cache while the block runs,
+    plus "hits" and "misses" of get() and get_many().
+    """
+    counts = start_cache_count()
+    try:
+        yield counts
+    finally:
+        stop_cache_count(counts)
+
+
+def cache_op_total(counts):
+    return sum(counts[name] for name in CACHE_OPS)
+
+
+class QueryLog:
+    """A connection.execute_wrapper() counting and timing queries, keeping the `keep` slowest."""
+
+    def __init__(self, keep=0):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep = keep
+        self._slowest = []  # min-heap of (seconds, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if self.keep:
+                if len(self._slowest) < self.keep:
+                    heapq.heappush(self._slowest, (elapsed, sql))
+                elif elapsed > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, (elapsed, sql))
+
+    def slowest(self):
+        """[(seconds, sql)] of the slowest queries, slowest first."""
+        return sorted(self._slowest, reverse=True)
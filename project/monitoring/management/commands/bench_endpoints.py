@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a data set and request every accounts, practice and multiplayer URL in-process, "
+        "recording p50/p95 latency, SQL queries and cache operations per endpoint against "
+        "monitoring/budgets.json. Runs in a transaction that is rolled back, with a private cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--sessions", type=int, default=20000, help="Practice sessions across all users.")
+        parser.add_argument("--rooms", type=int, default=100, help="Rooms hosted by the benchmark user.")
+        parser.add_argument("--participants", type=int, default=50, help="Participants in the benchmarked room.")
+        parser.add_argument("--repeat", type=int, default=20, help="Requests per endpoint.")
+        parser.add_argument("--output", default="endpoint-bench.json", help="Where to write the JSON results.")
+        parser.add_argument("--compare", help="Results of an earlier run to print deltas against.")
+        parser.add_argument("--budgets", default=str(bench.BUDGETS_PATH))
+        parser.add_argument("--no-latency", action="store_true", help="Only check query and cache budgets.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be positive.")
+        previous = self.load(options["compare"]) if options["compare"] else None
+        budgets = self.load(options["budgets"])
+
+        try:
+            with bench.isolated():
+                self.stdout.write("Seeding benchmark data...")
+                fx = bench.seed(options["users"], options["sessions"], options["rooms"], options["participants"])
+                results = bench.run(fx, options["repeat"])
+                document = bench.report(fx, options["repeat"], results)
+        except bench.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        for key, result in results.items():
+            line = (
+                f"{key}: p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+                f"{result['queries']} quer{'y' if result['queries'] == 1 else 'ies'} "
+                f"({result['query_ms']:.2f} ms), {result['cache_ops']} cache op(s)"
+            )
+            before = (previous or {}).get("endpoints", {}).get(key)
+            if before:
+                line += (
+                    f" | was p95 {before['p95_ms']:.2f} ms ({self.change(before['p95_ms'], result['p95_ms'])}), "
+                    f"{before['queries']} quer{'y' if before['queries'] == 1 else 'ies'}"
+                )
+            self.stdout.write(line)
+
+        with open(options["output"], "w") as f:
+            json.dump(document, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        violations = bench.check(results, budgets, latency=not options["no_latency"])
+        if violations:
+            raise CommandError("Over budget:\n  " + "\n  ".join(violations))
+        self.stdout.write(self.style.SUCCESS(f"All {len(results)} endpoints within budget."))
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+    @staticmethod
+    def change(before, after):
+        return f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
@@ -0,0 +1,69 @@
+from datetime import datetime, time as dt_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from monitoring import datagen
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic data set for load and scale testing: users with years of "
+        "practice sessions and consistent daily, weekly, monthly and all-time statistics and streaks, "
+        "plus rooms with participants. Rows are added to whatever is already in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--sessions-per-user", type=int, default=100, help="Mean; activity is long-tailed.")
+        parser.add_argument("--years", type=int, default=3, help="History length.")
+        parser.add_argument("--rooms", type=int, default=10_000)
+        parser.add_argument("--participants", type=int, default=20, help="Mean participants per room.")
+        parser.add_argument("--until", help="Last day of the history (YYYY-MM-DD), today by default. "
+                                            "Same seed, volumes and --until give the same data.")
+        parser.add_argument("--chunk-rows", type=int, default=200_000,
+                            help="Rows generated and held in memory at once per process.")
+        parser.add_argument("--workers", type=int, default=1, help="Processes writing user and room ranges.")
+
+    def handle(self, *args, **options):
+        numbers = ("users", "years", "chunk_rows", "workers")
+        if any(options[name] < 1 for name in numbers) or min(
+                options["sessions_per_user"], options["rooms"], options["participants"]) < 0:
+            raise CommandError("Volumes must not be negative; --users, --years, --chunk-rows and --workers "
+                               "must be positive.")
+        end = None
+        if options["until"]:
+            try:
+                day = datetime.strptime(options["until"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--until must be a YYYY-MM-DD date.")
+            end = timezone.make_aware(datetime.combine(day, dt_time.max))
+
+        p = datagen.plan(
+            options["seed"], options["users"], options["sessions_per_user"], options["years"], options["rooms"],
+            options["participants"], options["chunk_rows"], end,
+        )
+        self.stdout.write(
+            f"Generating {p.users} users (~{p.users * p.sessions_per_user} sessions) and {p.rooms} rooms "
+            f"with {options['workers']} worker(s), seed {p.seed}..."
+        )
+        totals, seconds = datagen.generate(p, options["workers"], self.progress)
+
+        rows = sum(totals.values())
+        self.stdout.write("")
+        for table, count in sorted(totals.items()):
+            self.stdout.write(f"  {table}: {count}")
+        own, workers = datagen.peak_memory_mb()
+        memory = ""
+        if own is not None:
+            memory = f", peak memory {own:.0f} MiB" + (f", {workers:.0f} MiB per worker" if options["workers"] > 1 else "")
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows} rows in {seconds:.1f} s ({rows / seconds:,.0f} rows/s){memory}"
+        ))
+        self.stdout.write("Run rebuild_leaderboard to load the new statistics into the leaderboards.")
+
+    def progress(self, totals, seconds):
+        rows = sum(totals.values())
+        self.stdout.write(f"\r  {rows:,} rows, {rows / seconds:,.0f} rows/s", ending="")
+        self.stdout.flush()
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.celery import app
+from monitoring.signals import get_backend, slowest_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the number of messages waiting in each Celery queue, the tasks workers hold "
+        "(running, prefetched and scheduled with a countdown) and the slowest recent task runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=10, help="Slowest runs to show.")
+        parser.add_argument("--timeout", type=float, default=1.0, help="Seconds to wait for workers to reply.")
+        parser.add_argument("--reset", action="store_true", help="Forget the recorded runs after printing them.")
+
+    def handle(self, *args, **options):
+        queues = sorted({app.conf.task_default_queue, *app.amqp.queues})
+        try:
+            with app.connection_for_read() as conn:
+                conn.ensure_connection(max_retries=1)
+                for queue in queues:
+                    depth = conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+                    self.stdout.write(f"queue {queue}: {depth} waiting")
+            self.show_workers(options["timeout"])
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Broker unavailable, queue depth unknown: {e}"))
+
+        runs = slowest_tasks(options["limit"])
+        if not runs:
+            self.stdout.write("No task runs recorded yet.")
+        else:
+            self.stdout.write(f"Slowest of the last {len(get_backend().recent())} task runs:")
+        for run in runs:
+            finished = timezone.localtime(datetime.fromtimestamp(run["finished_at"], dt_timezone.utc))
+            lag = "" if run["lag"] is None else f", waited {run['lag'] * 1000:.0f} ms"
+            self.stdout.write(
+                f"  {run['seconds'] * 1000:.0f} ms  {run['task']} {run['state']}{lag}, "
+                f"finished {finished:%Y-%m-%d %H:%M:%S} ({run['id']})"
+            )
+
+        if options["reset"]:
+            get_backend().clear()
+            self.stdout.write(self.style.SUCCESS("Recorded runs cleared."))
+
+    def show_workers(self, timeout):
+        inspect = app.control.inspect(timeout=timeout)
+        held = {"running": inspect.active(), "prefetched": inspect.reserved(), "scheduled": inspect.scheduled()}
+        if held["running"] is None:
+            self.stdout.write("No workers replied.")
+            return
+        for kind, by_worker in held.items():
+            for worker, tasks in sorted((by_worker or {}).items()):
+                self.stdout.write(f"{worker}: {len(tasks)} {kind}")
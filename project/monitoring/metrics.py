@@ -0,0 +1,159 @@
+"""
+Process-wide metrics registry with Prometheus text exposition.
+
+Counters and histograms are accumulated in-process and added every
+METRICS_FLUSH_INTERVAL seconds to one Redis hash, so /metrics served by any
+worker reports the totals of all of them. Without Redis the registry is
+per process, as in tests and local development.
+
+Series are stored under their exposition name, e.g.
+'http_requests_total{route="v1/api/practice/graph/",method="GET",status="200"}',
+and histograms as cumulative _bucket, _sum and _count series. The web tier
+records through monitoring.middleware and Celery workers through
+monitoring.signals.
+"""
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "metrics:registry"
+
+# family -> (type, help)
+FAMILIES = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency by route and method."),
+    "http_response_size_bytes": ("histogram", "Response body size by route and method."),
+    "http_request_queries": ("histogram", "SQL queries per request by route and method."),
+    "http_slow_requests_total": ("counter", "Requests slower than METRICS_SLOW_REQUEST_SECONDS."),
+    "db_queries_total": ("counter", "SQL queries by route."),
+    "db_query_duration_seconds_total": ("counter", "Time spent in SQL queries by route."),
+    "cache_operations_total": ("counter", "Default cache calls by route and operation."),
+    "cache_lookups_total": ("counter", "Default cache get() and get_many() keys by route, hit or miss."),
+    "celery_task_queue_lag_seconds": ("histogram", "Time from enqueue, or from the ETA of a delayed task, to start."),
+    "celery_task_duration_seconds": ("histogram", "Task run time by task name."),
+    "celery_tasks_total": ("counter", "Finished task runs by task name and state."),
+    "celery_task_retries_total": ("counter", "Task retries by task name."),
+    "celery_task_failures_total": ("counter", "Task failures by task name and exception."),
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+_SERIES = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?$")
+_LE = re.compile(r',?le="([^"]*)"')
+
+
+def labels(**values):
+    """Exposition label set, e.g. {route="...",method="GET"}; empty for no labels."""
+    if not values:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in values.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def count(fields, name, label_set="", value=1):
+    """Add a counter increment to `fields`, a dict later passed to Registry.add()."""
+    series = name + label_set
+    fields[series] = fields.get(series, 0) + value
+
+
+def observe(fields, name, value, buckets, label_set=""):
+    """Add a histogram observation to `fields`."""
+    inner = label_set[1:-1] + "," if label_set else ""
+    for bound in buckets:
+        if value <= bound:
+            count(fields, f'{name}_bucket{{{inner}le="{bound}"}}')
+    count(fields, f'{name}_bucket{{{inner}le="+Inf"}}')
+    count(fields, f"{name}_sum{label_set}", value=value)
+    count(fields, f"{name}_count{label_set}")
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # series -> increment not yet flushed
+        self._local = {}    # series -> total since process start
+        self._flushed_at = time.monotonic()
+
+    def add(self, fields):
+        """Fold {series: increment} into the registry."""
+        with self._lock:
+            for series, value in fields.items():
+                self._pending[series] = self._pending.get(series, 0) + value
+                self._local[series] = self._local.get(series, 0) + value
+            due = time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        client = get_redis()
+        if client is None or not pending:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipe.hincrbyfloat(METRICS_KEY, series, value)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not flush metrics: {e}")
+
+    def totals(self):
+        """{series: value} across processes when Redis is available."""
+        self.flush()
+        client = get_redis()
+        if client is not None:
+            return {series.decode(): float(value) for series, value in client.hgetall(METRICS_KEY).items()}
+        with self._lock:
+            return dict(self._local)
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        families = {}
+        for series, value in self.totals().items():
+            match = _SERIES.match(series)
+            if match is None:
+                continue
+            name, label_set = match.group(1), match.group(2) or ""
+            family = name
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and FAMILIES.get(name[:-len(suffix)], ("",))[0] == "histogram":
+                    family = name[:-len(suffix)]
+            le = _LE.search(label_set)
+            bound = float(le.group(1)) if le else 0.0  # "+Inf" parses as inf
+            order = (_LE.sub("", label_set).replace("{,", "{"), name, bound)
+            families.setdefault(family, []).append((order, series, value))
+
+        lines = []
+        for family in sorted(families):
+            kind, description = FAMILIES.get(family, ("untyped", ""))
+            if description:
+                lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {kind}")
+            for _, series, value in sorted(families[family]):
+                lines.append(f"{series} {int(value) if float(value).is_integer() else repr(float(value))}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._pending, self._local = {}, {}
+        client = get_redis()
+        if client is not None:
+            client.delete(METRICS_KEY)
+
+
+registry = Registry()
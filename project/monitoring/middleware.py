@@ -0,0 +1,95 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import metrics
+from .instrument import CACHE_OPS, QueryLog, start_cache_count, stop_cache_count
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, response size, SQL queries and cache calls per route into
+    the metrics registry, and log requests slower than
+    METRICS_SLOW_REQUEST_SECONDS with their slowest queries.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_seconds = settings.METRICS_SLOW_REQUEST_SECONDS
+        self.keep = settings.METRICS_SLOW_REQUEST_QUERIES
+
+    def __call__(self, request):
+        # the connection object itself, so the wrapper is removed from the one it was added to
+        db = connections[DEFAULT_DB_ALIAS]
+        queries = QueryLog(keep=self.keep)
+        db.execute_wrappers.append(queries)
+        counts = start_cache_count()
+        started = time.perf_counter()
+
+        def finish(response, size):
+            stop_cache_count(counts)
+            db.execute_wrappers.remove(queries)
+            self.record(request, response, time.perf_counter() - started, size, queries, counts)
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            finish(None, 0)
+            raise
+        if response.streaming:
+            response.streaming_content = self.stream(response, response.streaming_content, finish)
+        else:
+            finish(response, len(response.content))
+        return response
+
+    @staticmethod
+    def stream(response, content, finish):
+        # streamed bodies run their queries while being consumed
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            finish(response, size)
+
+    def record(self, request, response, seconds, size, queries, counts):
+        match = request.resolver_match
+        route = match.route if match is not None else "<unmatched>"
+        status = response.status_code if response is not None else 500
+        by_route = metrics.labels(route=route)
+        by_request = metrics.labels(route=route, method=request.method)
+
+        fields = {}
+        metrics.count(fields, "http_requests_total", metrics.labels(route=route, method=request.method, status=status))
+        metrics.observe(fields, "http_request_duration_seconds", seconds, metrics.LATENCY_BUCKETS, by_request)
+        metrics.observe(fields, "http_response_size_bytes", size, metrics.SIZE_BUCKETS, by_request)
+        metrics.observe(fields, "http_request_queries", queries.count, metrics.QUERY_BUCKETS, by_request)
+        if queries.count:
+            metrics.count(fields, "db_queries_total", by_route, queries.count)
+            metrics.count(fields, "db_query_duration_seconds_total", by_route, queries.seconds)
+        for op in CACHE_OPS:
+            if counts[op]:
+                metrics.count(fields, "cache_operations_total", metrics.labels(route=route, op=op), counts[op])
+        for result in ("hits", "misses"):
+            if counts[result]:
+                metrics.count(fields, "cache_lookups_total", metrics.labels(route=route, result=result), counts[result])
+        slow = seconds >= self.slow_seconds
+        if slow:
+            metrics.count(fields, "http_slow_requests_total", by_request)
+        registry.add(fields)
+
+        if slow:
+            top = "".join(f"\n  {elapsed * 1000:.1f} ms  {sql[:500]}" for elapsed, sql in queries.slowest())
+            logger.warning(
+                f"Slow request {request.method} {request.path} ({route}) {status}: {seconds * 1000:.0f} ms, "
+                f"{queries.count} queries in {queries.seconds * 1000:.0f} ms{top}"
+            )
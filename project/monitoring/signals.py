@@ -0,0 +1,143 @@
+"""
+Celery task metrics.
+
+Publishing stamps each message with its enqueue time, and the worker
+records per task name the lag from enqueue (or from the ETA of a delayed
+task) to start, the run duration, and retries and failures in the metrics
+registry shared with the web tier. The slowest recent runs are kept in a
+capped Redis list for the task_status command.
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from celery import signals
+
+from core.redis import backend_getter
+from . import metrics
+from .metrics import registry
+
+RECENT_KEY = "metrics:tasks:recent"
+RECENT_SIZE = 1000  # finished runs kept for task_status
+ENQUEUED_HEADER = "enqueued_at"
+
+
+class RedisBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def push(self, run):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush(RECENT_KEY, json.dumps(run))
+        pipe.ltrim(RECENT_KEY, 0, RECENT_SIZE - 1)
+        pipe.execute()
+
+    def recent(self):
+        return [json.loads(run) for run in self.client.lrange(RECENT_KEY, 0, -1)]
+
+    def clear(self):
+        self.client.delete(RECENT_KEY)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._runs = deque(maxlen=RECENT_SIZE)
+
+    def push(self, run):
+        self._runs.appendleft(run)
+
+    def recent(self):
+        return list(self._runs)
+
+    def clear(self):
+        self._runs.clear()
+
+
+get_backend = backend_getter(RedisBackend, MemoryBackend())
+
+
+def slowest_tasks(limit=10):
+    """The slowest of the recent task runs, slowest first."""
+    return sorted(get_backend().recent(), key=lambda run: run["seconds"], reverse=True)[:limit]
+
+
+# task id -> (perf_counter at start, lag in seconds or None), for runs in progress in this process
+_started = {}
+_started_lock = threading.Lock()
+
+
+def _header(request, name):
+    # worker requests carry custom headers as attributes, eager ones in request.headers
+    value = getattr(request, name, None)
+    if value is None:
+        value = (getattr(request, "headers", None) or {}).get(name)
+    return value
+
+
+def _lag(request, now):
+    enqueued_at = _header(request, ENQUEUED_HEADER)
+    if enqueued_at is None:
+        return None
+    ready_at = float(enqueued_at)
+    eta = getattr(request, "eta", None)
+    if eta:
+        # a countdown is intended delay, not queueing
+        ready_at = max(ready_at, datetime.fromisoformat(eta).timestamp())
+    return max(now - ready_at, 0.0)
+
+
+@signals.before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(ENQUEUED_HEADER, time.time())
+
+
+@signals.task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    lag = _lag(task.request, time.time())
+    with _started_lock:
+        _started[task_id] = (time.perf_counter(), lag)
+    if lag is not None:
+        fields = {}
+        metrics.observe(fields, "celery_task_queue_lag_seconds", lag, metrics.TASK_BUCKETS, metrics.labels(task=task.name))
+        registry.add(fields)
+
+
+@signals.task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    with _started_lock:
+        started = _started.pop(task_id, None)
+    if started is None:
+        return
+    seconds, lag = time.perf_counter() - started[0], started[1]
+    by_task = metrics.labels(task=task.name)
+
+    fields = {}
+    metrics.observe(fields, "celery_task_duration_seconds", seconds, metrics.TASK_BUCKETS, by_task)
+    metrics.count(fields, "celery_tasks_total", metrics.labels(task=task.name, state=state or "UNKNOWN"))
+    registry.add(fields)
+    get_backend().push({
+        "task": task.name, "id": task_id, "state": state, "seconds": round(seconds, 6),
+        "lag": None if lag is None else round(lag, 6), "finished_at": time.time(),
+    })
+
+
+@signals.task_retry.connect
+def task_retried(sender=None, **kwargs):
+    fields = {}
+    metrics.count(fields, "celery_task_retries_total", metrics.labels(task=sender.name))
+    registry.add(fields)
+
+
+@signals.task_failure.connect
+def task_failed(sender=None, exception=None, **kwargs):
+    fields = {}
+    metrics.count(fields, "celery_task_failures_total", metrics.labels(task=sender.name, exception=type(exception).__name__))
+    registry.add(fields)
+
+
+@signals.worker_process_shutdown.connect
+def flush_on_shutdown(**kwargs):
+    registry.flush()
@@ -0,0 +1,158 @@
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from accounts.tasks import send_email_task
+from practice.models import PracticeSession
+from practice.tasks import drain_statistics_task
+from practice.utils import rebuild_user_statistics
+from . import bench, datagen, metrics, signals
+from .metrics import registry
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class EndpointBudgetTests(TestCase):
+    def test_every_url_has_a_case(self):
+        self.assertEqual(bench.uncovered(), [])
+
+    # hashing dominates the account endpoints and is not what these budgets guard
+    @override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+    def test_endpoints_within_query_and_cache_budgets(self):
+        with bench.isolated():
+            fx = bench.seed(users=200, sessions=2000, rooms=20, participants=30)
+            results = bench.run(fx, repeat=3)
+        # latency depends on the machine running the suite, the bench_endpoints command checks it
+        self.assertEqual(bench.check(results, bench.load_budgets(), latency=False), [])
+
+
+class DataGeneratorTests(TestCase):
+    def generate(self):
+        p = datagen.plan(seed=7, users=300, sessions_per_user=20, rooms=10, participants=5, chunk_rows=1000,
+                         end=timezone.make_aware(datetime(2026, 6, 30, 12)))
+        totals, _ = datagen.generate(p)
+        sessions = list(
+            PracticeSession.objects.filter(user_id__gte=p.first_user_id).order_by("user_id", "timestamp")
+            .values_list("user_id", "timestamp", "speed", "accuracy", "time_taken")
+        )
+        return p, totals, [(user_id - p.first_user_id, *rest) for user_id, *rest in sessions]
+
+    def test_rollups_match_the_generated_sessions(self):
+        p, totals, sessions = self.generate()
+        self.assertEqual(totals["users"], 300)
+        self.assertEqual(totals["sessions"], len(sessions))
+        self.assertEqual(totals["rooms"], 10)
+        for user_id in User.objects.filter(pk__gte=p.first_user_id).values_list("pk", flat=True)[:50]:
+            self.assertEqual(rebuild_user_statistics(user_id, commit=False), [], user_id)
+
+    def test_same_seed_gives_the_same_data(self):
+        with transaction.atomic():
+            _, _, first = self.generate()
+            transaction.set_rollback(True)
+        _, _, second = self.generate()
+        self.assertEqual(first, second)
+
+
+@override_settings(CACHES=LOCMEM, METRICS_TOKEN="s3cret")
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def scrape(self):
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return dict(line.rsplit(" ", 1) for line in response.content.decode().splitlines() if not line.startswith("#"))
+
+    def test_requests_are_counted_per_route(self):
+        for _ in range(3):
+            status = self.client.get(reverse("leaderboard")).status_code
+        series = self.scrape()
+        route = 'route="v1/api/practice/leaderboard/",method="GET"'
+        self.assertEqual(series[f'http_requests_total{{{route},status="{status}"}}'], "3")
+        self.assertEqual(series[f'http_request_duration_seconds_count{{{route}}}'], "3")
+        self.assertEqual(series[f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}'], "3")
+        self.assertEqual(series[f'http_response_size_bytes_count{{{route}}}'], "3")
+        # the first request computes the leaderboard, the others are served from the cache
+        self.assertEqual(series['cache_lookups_total{route="v1/api/practice/leaderboard/",result="hits"}'], "2")
+        self.assertIn('db_queries_total{route="v1/api/practice/leaderboard/"}', series)
+
+    def test_histogram_buckets_are_cumulative(self):
+        fields = {}
+        for value in (0.003, 0.02, 0.3, 20):
+            metrics.observe(fields, "http_request_duration_seconds", value, metrics.LATENCY_BUCKETS)
+        registry.add(fields)
+        series = self.scrape()
+        self.assertEqual(series['http_request_duration_seconds_bucket{le="0.005"}'], "1")
+        self.assertEqual(series['http_request_duration_seconds_bucket{le="0.025"}'], "2")
+        self.assertEqual(series['http_request_duration_seconds_bucket{le="10"}'], "3")
+        self.assertEqual(series['http_request_duration_seconds_bucket{le="+Inf"}'], "4")
+        self.assertEqual(series["http_request_duration_seconds_count"], "4")
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.0/8"])
+    def test_scrapes_need_an_allowed_address_or_the_token(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)  # the test client is 127.0.0.1
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.1.2.3").status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer guess").status_code, 403)
+
+    def test_scrapes_through_a_local_proxy_need_the_token_by_default(self):
+        # a reverse proxy on the same host connects from 127.0.0.1 whoever the client is
+        url = reverse("metrics")
+        response = self.client.get(url, REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.7")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="::1").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics.labels(route='a"b\\c'), '{route="a\\"b\\\\c"}')
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        user = User.objects.create(email="slow@example.com", username="slow", password="!")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        with self.assertLogs("monitoring.middleware", "WARNING") as logs:
+            self.client.get(reverse("all_time_stats"))
+        self.assertIn("Slow request GET /v1/api/practice/all_time_stats/", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+@override_settings(CACHES=LOCMEM)
+class TaskMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        signals.get_backend().clear()
+
+    def test_runs_and_failures_are_recorded_per_task(self):
+        drain_statistics_task.apply()
+        send_email_task.apply(args=[{}])  # no subject: KeyError
+        totals = registry.totals()
+
+        drain = metrics.labels(task=drain_statistics_task.name)
+        self.assertEqual(totals[f"celery_task_duration_seconds_count{drain}"], 1)
+        self.assertEqual(totals[f'celery_tasks_total{metrics.labels(task=drain_statistics_task.name, state="SUCCESS")}'], 1)
+        self.assertEqual(totals[f'celery_tasks_total{metrics.labels(task=send_email_task.name, state="FAILURE")}'], 1)
+        failures = metrics.labels(task=send_email_task.name, exception="KeyError")
+        self.assertEqual(totals[f"celery_task_failures_total{failures}"], 1)
+        self.assertEqual({run["task"] for run in signals.slowest_tasks()}, {drain_statistics_task.name, send_email_task.name})
+
+    def test_queue_lag_excludes_the_countdown(self):
+        headers = {}
+        signals.stamp_enqueue_time(headers=headers)
+        headers[signals.ENQUEUED_HEADER] -= 30
+        request = SimpleNamespace(headers=headers, eta=(timezone.now() - timedelta(seconds=10)).isoformat())
+        self.assertAlmostEqual(signals._lag(request, time.time()), 10, delta=1)
+
+        drain_statistics_task.apply(headers={signals.ENQUEUED_HEADER: time.time() - 3})
+        lag = registry.totals()[f"celery_task_queue_lag_seconds_sum{metrics.labels(task=drain_statistics_task.name)}"]
+        self.assertAlmostEqual(lag, 3, delta=1)
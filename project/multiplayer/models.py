@@ -12,6 +12,12 @@ class Room(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # a host's room history, newest first
+            models.Index(fields=["host", "-created_at"], name="room_host_created"),
+        ]
+
     def __str__(self):
         return f"Room {self.code} (host={self.host.username})"
 
@@ -35,6 +41,12 @@ class Participant(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["room", "user"], name="unique_room_user")
         ]
+        indexes = [
+            # room leaderboard: finished participants by speed
+            models.Index(
+                fields=["room", "-wpm"], condition=models.Q(wpm__isnull=False), name="participant_room_wpm"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} in {self.room.code}"
@@ -0,0 +1,336 @@
+"""
+WebSocket race server for multiplayer rooms.
+
+A plain ASGI application, mounted next to Django in core.asgi for
+"websocket" scopes on /ws/rooms/<code>/. Each process keeps the races of
+the rooms its connections are in, so every participant of a room must be
+served by the same process.
+
+Protocol, JSON text frames:
+
+    client                                  server
+    {"type": "auth", "token": "<access>"}   (first frame, unless the upgrade
+                                             request carried Authorization)
+                                            {"type": "room", "code", "text", "host",
+                                             "starts_at", "players"}
+    {"type": "start"}  (host only)          {"type": "countdown", "starts_at", "seconds"}
+    {"type": "progress", "position": 42}    {"type": "progress", "players"}  (every tick)
+    {"type": "finish", "wpm", "accuracy"}
+                                            {"type": "error", "detail"}
+
+Progress ticks only update the player's state. Every RACE_TICK_SECONDS the
+players that changed since the last tick are serialized once and queued
+for every connection of the room, so the broadcast cost does not grow with
+how often clients report. Each connection is written by its own task; one
+that falls RACE_SEND_BUFFER frames behind is closed rather than buffered
+without bound, and gets the full state again when it reconnects.
+"""
+import asyncio
+import json
+import re
+import time
+from collections import deque
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import Participant, Room
+from .serializers import ParticipantResultSerializer
+
+ROUTE = re.compile(r"/ws/rooms/(?P<code>[^/]+)/?")
+MAX_FRAME_BYTES = 4096
+
+# application close codes
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+CLOSE_TOO_SLOW = 1013  # "try again later"
+CLOSE_TOO_BIG = 1009
+
+
+def dumps(message):
+    return json.dumps(message, separators=(",", ":"))
+
+
+class Player:
+    __slots__ = ("username", "position", "wpm", "accuracy", "finished")
+
+    def __init__(self, username):
+        self.username = username
+        self.position = 0
+        self.wpm = 0.0
+        self.accuracy = None
+        self.finished = False
+
+    def as_dict(self):
+        return {
+            "username": self.username, "position": self.position, "wpm": round(self.wpm, 2),
+            "accuracy": self.accuracy, "finished": self.finished,
+        }
+
+
+class Connection:
+    """One WebSocket; frames are queued and written by its own task."""
+
+    def __init__(self, send, user_id):
+        self.send = send
+        self.user_id = user_id
+        self.outbox = deque()
+        self.ready = asyncio.Event()
+        self.close_code = None
+        self.writer = None
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write())
+
+    def push(self, frame):
+        if self.close_code is not None:
+            return
+        if len(self.outbox) >= settings.RACE_SEND_BUFFER:
+            # too slow to keep up; it gets the full state again on reconnect
+            self.close(CLOSE_TOO_SLOW)
+            return
+        self.outbox.append(frame)
+        self.ready.set()
+
+    def close(self, code):
+        if self.close_code is None:
+            self.close_code = code
+            self.outbox.clear()
+            self.ready.set()
+
+    async def _write(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.outbox:
+                await self.send({"type": "websocket.send", "text": self.outbox.popleft()})
+            if self.close_code is not None:
+                await self.send({"type": "websocket.close", "code": self.close_code})
+                return
+
+    async def stop(self):
+        if self.writer is not None:
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+
+
+class Race:
+    """The live state of one room in this process."""
+
+    def __init__(self, code, text, host_id):
+        self.code = code
+        self.text = text
+        self.host_id = host_id
+        self.players = {}       # user id -> Player
+        self.connections = set()
+        self.changed = set()    # user ids whose Player changed since the last tick
+        self.starts_at = None   # epoch seconds once the host started the countdown
+        self.ticker = None
+
+    def join(self, connection, username):
+        self.players.setdefault(connection.user_id, Player(username))
+        self.connections.add(connection)
+        connection.push(dumps({
+            "type": "room", "code": self.code, "text": self.text, "host": self.host_id,
+            "starts_at": self.starts_at, "players": [player.as_dict() for player in self.players.values()],
+        }))
+        if self.ticker is None:
+            self.ticker = asyncio.create_task(self._tick())
+
+    def leave(self, connection):
+        self.connections.discard(connection)
+        if not self.connections and self.ticker is not None:
+            self.ticker.cancel()
+            self.ticker = None
+
+    def broadcast(self, frame):
+        for connection in self.connections:
+            connection.push(frame)
+
+    def start(self, user_id):
+        if user_id != self.host_id:
+            return "Only the host can start the race."
+        if self.starts_at is not None:
+            return "The race has already started."
+        seconds = settings.RACE_COUNTDOWN_SECONDS
+        self.starts_at = time.time() + seconds
+        self.broadcast(dumps({"type": "countdown", "starts_at": self.starts_at, "seconds": seconds}))
+
+    def started(self):
+        return self.starts_at is not None and time.time() >= self.starts_at
+
+    def progress(self, user_id, position):
+        if not self.started():
+            return "The race has not started."
+        player = self.players[user_id]
+        if player.finished:
+            return None
+        player.position = max(0, min(int(position), len(self.text)))
+        minutes = (time.time() - self.starts_at) / 60
+        player.wpm = player.position / 5 / minutes if minutes > 0 else 0.0
+        self.changed.add(user_id)
+
+    def finish(self, user_id, wpm, accuracy):
+        player = self.players[user_id]
+        player.position, player.wpm, player.accuracy, player.finished = len(self.text), wpm, accuracy, True
+        self.changed.add(user_id)
+
+    def flush(self):
+        """Broadcast the players that changed since the last tick as one frame."""
+        if not self.changed:
+            return
+        players = [self.players[user_id].as_dict() for user_id in self.changed]
+        self.changed.clear()
+        self.broadcast(dumps({"type": "progress", "players": players}))
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(settings.RACE_TICK_SECONDS)
+            self.flush()
+
+
+def _authenticate(token, code):
+    """(user, room) for an access token and a room code, or (None, close code)."""
+    auth = JWTAuthentication()
+    try:
+        user = auth.get_user(auth.get_validated_token(token))
+    except AuthenticationFailed:  # InvalidToken is a subclass
+        return None, CLOSE_UNAUTHORIZED
+    room = Room.objects.filter(code=code, is_active=True).values("id", "text", "host_id").first()
+    if room is None:
+        return None, CLOSE_NOT_FOUND
+    if not Participant.objects.filter(room_id=room["id"], user=user).exists():
+        return None, CLOSE_FORBIDDEN
+    return user, room
+
+
+def _record_result(room_id, user, data):
+    """Save a finish like RoomResultView does; the validated result, or the errors."""
+    participant = Participant.objects.get(room_id=room_id, user=user)
+    serializer = ParticipantResultSerializer(participant, data=data, partial=True)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    serializer.save(finished_at=timezone.now())
+    return serializer.validated_data, None
+
+
+class RaceServer:
+    """ASGI application for the race WebSocket route."""
+
+    def __init__(self):
+        self.races = {}  # room code -> Race
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        match = ROUTE.fullmatch(scope["path"])
+        if match is None:
+            await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+            return
+        code = unquote(match["code"])
+
+        token = self.header_token(scope)
+        await send({"type": "websocket.accept"})
+        if token is None:
+            token = await self.receive_token(receive)
+            if token is None:
+                await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+                return
+
+        user, room = await sync_to_async(_authenticate)(token, code)
+        if user is None:
+            await send({"type": "websocket.close", "code": room})
+            return
+
+        race = self.races.get(code)
+        if race is None:
+            race = self.races[code] = Race(code, room["text"], room["host_id"])
+        connection = Connection(send, user.pk)
+        connection.start()
+        race.join(connection, user.username)
+        try:
+            await self.serve(race, connection, room["id"], user, receive)
+        finally:
+            race.leave(connection)
+            if not race.connections and self.races.get(code) is race:
+                del self.races[code]
+            await connection.stop()
+
+    @staticmethod
+    def header_token(scope):
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                kind, _, token = value.decode("latin-1").partition(" ")
+                if kind in settings.SIMPLE_JWT["AUTH_HEADER_TYPES"] and token:
+                    return token
+        return None
+
+    @staticmethod
+    async def receive_token(receive):
+        try:
+            message = await asyncio.wait_for(receive(), settings.RACE_AUTH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            frame = json.loads(message.get("text") or "")
+        except ValueError:
+            return None
+        if not isinstance(frame, dict) or frame.get("type") != "auth" or not isinstance(frame.get("token"), str):
+            return None
+        return frame["token"]
+
+    async def serve(self, race, connection, room_id, user, receive):
+        while connection.close_code is None:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            text = message.get("text")
+            if text is None or len(text) > MAX_FRAME_BYTES:
+                connection.close(CLOSE_TOO_BIG)
+                return
+            try:
+                frame = json.loads(text)
+                kind = frame["type"]
+            except (ValueError, TypeError, KeyError):
+                connection.push(dumps({"type": "error", "detail": "Frames are JSON objects with a type."}))
+                continue
+
+            error = None
+            if kind == "start":
+                error = race.start(user.pk)
+            elif kind == "progress":
+                position = frame.get("position")
+                if not isinstance(position, int) or isinstance(position, bool):
+                    error = "position must be an integer."
+                else:
+                    error = race.progress(user.pk, position)
+            elif kind == "finish":
+                error = await self.finish(race, room_id, user, frame)
+            else:
+                error = f"Unknown frame type {kind!r}."
+            if error is not None:
+                connection.push(dumps({"type": "error", "detail": error}))
+
+    @staticmethod
+    async def finish(race, room_id, user, frame):
+        if not race.started():
+            return "The race has not started."
+        if race.players[user.pk].finished:
+            return "You have already finished."
+        if frame.get("wpm") is None or frame.get("accuracy") is None:
+            return "wpm and accuracy are required."
+        result, errors = await sync_to_async(_record_result)(
+            room_id, user, {"wpm": frame["wpm"], "accuracy": frame["accuracy"]}
+        )
+        if errors:
+            return errors
+        race.finish(user.pk, result["wpm"], result["accuracy"])
+
+
+server = RaceServer()
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Room, Participant
 from .utils import generate_unique_room_code
+from core.rows import as_datetime, as_float, as_str
 class RoomSerializer(serializers.ModelSerializer):
     host = serializers.HiddenField(default=serializers.CurrentUserDefault())
     code = serializers.CharField(read_only=True)
@@ -27,6 +28,20 @@ class LeaderboardEntrySerializer(serializers.Serializer):
     accuracy = serializers.FloatField()
     finished_at = serializers.DateTimeField()
 
+
+def leaderboard_entries(participants):
+    """LeaderboardEntrySerializer's output for a Participant queryset, joined to usernames in the same query."""
+    rows = participants.values_list('user__username', 'wpm', 'accuracy', 'finished_at')
+    return [
+        {
+            "username": as_str(username),
+            "wpm": as_float(wpm),
+            "accuracy": as_float(accuracy),
+            "finished_at": as_datetime(finished_at),
+        }
+        for username, wpm, accuracy, finished_at in rows
+    ]
+
 class RoomHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
@@ -35,4 +50,13 @@ class RoomHistorySerializer(serializers.ModelSerializer):
             'created_at',
             'is_active',
         ]
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+
+def room_history_rows(rooms, chunk_size=None):
+    """Yield RoomHistorySerializer's output for a Room queryset, without instantiating rooms."""
+    rows = rooms.values_list('code', 'created_at', 'is_active')
+    if chunk_size:
+        rows = rows.iterator(chunk_size=chunk_size)
+    for code, created_at, is_active in rows:
+        yield {"code": code, "created_at": as_datetime(created_at), "is_active": is_active}
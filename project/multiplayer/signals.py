@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core import cache as tagged_cache
+from .models import Participant, Room
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_room_cache(sender, instance, **kwargs):
+    code = Room.objects.filter(pk=instance.room_id).values_list("code", flat=True).first()
+    if code is not None:
+        tagged_cache.bump_on_commit(tagged_cache.room_tag(code))
+
+
+@receiver(post_save, sender=Room)
+def invalidate_room_code_cache(sender, instance, **kwargs):
+    # a cached "Room not found." for this code must not outlive the room's creation
+    tagged_cache.bump_on_commit(tagged_cache.room_tag(instance.code))
+
+
+@receiver(post_delete, sender=Room)
+def forget_room_text(sender, instance, **kwargs):
+    transaction.on_commit(lambda: tagged_cache.forget("room_text", instance.code))
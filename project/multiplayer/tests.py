@@ -1,3 +1,204 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from accounts.renderers import UserRenderer
+from core import prerender
+from core.testing import QueryPlanMixin
+from .models import Participant, Room
+from .serializers import LeaderboardEntrySerializer, RoomHistorySerializer, leaderboard_entries
+from .race import Connection, RaceServer
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class QueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f"u{i}@example.com", username=f"user{i}", password="!") for i in range(100)
+        )
+        cls.host = users[0]
+        rooms = Room.objects.bulk_create(
+            Room(code=f"R{i:05d}", host=users[i % 10], text="text") for i in range(200)
+        )
+        cls.room = rooms[0]
+        Participant.objects.bulk_create(
+            Participant(room=room, user=user, wpm=None if i % 4 == 0 else 40 + i % 60, accuracy=95,
+                        finished_at=timezone.now())
+            for room in rooms[:50] for i, user in enumerate(users)
+        )
+        cls.analyze()
+
+    def test_room_leaderboard(self):
+        self.assertUsesIndex(
+            Participant.objects.filter(room=self.room, wpm__isnull=False).order_by("-wpm")
+            .values_list("user__username", "wpm", "accuracy", "finished_at"),
+            "participant_room_wpm",
+        )
+
+    def test_room_history(self):
+        self.assertUsesIndex(Room.objects.filter(host=self.host).order_by("-created_at"), "room_host_created")
+
+
+
+class SerializerFreeRowsTests(TestCase):
+    """The values_list() read paths must render to the bytes of the serializers they replaced."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create(email="rows@example.com", username="Zoë", password="!")
+        guest = User.objects.create(email="guest@example.com", username="guest", password="!")
+        cls.room = Room.objects.create(code="ROWS", host=cls.host, text="text")
+        Room.objects.create(code="DONE", host=cls.host, text="text", is_active=False)
+        finished = datetime(2025, 3, 10, 23, 59, 1, 123456, tzinfo=dt_timezone.utc)
+        Participant.objects.bulk_create([
+            Participant(room=cls.room, user=cls.host, wpm=72, accuracy=99.5, finished_at=finished),
+            Participant(room=cls.room, user=guest, wpm=64.25, accuracy=None, finished_at=None),
+        ])
+        Room.objects.filter(code="DONE").update(created_at=finished - timedelta(days=400))
+
+    def assertSameBytes(self, serialized, rows):
+        self.assertEqual(prerender.render(rows).body, prerender.render(serialized).body)
+
+    def test_room_leaderboard(self):
+        participants = Participant.objects.filter(room=self.room, wpm__isnull=False).order_by("-wpm", "pk")
+        data = [
+            {"username": p.user.username, "wpm": p.wpm, "accuracy": p.accuracy, "finished_at": p.finished_at}
+            for p in participants.select_related("user")
+        ]
+        for zone in ("UTC", "Asia/Kolkata", "America/Los_Angeles"):
+            with self.subTest(zone), timezone.override(zone):
+                self.assertSameBytes(LeaderboardEntrySerializer(data, many=True).data, leaderboard_entries(participants))
+
+    def test_room_history(self):
+        rooms = Room.objects.filter(host=self.host).order_by("-created_at")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {AccessToken.for_user(self.host)}"
+        for zone, chunk in (("UTC", 1000), ("America/Los_Angeles", 1)):
+            with self.subTest(zone), timezone.override(zone), \
+                    mock.patch.object(UserRenderer, "stream_chunk_size", chunk):
+                response = self.client.get(reverse("room-history"))
+                self.assertTrue(response.streaming)
+                self.assertEqual(response["Content-Type"], prerender.CONTENT_TYPE)
+                self.assertEqual(
+                    b"".join(response.streaming_content),
+                    prerender.render(RoomHistorySerializer(rooms, many=True).data).body,
+                )
+
+    def test_room_history_query_errors_fail_before_streaming(self):
+        def rows(rooms, chunk_size=None):
+            raise DatabaseError("gone away")
+            yield  # a generator like the real one, nothing runs until the first row is read
+
+        self.client.raise_request_exception = False
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {AccessToken.for_user(self.host)}"
+        with mock.patch("multiplayer.views.room_history_rows", rows), self.assertLogs("django.request", "ERROR"):
+            response = self.client.get(reverse("room-history"))
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.status_code, 500)
+
+
+@override_settings(CACHES=LOCMEM, RACE_TICK_SECONDS=0.01, RACE_COUNTDOWN_SECONDS=0, RACE_AUTH_TIMEOUT_SECONDS=0.5)
+class RaceServerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.host, cls.guest, cls.outsider = User.objects.bulk_create(
+            User(email=f"r{i}@example.com", username=f"racer{i}", password="!") for i in range(3)
+        )
+        cls.room = Room.objects.create(code="RACE0001", host=cls.host, text="the quick brown fox")
+        Participant.objects.bulk_create(Participant(room=cls.room, user=user) for user in (cls.host, cls.guest))
+
+    def setUp(self):
+        self.server = RaceServer()
+
+    async def connect(self, user, code="RACE0001", header=True):
+        token = str(AccessToken.for_user(user))
+        headers = [(b"authorization", f"Bearer {token}".encode())] if header else []
+        ws = ApplicationCommunicator(self.server, {"type": "websocket", "path": f"/ws/rooms/{code}/", "headers": headers})
+        await ws.send_input({"type": "websocket.connect"})
+        self.assertEqual((await ws.receive_output(1))["type"], "websocket.accept")
+        if not header:
+            await ws.send_input({"type": "websocket.receive", "text": json.dumps({"type": "auth", "token": token})})
+        return ws
+
+    async def send(self, ws, **frame):
+        await ws.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+
+    async def receive(self, ws, kind=None):
+        while True:
+            message = await ws.receive_output(1)
+            self.assertEqual(message["type"], "websocket.send", message)
+            frame = json.loads(message["text"])
+            if kind is None or frame["type"] == kind:
+                return frame
+
+    async def disconnect(self, *sockets):
+        for ws in sockets:
+            await ws.send_input({"type": "websocket.disconnect", "code": 1000})
+            await ws.wait(1)
+
+    async def test_race(self):
+        host = await self.connect(self.host)
+        room = await self.receive(host)
+        self.assertEqual((room["type"], room["text"], room["starts_at"]), ("room", "the quick brown fox", None))
+        guest = await self.connect(self.guest, header=False)
+        self.assertEqual([p["username"] for p in (await self.receive(guest))["players"]], ["racer0", "racer1"])
+
+        await self.send(guest, type="progress", position=3)
+        self.assertEqual((await self.receive(guest))["detail"], "The race has not started.")
+        await self.send(guest, type="start")
+        self.assertEqual((await self.receive(guest))["detail"], "Only the host can start the race.")
+
+        await self.send(host, type="start")
+        for ws in (host, guest):
+            self.assertEqual((await self.receive(ws))["type"], "countdown")
+        # several ticks from both players reach the other side batched into frames per tick
+        for position in (2, 4, 9):
+            await self.send(guest, type="progress", position=position)
+        await self.send(host, type="progress", position=100)
+        latest = {}
+        while latest.get("racer1", {}).get("position") != 9 or "racer0" not in latest:
+            latest.update((p["username"], p) for p in (await self.receive(host, "progress"))["players"])
+        self.assertEqual(latest["racer0"]["position"], len("the quick brown fox"))
+
+        await self.send(guest, type="finish", wpm=72.5, accuracy=97)
+        finished = await self.receive(host, "progress")
+        self.assertEqual(finished["players"], [
+            {"username": "racer1", "position": 19, "wpm": 72.5, "accuracy": 97.0, "finished": True}
+        ])
+        participant = await Participant.objects.aget(room=self.room, user=self.guest)
+        self.assertEqual((participant.wpm, participant.accuracy), (72.5, 97.0))
+        self.assertIsNotNone(participant.finished_at)
+
+        await self.disconnect(host, guest)
+        self.assertEqual(self.server.races, {})
+
+    async def test_rejected_connections(self):
+        for user, code, close in (
+            (self.outsider, "RACE0001", 4403),
+            (self.host, "NOPE", 4404),
+        ):
+            ws = await self.connect(user, code)
+            self.assertEqual(await ws.receive_output(1), {"type": "websocket.close", "code": close})
+
+        ws = ApplicationCommunicator(self.server, {"type": "websocket", "path": "/ws/rooms/RACE0001/", "headers": []})
+        await ws.send_input({"type": "websocket.connect"})
+        await ws.receive_output(1)
+        await ws.send_input({"type": "websocket.receive", "text": json.dumps({"type": "auth", "token": "junk"})})
+        self.assertEqual(await ws.receive_output(1), {"type": "websocket.close", "code": 4401})
+
+    async def test_slow_connection_is_closed(self):
+        with self.settings(RACE_SEND_BUFFER=2):
+            connection = Connection(send=None, user_id=self.host.pk)
+            for i in range(3):
+                connection.push(f"frame {i}")
+        self.assertEqual(connection.close_code, 1013)
+        self.assertEqual(len(connection.outbox), 0)
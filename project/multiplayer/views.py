@@ -1,3 +1,4 @@
+from itertools import chain, islice
 from .models import *
 from .serializers import *
 from rest_framework.views import APIView
@@ -5,8 +6,10 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from accounts.renderers import UserRenderer
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.core.cache import cache
+from core import cache as tagged_cache
+from core import prerender
 
 class RoomCreateView(APIView):
     permission_classes = [IsAuthenticated]
@@ -23,8 +26,15 @@ class RoomHistoryView(APIView):
 
     def get(self, request, format=None):
         rooms = Room.objects.filter(host=request.user).order_by('-created_at')
-        serializer = RoomHistorySerializer(rooms, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # unbounded, so streamed in chunks instead of rendered as one string
+        rows = room_history_rows(rooms, chunk_size=2000)
+        renderer = request.accepted_renderer
+        # the first chunk is read here, so a failing query still fails the request with a 500;
+        # a later chunk failing only cuts the streamed 200 short, nothing handles it then
+        first = list(islice(rows, renderer.stream_chunk_size))
+        return StreamingHttpResponse(
+            renderer.iter_render(chain(first, rows)), status=status.HTTP_200_OK, content_type=prerender.CONTENT_TYPE
+        )
 
 class RoomJoinView(APIView):
     permission_classes = [IsAuthenticated]
@@ -57,18 +67,13 @@ class RoomTextView(APIView):
     renderer_classes = [UserRenderer]
 
     def get(self, request, code, format=None):
-        cache_key = f"room_text:{code}"
-        cached_text = cache.get(cache_key)
-        if cached_text:
-            return Response({'text': cached_text}, status=status.HTTP_200_OK)
-
-        try:
-            room = Room.objects.get(code=code)
-        except Room.DoesNotExist:
+        # a room's text never changes, so it is also kept in the in-process tier
+        text = tagged_cache.get_or_load(
+            "room_text", code, lambda: Room.objects.filter(code=code).values_list("text", flat=True).first()
+        )
+        if text is None:
             return Response({"detail": "Room not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        cache.set(cache_key, room.text, timeout=300)
-        return Response({'text': room.text}, status=status.HTTP_200_OK)
+        return Response({'text': text}, status=status.HTTP_200_OK)
             
 class RoomResultView(APIView):
     permission_classes = [IsAuthenticated]
@@ -105,33 +110,24 @@ class RoomLeaderboardView(APIView):
     renderer_classes = [UserRenderer]
 
     def get(self, request, code, format=None):
-        cache_key = f"room_leaderboard:{code}"
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data, status=status.HTTP_200_OK)
-
-        try:
-            room = Room.objects.get(code=code)
-        except Room.DoesNotExist:
+        def compute():
+            try:
+                room = Room.objects.get(code=code)
+            except Room.DoesNotExist:
+                return None
+            participants = Participant.objects.filter(
+                room=room, wpm__isnull=False
+            ).order_by('-wpm')
+
+            data = leaderboard_entries(participants)
+            if not data:
+                return []
+            return prerender.render(data)
+
+        # public and hot, so recomputed by one request at a time
+        rendered = tagged_cache.get_or_compute("room_leaderboard", code, [tagged_cache.room_tag(code)], compute)
+        if rendered is None:
             return Response({"detail": "Room not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        participants = Participant.objects.filter(
-            room=room, wpm__isnull=False
-        ).order_by('-wpm')
-
-        if not participants.exists():
+        if not rendered:
             return Response({"detail": "No results submitted yet."}, status=status.HTTP_404_NOT_FOUND)
-
-        data = [
-            {
-                "username": p.user.username,
-                "wpm": p.wpm,
-                "accuracy": p.accuracy,
-                "finished_at": p.finished_at
-            }
-            for p in participants
-        ]
-
-        serializer = LeaderboardEntrySerializer(data, many=True)
-        cache.set(cache_key, serializer.data, timeout=120)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return prerender.respond(request, rendered)
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import TextSnippet
 
-# Register your models here.
+
+@admin.register(TextSnippet)
+class TextSnippetAdmin(admin.ModelAdmin):
+    list_display = ["index", "content"]
+    search_fields = ["content"]
+    ordering = ["index"]
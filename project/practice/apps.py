@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class PracticeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'practice'
\ No newline at end of file
+    name = 'practice'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
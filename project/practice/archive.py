@@ -0,0 +1,407 @@
+"""
+Archival of old raw practice sessions.
+
+Sessions older than SESSION_ARCHIVE_AFTER_DAYS are folded into the
+statistics tables first, then appended to one file per calendar month (UTC)
+under SESSION_ARCHIVE_DIR and deleted from the live table in chunks of
+SESSION_ARCHIVE_DELETE_ROWS. Keystroke logs travel with their sessions.
+
+A file is a sequence of append-only blocks. Each block holds the sessions
+of one archival chunk, sorted by user and time, as zlib-compressed columns
+behind a small JSON header with the block's user, id and time ranges, so
+readers skip blocks without decompressing them and never hold more than one
+block in memory.
+
+Blocks are written and fsynced before any row is deleted, and a journal
+records what a chunk is doing: a chunk interrupted while writing is cut off
+the files again, one interrupted while deleting has its deletes finished by
+the next run.
+"""
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from .models import DailyStatistics, KeystrokeLog, PracticeSession
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MKA1"
+FRAME = struct.Struct("<4sI")  # magic, header length
+JOURNAL = "journal.json"
+NO_KEYSTROKES = -1
+
+# name, dtype, delta-encoded; rows are sorted by user and time, so deltas compress well
+COLUMNS = (
+    ("id", "<i8", True),
+    ("user_id", "<i8", True),
+    ("timestamp", "<i8", True),  # microseconds since the epoch, UTC
+    ("session_date", "<i4", True),  # days since the epoch; missing from blocks written before it existed
+    ("time_taken", "<u4", False),
+    ("speed", "<f8", False),
+    ("accuracy", "<f8", False),
+    ("keystrokes", "<i4", False),  # NO_KEYSTROKES without a keystroke log
+    ("keystroke_size", "<u4", False),  # bytes of the log in keystroke_data
+)
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+EPOCH_DATE = EPOCH.date()
+
+ArchivedSession = namedtuple(
+    "ArchivedSession", "id user_id timestamp session_date time_taken speed accuracy keystrokes keystroke_data"
+)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_dir():
+    return Path(settings.SESSION_ARCHIVE_DIR)
+
+
+def partition_path(month):
+    return archive_dir() / f"sessions-{month}.arc"
+
+
+def partitions():
+    """Archived months as "YYYY-MM", oldest first."""
+    return sorted(path.stem[len("sessions-"):] for path in archive_dir().glob("sessions-*.arc"))
+
+
+def _micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def to_datetime(micros):
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+def to_date(days):
+    return EPOCH_DATE + timedelta(days=int(days))
+
+
+# writing
+
+def _encode_block(columns, keystroke_data):
+    parts, layout = [], []
+    for name, dtype, delta in COLUMNS:
+        values = np.asarray(columns[name], dtype=dtype)
+        if delta and len(values):
+            values = np.diff(values, prepend=values.dtype.type(0))
+        compressed = zlib.compress(values.tobytes(), 6)
+        parts.append(compressed)
+        layout.append([name, len(compressed)])
+    compressed = zlib.compress(keystroke_data, 6)
+    parts.append(compressed)
+    layout.append(["keystroke_data", len(compressed)])
+    body = b"".join(parts)
+
+    header = json.dumps({
+        "rows": len(columns["id"]),
+        "users": [int(columns["user_id"].min()), int(columns["user_id"].max())],
+        "ids": [int(columns["id"].min()), int(columns["id"].max())],
+        "time": [int(columns["timestamp"].min()), int(columns["timestamp"].max())],
+        "columns": layout,
+        "size": len(body),
+        "crc": zlib.crc32(body),
+    }).encode()
+    return FRAME.pack(MAGIC, len(header)) + header + body
+
+
+def _append(path, block):
+    with open(path, "ab") as f:
+        f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# reading
+
+def _headers(path):
+    """Yield (header, body offset) of every block of a partition file."""
+    with open(path, "rb") as f:
+        while True:
+            frame = f.read(FRAME.size)
+            if not frame:
+                return
+            if len(frame) < FRAME.size:
+                raise ArchiveError(f"{path.name}: truncated block at byte {f.tell() - len(frame)}")
+            magic, length = FRAME.unpack(frame)
+            if magic != MAGIC:
+                raise ArchiveError(f"{path.name}: no block at byte {f.tell() - FRAME.size}")
+            header = json.loads(f.read(length))
+            offset = f.tell()
+            yield header, offset
+            f.seek(offset + header["size"])
+
+
+def _decode_block(f, header, offset):
+    f.seek(offset)
+    body = f.read(header["size"])
+    if len(body) != header["size"] or zlib.crc32(body) != header["crc"]:
+        raise ArchiveError(f"{Path(f.name).name}: corrupt block at byte {offset}")
+    dtypes = {name: (dtype, delta) for name, dtype, delta in COLUMNS}
+    columns, position = dict.fromkeys(dtypes), 0
+    for name, size in header["columns"]:
+        raw = zlib.decompress(body[position:position + size])
+        position += size
+        if name == "keystroke_data":
+            columns[name] = raw
+            continue
+        dtype, delta = dtypes[name]
+        values = np.frombuffer(raw, dtype=dtype)
+        columns[name] = np.cumsum(values, dtype=values.dtype) if delta else values
+    return columns
+
+
+def iter_blocks(user_id=None, start=None, end=None):
+    """
+    Yield the archived sessions block by block as {column: numpy array},
+    restricted to `user_id` and to timestamps in [start, end) when given.
+    Blocks are read one at a time, so memory is bounded by the block size.
+    """
+    low = _micros(start) if start is not None else None
+    high = _micros(end) if end is not None else None
+    for month in partitions():
+        path = partition_path(month)
+        with open(path, "rb") as f:
+            for header, offset in _headers(path):
+                first_user, last_user = header["users"]
+                first_time, last_time = header["time"]
+                if user_id is not None and not first_user <= user_id <= last_user:
+                    continue
+                if (low is not None and last_time < low) or (high is not None and first_time >= high):
+                    continue
+                columns = _decode_block(f, header, offset)
+                keep = np.ones(header["rows"], dtype=bool)
+                if user_id is not None:
+                    keep &= columns["user_id"] == user_id
+                if low is not None:
+                    keep &= columns["timestamp"] >= low
+                if high is not None:
+                    keep &= columns["timestamp"] < high
+                if keep.any():
+                    yield _select(columns, keep)
+
+
+def _select(columns, keep):
+    ends = np.cumsum(columns["keystroke_size"], dtype=np.int64)
+    starts = ends - columns["keystroke_size"]
+    data = columns["keystroke_data"]
+    selected = {name: None if columns[name] is None else columns[name][keep] for name, _, _ in COLUMNS}
+    selected["keystroke_data"] = b"".join(data[s:e] for s, e in zip(starts[keep], ends[keep]))
+    return selected
+
+
+def iter_sessions(user_id=None, start=None, end=None):
+    """Stream archived sessions as ArchivedSession tuples, see iter_blocks()."""
+    for columns in iter_blocks(user_id, start, end):
+        data, position = columns["keystroke_data"], 0
+        days = columns["session_date"]
+        for i in range(len(columns["id"])):
+            size = int(columns["keystroke_size"][i])
+            keystrokes = int(columns["keystrokes"][i])
+            yield ArchivedSession(
+                int(columns["id"][i]), int(columns["user_id"][i]), to_datetime(columns["timestamp"][i]),
+                None if days is None else to_date(days[i]), int(columns["time_taken"][i]), float(columns["speed"][i]), float(columns["accuracy"][i]),
+                *((None, None) if keystrokes == NO_KEYSTROKES else (keystrokes, data[position:position + size])),
+            )
+            position += size
+
+
+# archiving
+
+@contextmanager
+def _locked():
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / ".lock", "w") as lock:
+        try:
+            # imported here, each exists on one platform only
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:  # BlockingIOError on POSIX, PermissionError on Windows
+            raise ArchiveError("Another archival run is in progress.")
+        yield
+
+
+def _write_journal(state):
+    path = archive_dir() / JOURNAL
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(state))
+    os.replace(temporary, path)
+
+
+def _delete(ids, chunk):
+    for i in range(0, len(ids), chunk):
+        batch = ids[i:i + chunk]
+        with transaction.atomic():
+            # raw deletes: the statistics already count these sessions, so the
+            # per-row signals that would invalidate them have nothing to do.
+            # Nothing reads applied sessions back to judge the statistics,
+            # the upgrade state lives on AllTimeStatistics.statistics_version
+            KeystrokeLog.objects.filter(session_id__in=batch)._raw_delete(KeystrokeLog.objects.db)
+            PracticeSession.objects.filter(pk__in=batch)._raw_delete(PracticeSession.objects.db)
+
+
+def recover():
+    """Finish or undo a chunk a previous run left half done. Returns the sessions deleted."""
+    path = archive_dir() / JOURNAL
+    if not path.exists():
+        return 0
+    state = json.loads(path.read_text())
+    deleted = 0
+    if state["state"] == "writing":
+        for month, size in state["sizes"].items():
+            partition = partition_path(month)
+            if not size:
+                partition.unlink(missing_ok=True)
+                continue
+            with open(partition, "ab") as f:
+                f.truncate(size)
+        logger.warning(f"Cut off an unfinished archive chunk in {', '.join(state['sizes'])}")
+    else:
+        ids = state["ids"]
+        live = []
+        for i in range(0, len(ids), settings.SESSION_ARCHIVE_DELETE_ROWS):
+            live += PracticeSession.objects.filter(pk__in=ids[i:i + settings.SESSION_ARCHIVE_DELETE_ROWS]) \
+                .values_list("pk", flat=True)
+        _delete(live, settings.SESSION_ARCHIVE_DELETE_ROWS)
+        deleted = len(live)
+        logger.warning(f"Finished deleting {deleted} archived session(s) of an interrupted chunk")
+    path.unlink()
+    return deleted
+
+
+def archive_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(days=settings.SESSION_ARCHIVE_AFTER_DAYS)
+
+
+def _apply_pending(before):
+    from .utils import apply_sessions
+
+    users = (
+        PracticeSession.objects.filter(timestamp__lt=before, stats_applied=False)
+        .values_list("user_id", flat=True).distinct()
+    )
+    for user_id in users.iterator():
+        apply_sessions(user_id)
+
+
+def _ensure_daily_rows(rows):
+    """Rebuild the statistics of users whose archived days have no daily row."""
+    from .utils import rebuild_user_statistics
+
+    days = {(row["user_id"], row["session_date"]) for row in rows}
+    # ranges rather than IN lists, which would hit SQLite's parameter limit on large chunks
+    present = set(
+        DailyStatistics.objects.filter(
+            user_id__gte=rows[0]["user_id"], user_id__lte=rows[-1]["user_id"],
+            date__range=(min(day for _, day in days), max(day for _, day in days)),
+        ).values_list("user_id", "date")
+    )
+    for user_id in sorted({user_id for user_id, day in days - present}):
+        logger.warning(f"User {user_id} had sessions without daily statistics, rebuilding before archival")
+        rebuild_user_statistics(user_id)
+
+
+def _read_chunk(before, after_user, limit):
+    rows = list(
+        PracticeSession.objects.filter(timestamp__lt=before, stats_applied=True, user_id__gte=after_user)
+        .order_by("user_id", "timestamp", "id")
+        .values("id", "user_id", "timestamp", "session_date", "time_taken", "speed", "accuracy")[:limit]
+    )
+    missing = [row for row in rows if row["session_date"] is None]
+    if missing:
+        # stored before session_date existed and not yet backfilled
+        users = {user.pk: user for user in User.objects.filter(pk__in={row["user_id"] for row in missing})}
+        for row in missing:
+            row["session_date"] = users[row["user_id"]].local_date(row["timestamp"])
+    logs = {}
+    ids = [row["id"] for row in rows]
+    for i in range(0, len(ids), settings.SESSION_ARCHIVE_DELETE_ROWS):
+        for session_id, keystrokes, data in KeystrokeLog.objects.filter(
+            session_id__in=ids[i:i + settings.SESSION_ARCHIVE_DELETE_ROWS]
+        ).values_list("session_id", "keystrokes", "data"):
+            logs[session_id] = (keystrokes, bytes(data))
+    return rows, logs
+
+
+def _blocks_by_month(rows, logs):
+    months = {}
+    for row in rows:
+        months.setdefault(row["timestamp"].astimezone(dt_timezone.utc).strftime("%Y-%m"), []).append(row)
+    for month, month_rows in months.items():
+        keystrokes = [logs.get(row["id"], (NO_KEYSTROKES, b"")) for row in month_rows]
+        columns = {
+            "id": np.array([row["id"] for row in month_rows], dtype=np.int64),
+            "user_id": np.array([row["user_id"] for row in month_rows], dtype=np.int64),
+            "timestamp": np.array([_micros(row["timestamp"]) for row in month_rows], dtype=np.int64),
+            "session_date": [(row["session_date"] - EPOCH_DATE).days for row in month_rows],
+            "time_taken": [row["time_taken"] for row in month_rows],
+            "speed": [row["speed"] for row in month_rows],
+            "accuracy": [row["accuracy"] for row in month_rows],
+            "keystrokes": [count for count, _ in keystrokes],
+            "keystroke_size": [len(data) for _, data in keystrokes],
+        }
+        yield month, _encode_block(columns, b"".join(data for _, data in keystrokes))
+
+
+def archive_sessions(before=None, progress=None):
+    """
+    Move sessions older than `before` (default: SESSION_ARCHIVE_AFTER_DAYS
+    ago) into the archive. Returns {"sessions": n, "keystroke_logs": n, "months": [...]}.
+    """
+    before = before or archive_cutoff()
+    chunk_rows = settings.SESSION_ARCHIVE_CHUNK_ROWS
+    delete_rows = settings.SESSION_ARCHIVE_DELETE_ROWS
+    totals = {"sessions": 0, "keystroke_logs": 0, "months": set()}
+
+    with _locked():
+        recover()
+        _apply_pending(before)
+        after_user = 0
+        while True:
+            rows, logs = _read_chunk(before, after_user, chunk_rows)
+            if not rows:
+                break
+            _ensure_daily_rows(rows)
+
+            blocks = list(_blocks_by_month(rows, logs))
+            sizes = {}
+            for month, _ in blocks:
+                path = partition_path(month)
+                sizes[month] = path.stat().st_size if path.exists() else 0
+            _write_journal({"state": "writing", "sizes": sizes})
+            for month, block in blocks:
+                _append(partition_path(month), block)
+            ids = [row["id"] for row in rows]
+            _write_journal({"state": "deleting", "ids": ids})
+            _delete(ids, delete_rows)
+            (archive_dir() / JOURNAL).unlink()
+
+            totals["sessions"] += len(rows)
+            totals["keystroke_logs"] += len(logs)
+            totals["months"].update(sizes)
+            # rows of earlier users are gone, so later chunks start at the last user seen
+            after_user = rows[-1]["user_id"]
+            if progress is not None:
+                progress(totals["sessions"])
+
+    totals["months"] = sorted(totals["months"])
+    return totals
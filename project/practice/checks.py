@@ -0,0 +1,23 @@
+from django.core.checks import Tags, Warning, register
+from django.db import DatabaseError
+
+
+@register(Tags.database)
+def legacy_statistics(app_configs, databases=None, **kwargs):
+    """Warn on migrate and `check --database` until the statistics upgrade has run."""
+    from .utils import legacy_statistics_users
+
+    if not databases:
+        return []
+    try:
+        pending = legacy_statistics_users().count()
+    except DatabaseError:
+        return []  # tables not migrated yet
+    if not pending:
+        return []
+    return [Warning(
+        f"{pending} user(s) have statistics written before the running totals existed.",
+        hint="Run `python manage.py rebuild_statistics --legacy`. Until then their leaderboard, graph and "
+             "streak figures are stale, and each is rebuilt on their next practice session.",
+        id="practice.W001",
+    )]
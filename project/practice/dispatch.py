@@ -0,0 +1,212 @@
+"""
+Coalesced dispatch of statistics updates.
+
+Recording a session only marks its user dirty. The first mark in a window
+schedules one drain task that, after STATS_COALESCE_WINDOW seconds, applies
+every pending session of every dirty user, so a burst of quick sessions
+costs a single apply_sessions() call per user. Daily rows are always
+updated before the all-time row since both happen in that one call.
+
+A drained user moves to a processing set, scored by claim time, and leaves
+it only once their sessions are applied. Failed users go back to the dirty
+set for the next drain. Claims older than STATS_CLAIM_LEASE seconds are
+taken for a crashed drain's and handed back, so drains running side by
+side never take each other's live claims.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from core.redis import backend_getter
+from .utils import apply_sessions
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "stats:dirty_users"
+PROCESSING_KEY = "stats:claimed_users"  # sorted set, user id scored by claim time
+SCHEDULED_KEY = "stats:drain_scheduled"
+METRICS_KEY = "stats:dispatch_metrics"
+METRIC_NAMES = ("requested", "coalesced", "drains_scheduled", "users_drained", "sessions_applied", "failures")
+
+
+class RedisBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def mark_dirty(self, user_id):
+        return bool(self.client.sadd(DIRTY_KEY, user_id))
+
+    def claim_dirty(self, count):
+        members = self.client.srandmember(DIRTY_KEY, count)
+        if not members:
+            return []
+        now = time.time()
+        pipe = self.client.pipeline()
+        for member in members:
+            pipe.srem(DIRTY_KEY, member)
+            pipe.zadd(PROCESSING_KEY, {member: now}, nx=True)
+        removed = pipe.execute()[::2]
+        # a member another drain took first is left to it, nx keeps that drain's claim time
+        return [int(member) for member, taken in zip(members, removed) if taken]
+
+    def done(self, user_id):
+        self.client.zrem(PROCESSING_KEY, user_id)
+
+    def requeue(self, user_ids):
+        pipe = self.client.pipeline()
+        pipe.zrem(PROCESSING_KEY, *user_ids)
+        pipe.sadd(DIRTY_KEY, *user_ids)
+        pipe.execute()
+
+    def recover(self, lease):
+        cutoff = time.time() - lease
+        stale = self.client.zrangebyscore(PROCESSING_KEY, "-inf", cutoff)
+        if not stale:
+            return 0
+        # claims made since the read score above the cutoff and stay; a stale
+        # user finished in between is only marked dirty once more
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(PROCESSING_KEY, "-inf", cutoff)
+        pipe.sadd(DIRTY_KEY, *stale)
+        pipe.execute()
+        return len(stale)
+
+    def pending(self):
+        return self.client.scard(DIRTY_KEY)
+
+    def claim_schedule(self, window):
+        # expires on its own in case the drain task is lost
+        return bool(self.client.set(SCHEDULED_KEY, 1, nx=True, ex=max(int(window) * 10, 60)))
+
+    def release_schedule(self):
+        self.client.delete(SCHEDULED_KEY)
+
+    def incr(self, name, amount=1):
+        self.client.hincrby(METRICS_KEY, name, amount)
+
+    def metrics(self):
+        raw = self.client.hgetall(METRICS_KEY)
+        return {name: int(raw.get(name.encode(), 0)) for name in METRIC_NAMES}
+
+    def clear(self):
+        self.client.delete(DIRTY_KEY, PROCESSING_KEY, SCHEDULED_KEY)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = dict.fromkeys(METRIC_NAMES, 0)
+        self.clear()
+
+    def mark_dirty(self, user_id):
+        with self._lock:
+            added = user_id not in self._dirty
+            self._dirty.add(user_id)
+            return added
+
+    def claim_dirty(self, count):
+        with self._lock:
+            claimed = [self._dirty.pop() for _ in range(min(count, len(self._dirty)))]
+            now = time.time()
+            for user_id in claimed:
+                self._processing.setdefault(user_id, now)
+            return claimed
+
+    def done(self, user_id):
+        with self._lock:
+            self._processing.pop(user_id, None)
+
+    def requeue(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._processing.pop(user_id, None)
+            self._dirty.update(user_ids)
+
+    def recover(self, lease):
+        cutoff = time.time() - lease
+        with self._lock:
+            stale = [user_id for user_id, claimed in self._processing.items() if claimed <= cutoff]
+            for user_id in stale:
+                del self._processing[user_id]
+            self._dirty.update(stale)
+            return len(stale)
+
+    def pending(self):
+        return len(self._dirty)
+
+    def claim_schedule(self, window):
+        with self._lock:
+            claimed, self._scheduled = not self._scheduled, True
+            return claimed
+
+    def release_schedule(self):
+        self._scheduled = False
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._metrics[name] += amount
+
+    def metrics(self):
+        return dict(self._metrics)
+
+    def clear(self):
+        with self._lock:
+            self._dirty = set()
+            self._processing = {}  # user id -> claim time
+            self._scheduled = False
+
+
+get_backend = backend_getter(RedisBackend, MemoryBackend())
+
+
+def schedule_statistics(user_id):
+    """Queue a statistics update for the user, folding it into any pending one."""
+    from .tasks import drain_statistics_task
+
+    backend = get_backend()
+    backend.incr("requested")
+    if not backend.mark_dirty(user_id):
+        backend.incr("coalesced")
+
+    window = settings.STATS_COALESCE_WINDOW
+    if backend.claim_schedule(window):
+        backend.incr("drains_scheduled")
+        transaction.on_commit(lambda: drain_statistics_task.apply_async(countdown=window))
+
+
+def drain(chunk_size=100):
+    """Apply pending sessions for every dirty user. Returns the number of users drained."""
+    backend = get_backend()
+    backend.release_schedule()  # marks arriving from now on schedule the next drain
+    backend.recover(settings.STATS_CLAIM_LEASE)  # users a crashed drain claimed but never applied
+
+    drained = 0
+    failed = []
+    while True:
+        user_ids = backend.claim_dirty(chunk_size)
+        if not user_ids:
+            break
+        for user_id in user_ids:
+            try:
+                backend.incr("sessions_applied", apply_sessions(user_id))
+            except Exception:
+                logger.exception(f"Statistics update failed for user {user_id}")
+                failed.append(user_id)
+            else:
+                backend.done(user_id)
+                drained += 1
+
+    backend.incr("users_drained", drained)
+    if failed:
+        # kept dirty, the next scheduled drain retries them
+        backend.incr("failures", len(failed))
+        backend.requeue(failed)
+    return drained
+
+
+def dispatch_metrics():
+    backend = get_backend()
+    return {**backend.metrics(), "pending_users": backend.pending()}
@@ -0,0 +1,79 @@
+"""
+Fixed-length feature vectors describing how hard a snippet is to type.
+
+Layout (float32, see FEATURE_NAMES):
+
+    length        characters / 1000, capped at 1
+    a..z          letter frequencies (case folded)
+    space, digit, punct, upper
+    bigrams       frequencies of the most common English bigrams
+    rare_keys     density of q z x j k v, digits and punctuation
+    difficulty    0..1 blend of rare keys, word length, punctuation and capitals
+"""
+import string
+
+import numpy as np
+
+LETTERS = string.ascii_lowercase
+BIGRAMS = (
+    "th", "he", "in", "er", "an", "re", "on", "at", "en", "nd", "ti", "es", "or", "te", "of", "ed",
+    "is", "it", "al", "ar", "st", "to", "nt", "ng", "se", "ha", "as", "ou", "io", "le", "ve", "co",
+)
+FEATURE_NAMES = (
+    ["length"] + list(LETTERS) + ["space", "digit", "punct", "upper"]
+    + [f"bigram:{b}" for b in BIGRAMS] + ["rare_keys", "difficulty"]
+)
+DIMENSIONS = len(FEATURE_NAMES)
+LETTER_OFFSET = 1
+SPACE = FEATURE_NAMES.index("space")
+BIGRAM_OFFSET = FEATURE_NAMES.index(f"bigram:{BIGRAMS[0]}")
+RARE_KEYS = FEATURE_NAMES.index("rare_keys")
+DIFFICULTY = FEATURE_NAMES.index("difficulty")
+
+_PUNCT_CODES = np.frombuffer(string.punctuation.encode(), dtype=np.uint8)
+_DIGIT_CODES = np.frombuffer(string.digits.encode(), dtype=np.uint8)
+_RARE_CODES = np.frombuffer(b"qzxjkv", dtype=np.uint8)
+_LETTER_CODES = np.frombuffer(LETTERS.encode(), dtype=np.uint8)
+_BIGRAM_IDS = np.array([ord(b[0]) * 128 + ord(b[1]) for b in BIGRAMS])
+
+
+def snippet_features(content):
+    """Return the float32 feature vector of a snippet's text."""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    raw = np.frombuffer(content.encode("ascii", "ignore"), dtype=np.uint8)
+    n = len(raw)
+    if n == 0:
+        return vector
+
+    lower = np.frombuffer(content.lower().encode("ascii", "ignore"), dtype=np.uint8)
+    counts = np.bincount(lower, minlength=128)
+    upper = np.count_nonzero((raw >= 65) & (raw <= 90))
+    punct = counts[_PUNCT_CODES].sum()
+    digits = counts[_DIGIT_CODES].sum()
+    rare = counts[_RARE_CODES].sum() + punct + digits
+
+    vector[0] = min(n / 1000, 1.0)
+    vector[LETTER_OFFSET:LETTER_OFFSET + 26] = counts[_LETTER_CODES] / n
+    vector[SPACE:SPACE + 4] = (counts[ord(" ")] / n, digits / n, punct / n, upper / n)
+    if len(lower) > 1:
+        pairs = np.bincount(lower[:-1].astype(np.int64) * 128 + lower[1:], minlength=128 * 128)
+        vector[BIGRAM_OFFSET:BIGRAM_OFFSET + len(BIGRAMS)] = pairs[_BIGRAM_IDS] / (len(lower) - 1)
+
+    words = max(counts[ord(" ")] + 1, 1)
+    avg_word_length = (n - counts[ord(" ")]) / words
+    vector[RARE_KEYS] = rare / n
+    vector[DIFFICULTY] = min(max(
+        0.35 * min(rare / n * 5, 1)
+        + 0.25 * min(max(avg_word_length - 3, 0) / 5, 1)
+        + 0.2 * min(punct / n * 10, 1)
+        + 0.2 * min(upper / n * 10, 1),
+        0.0), 1.0)
+    return vector
+
+
+def to_bytes(vector):
+    return vector.astype("<f4").tobytes()
+
+
+def from_bytes(blob):
+    return np.frombuffer(bytes(blob), dtype="<f4")
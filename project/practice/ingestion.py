@@ -0,0 +1,132 @@
+"""
+Streaming bulk ingestion of text snippets from CSV or NDJSON files.
+
+Records are read lazily and written in fixed-size batches, so memory stays
+bounded by the batch size whatever the file size. Duplicates are dropped
+by index and by content hash, within a batch in Python and against the
+table through the unique constraints and `ignore_conflicts`. After every
+committed batch a checkpoint is written so an interrupted run can resume.
+"""
+import csv
+import json
+import os
+import time
+
+from django.db import transaction
+
+from .features import snippet_features, to_bytes
+from .models import TextSnippet
+from .snippets import bump_version
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    return "ndjson" if ext in (".ndjson", ".jsonl") else "csv"
+
+
+def iter_records(path, fmt=None):
+    """Yield (index, content) pairs from a CSV (index,paragraph) or NDJSON file."""
+    fmt = fmt or detect_format(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield int(row["index"]), row["paragraph"]
+        else:
+            for line in f:
+                if line.strip():
+                    obj = json.loads(line)
+                    yield int(obj["index"]), obj.get("paragraph", obj.get("content"))
+
+
+def _read_checkpoint(checkpoint, path):
+    if not checkpoint or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("path") != os.path.abspath(path) or state.get("size") != os.path.getsize(path):
+        return 0  # checkpoint belongs to another file or the file changed
+    return state["rows"]
+
+
+def _write_checkpoint(checkpoint, path, rows):
+    tmp = f"{checkpoint}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"path": os.path.abspath(path), "size": os.path.getsize(path), "rows": rows}, f)
+    os.replace(tmp, checkpoint)
+
+
+def backfill_content_hashes(batch_size=1000):
+    """Fill content_hash on snippets stored before it existed, so content dedup covers them."""
+    filled, last_pk = 0, 0
+    while True:
+        snippets = list(
+            TextSnippet.objects.filter(content_hash__isnull=True, pk__gt=last_pk)
+            .order_by("pk").only("id", "content")[:batch_size]
+        )
+        if not snippets:
+            return filled
+        last_pk = snippets[-1].pk
+
+        hashes = [TextSnippet.hash_content(s.content) for s in snippets]
+        seen = set(TextSnippet.objects.filter(content_hash__in=hashes).values_list("content_hash", flat=True))
+        for snippet, content_hash in zip(snippets, hashes):
+            # a duplicate of an already hashed snippet keeps a NULL hash
+            snippet.content_hash = None if content_hash in seen else content_hash
+            seen.add(content_hash)
+        with transaction.atomic():
+            TextSnippet.objects.bulk_update(snippets, ["content_hash"])
+        filled += len(snippets)
+
+
+def _write_batch(batch):
+    with transaction.atomic():
+        TextSnippet.objects.bulk_create(batch.values(), batch_size=len(batch), ignore_conflicts=True)
+
+
+def ingest_snippets(path, fmt=None, batch_size=5000, checkpoint=None, progress=None):
+    """
+    Stream `path` into TextSnippet. `progress(rows, seconds)` is called after
+    every batch. Returns a dict with rows read, snippets inserted and seconds.
+    """
+    backfill_content_hashes()
+    skip = _read_checkpoint(checkpoint, path)
+    before = TextSnippet.objects.count()
+    started = time.monotonic()
+
+    rows = reported = 0
+    batch, hashes = {}, set()
+    for index, content in iter_records(path, fmt):
+        rows += 1
+        if rows <= skip:
+            continue
+
+        content_hash = TextSnippet.hash_content(content)
+        if index not in batch and content_hash not in hashes:
+            batch[index] = TextSnippet(
+                index=index, content=content, content_hash=content_hash,
+                features=to_bytes(snippet_features(content)),
+            )
+            hashes.add(content_hash)
+
+        if len(batch) >= batch_size:
+            _write_batch(batch)
+            batch, hashes = {}, set()
+            if checkpoint:
+                _write_checkpoint(checkpoint, path, rows)
+            if progress:
+                progress(rows, time.monotonic() - started)
+                reported = rows
+
+    if batch:
+        _write_batch(batch)
+    if progress and rows != reported:
+        progress(rows, time.monotonic() - started)
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    inserted = TextSnippet.objects.count() - before
+    if inserted:
+        bump_version()
+    return {"rows": rows, "skipped": skip, "inserted": inserted, "seconds": time.monotonic() - started}
@@ -0,0 +1,137 @@
+"""
+Compact keystroke timelines and per-key / per-bigram latency analytics.
+
+A session's timeline is stored as one blob rather than a row per keystroke:
+
+    header   version (u8), keystroke count (u32)
+    deltas   ms since the previous keystroke, u16 clipped at 65535
+    codes    BMP code point of each key, u16
+    errors   one bit per keystroke (np.packbits)
+
+zlib-compressed, that is at most ~4.1 bytes per keystroke before
+compression. Decoding and analysis are vectorized NumPy operations.
+"""
+import struct
+import zlib
+
+import numpy as np
+from django.db import transaction
+
+from .models import KeystrokeLog, KeystrokeProfile
+
+VERSION = 1
+HEADER = struct.Struct("<BI")
+MAX_DELTA = np.iinfo(np.uint16).max
+REPLACEMENT_CODE = 0xFFFD  # for keys outside the Basic Multilingual Plane
+
+
+def encode(keys, timestamps, errors=()):
+    """
+    Pack a timeline. `keys` is the typed text, `timestamps` the ms offset of
+    each keystroke from the start and `errors` the positions mistyped.
+    """
+    n = len(keys)
+    codes = np.fromiter((ord(c) for c in keys), dtype=np.uint32, count=n)
+    codes[codes > 0xFFFF] = REPLACEMENT_CODE
+    deltas = np.diff(np.asarray(timestamps, dtype=np.int64), prepend=0)
+    error_bits = np.zeros(n, dtype=bool)
+    error_bits[np.asarray(errors, dtype=np.int64)] = True
+
+    payload = b"".join([
+        HEADER.pack(VERSION, n),
+        np.clip(deltas, 0, MAX_DELTA).astype("<u2").tobytes(),
+        codes.astype("<u2").tobytes(),
+        np.packbits(error_bits).tobytes(),
+    ])
+    return zlib.compress(payload)
+
+
+def decode(blob):
+    """Unpack a timeline into (codes, deltas, errors) NumPy arrays."""
+    payload = zlib.decompress(bytes(blob))
+    version, n = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported keystroke blob version {version}")
+
+    offset = HEADER.size
+    deltas = np.frombuffer(payload, dtype="<u2", count=n, offset=offset)
+    codes = np.frombuffer(payload, dtype="<u2", count=n, offset=offset + 2 * n)
+    error_bytes = np.frombuffer(payload, dtype=np.uint8, offset=offset + 4 * n)
+    errors = np.unpackbits(error_bytes, count=n).astype(bool)
+    return codes, deltas, errors
+
+
+def _group(ids, latencies, errors):
+    """Sum presses, latency and errors per id."""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    size = len(unique)
+    presses = np.bincount(inverse, minlength=size)
+    error_counts = np.bincount(inverse, weights=errors, minlength=size)
+    latency_sum = np.bincount(inverse, weights=latencies, minlength=size)
+    return unique, presses, latency_sum, error_counts
+
+
+def _as_dict(stats, name_of):
+    unique, presses, latency_sum, error_counts = (a.tolist() for a in stats)
+    return {
+        name_of(code): [p, l, int(e)]
+        for code, p, l, e in zip(unique, presses, latency_sum, error_counts)
+    }
+
+
+def analyze(codes, deltas, errors):
+    """
+    Return {"keys": {char: [presses, latency_sum_ms, errors]}, "bigrams": {...}}
+    where a bigram's latency is the time to type its second key.
+    """
+    result = {"keys": {}, "bigrams": {}}
+    if len(codes) < 2:
+        return result
+
+    codes = codes.astype(np.uint32)
+    # latency of a key is the time since the previous keystroke, so skip the first
+    key_stats = _group(codes[1:], deltas[1:].astype(np.float64), errors[1:])
+    bigram_ids = (codes[:-1] << 16) | codes[1:]
+    bigram_stats = _group(bigram_ids, deltas[1:].astype(np.float64), errors[1:])
+
+    result["keys"] = _as_dict(key_stats, chr)
+    result["bigrams"] = _as_dict(bigram_stats, lambda code: chr(code >> 16) + chr(code & 0xFFFF))
+    return result
+
+
+def _merge(totals, stats):
+    for name, (presses, latency_sum, errors) in stats.items():
+        current = totals.setdefault(name, [0, 0.0, 0])
+        current[0] += presses
+        current[1] += latency_sum
+        current[2] += errors
+
+
+def record_keystrokes(session, keys, timestamps, errors=()):
+    """Store a session's timeline and fold its analysis into the user's profile."""
+    blob = encode(keys, timestamps, errors)
+    stats = analyze(*decode(blob))
+
+    with transaction.atomic():
+        log = KeystrokeLog.objects.create(session=session, keystrokes=len(keys), data=blob)
+        profile, _ = KeystrokeProfile.objects.select_for_update().get_or_create(user_id=session.user_id)
+        _merge(profile.keys, stats["keys"])
+        _merge(profile.bigrams, stats["bigrams"])
+        profile.sessions += 1
+        profile.save()
+    return log, stats
+
+
+def heatmap(stats, limit=None):
+    """Turn summed [presses, latency_sum, errors] stats into sorted heatmap rows, slowest first."""
+    rows = [
+        {
+            "key": name,
+            "presses": presses,
+            "avg_latency": round(latency_sum / presses, 2),
+            "error_rate": round(errors / presses * 100, 2),
+        }
+        for name, (presses, latency_sum, errors) in stats.items()
+    ]
+    rows.sort(key=lambda row: row["avg_latency"], reverse=True)
+    return rows[:limit] if limit else rows
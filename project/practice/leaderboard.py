@@ -0,0 +1,416 @@
+"""
+Sorted-set leaderboards over the all-time and current period statistics.
+
+Each metric lives in a Redis sorted set (user id -> score) so rank, top-N
+and "around me" windows are O(log N) instead of scanning AllTimeStatistics.
+Day, week and month windows get one sorted set per period, fed from the
+rollup tables as sessions are applied and expiring shortly after the
+period ends. Rollup rows are keyed by the user's local date, so a period's
+set holds everyone's statistics of that calendar period in their own
+timezone, and readers pick the period of their own local date (the server
+date when anonymous). When the cache is not Redis backed an in-process
+backend with the same interface is used instead.
+
+A board missing on read is built by one reader under a short lock while the
+others wait for it, and scores pushed while it is built are merged into it.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, time as dt_time, timedelta
+
+from django.utils import timezone
+
+from core.redis import backend_getter
+from .models import AllTimeStatistics, DailyStatistics, WeeklyStatistics, MonthlyStatistics
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("top_speed", "avg_speed")
+BUILT_KEY = "leaderboard:built"
+BUILD_LOCK_SECONDS = 30  # longest a reader builds a missing board before others build it again
+BUILD_POLL_SECONDS = 0.05
+
+# window -> (statistics model, period date field)
+WINDOWS = {
+    "day": (DailyStatistics, "date"),
+    "week": (WeeklyStatistics, "period_start"),
+    "month": (MonthlyStatistics, "period_start"),
+}
+# keep a finished period around for late readers; a day also lasts until the
+# server's next day in the timezones furthest behind it
+EXPIRY_GRACE = timedelta(days=1)
+
+
+def current_period(window, day=None):
+    """Return (start, end) dates of the window's period containing `day` (default the server's today)."""
+    from .utils import week_start, month_start
+
+    day = day or timezone.localdate()
+    if window == "day":
+        return day, day + timedelta(days=1)
+    if window == "week":
+        start = week_start(day)
+        return start, start + timedelta(days=7)
+    start = month_start(day)
+    return start, month_start(start + timedelta(days=32))
+
+
+def _key(metric, window=None, period=None):
+    if window is None:
+        return f"leaderboard:{metric}:ranking"
+    return f"leaderboard:{metric}:{window}:{period.isoformat()}"
+
+
+def _built_key(window=None, period=None):
+    return BUILT_KEY if window is None else f"{BUILT_KEY}:{window}:{period.isoformat()}"
+
+
+def _expires_at(end):
+    """Unix time at which a period ending on `end` may be dropped."""
+    return int(timezone.make_aware(datetime.combine(end + EXPIRY_GRACE, dt_time.min)).timestamp())
+
+
+class RedisBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def set(self, key, member, score, expire_at=None):
+        if expire_at is None:
+            self.client.zadd(key, {member: score})
+        else:
+            pipe = self.client.pipeline()
+            pipe.zadd(key, {member: score})
+            pipe.expireat(key, expire_at)
+            pipe.execute()
+
+    def remove(self, key, member):
+        self.client.zrem(key, member)
+
+    def rank(self, key, member):
+        return self.client.zrevrank(key, member)
+
+    def count(self, key):
+        return self.client.zcard(key)
+
+    def range(self, key, start, stop):
+        return [(int(m), s) for m, s in self.client.zrevrange(key, start, stop, withscores=True)]
+
+    def replace(self, key, items, chunk_size=1000, expire_at=None, merge=False):
+        tmp_key = f"{key}:rebuild"
+        self.client.delete(tmp_key)
+        chunk = {}
+        for member, score in items:
+            chunk[member] = score
+            if len(chunk) >= chunk_size:
+                self.client.zadd(tmp_key, chunk)
+                chunk = {}
+        if chunk:
+            self.client.zadd(tmp_key, chunk)
+        if merge:
+            # scores pushed to the key meanwhile are newer than the rows read, the higher one is kept
+            pipe = self.client.pipeline()
+            pipe.zunionstore(key, [tmp_key, key], aggregate="MAX")
+            pipe.delete(tmp_key)
+            if expire_at is not None:
+                pipe.expireat(key, expire_at)
+            pipe.execute()
+        elif self.client.exists(tmp_key):
+            if expire_at is not None:
+                self.client.expireat(tmp_key, expire_at)  # carried over by the rename
+            self.client.rename(tmp_key, key)  # atomic swap, readers never see a partial set
+        else:
+            self.client.delete(key)
+
+    def is_built(self, marker=BUILT_KEY):
+        return bool(self.client.exists(marker))
+
+    def mark_built(self, marker=BUILT_KEY, expire_at=None):
+        self.client.set(marker, 1, exat=expire_at)
+
+    def lock(self, marker, timeout):
+        return bool(self.client.set(f"{marker}:lock", 1, nx=True, ex=timeout))
+
+    def unlock(self, marker):
+        self.client.delete(f"{marker}:lock")
+
+    def is_locked(self, marker):
+        return bool(self.client.exists(f"{marker}:lock"))
+
+
+class _Descending(str):
+    """Tie order of a member: Redis ranks equal scores by member bytes, descending in ZREVRANGE."""
+
+    def __lt__(self, other):
+        return str.__gt__(self, other)
+
+    def __gt__(self, other):
+        return str.__lt__(self, other)
+
+    def __le__(self, other):
+        return str.__ge__(self, other)
+
+    def __ge__(self, other):
+        return str.__le__(self, other)
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._scores = {}   # key -> {member: score}
+        self._order = {}    # key -> sorted [(-score, tie order, member)], best first
+        self._expires = {}  # key or built marker -> unix time
+        self._built = set()
+        self._locks = {}    # built marker -> unix time the lock lapses
+
+    def _expire(self, key):
+        expire_at = self._expires.get(key)
+        if expire_at is not None and expire_at <= time.time():
+            self._scores.pop(key, None)
+            self._order.pop(key, None)
+            self._built.discard(key)
+            del self._expires[key]
+
+    def set(self, key, member, score, expire_at=None):
+        with self._lock:
+            self._expire(key)
+            self._discard(key, member)
+            self._scores.setdefault(key, {})[member] = score
+            insort(self._order.setdefault(key, []), (-score, _Descending(member), member))
+            if expire_at is not None:
+                self._expires[key] = expire_at
+
+    def remove(self, key, member):
+        with self._lock:
+            self._expire(key)
+            self._discard(key, member)
+
+    def _discard(self, key, member):
+        old = self._scores.get(key, {}).pop(member, None)
+        if old is not None:
+            order = self._order[key]
+            del order[bisect_left(order, (-old, _Descending(member), member))]
+
+    def rank(self, key, member):
+        with self._lock:
+            self._expire(key)
+            score = self._scores.get(key, {}).get(member)
+            if score is None:
+                return None
+            return bisect_left(self._order[key], (-score, _Descending(member), member))
+
+    def count(self, key):
+        with self._lock:
+            self._expire(key)
+            return len(self._scores.get(key, {}))
+
+    def range(self, key, start, stop):
+        with self._lock:
+            self._expire(key)
+            # inclusive stop, -1 is the last member as in ZREVRANGE
+            return [(m, -s) for s, _, m in self._order.get(key, [])[start:stop + 1 or None]]
+
+    def replace(self, key, items, chunk_size=None, expire_at=None, merge=False):
+        scores = dict(items)
+        with self._lock:
+            if merge:
+                self._expire(key)
+                for member, score in self._scores.get(key, {}).items():
+                    scores[member] = max(score, scores.get(member, score))
+            self._scores[key] = scores
+            self._order[key] = sorted((-s, _Descending(m), m) for m, s in scores.items())
+            self._expires.pop(key, None)
+            if expire_at is not None:
+                self._expires[key] = expire_at
+
+    def is_built(self, marker=BUILT_KEY):
+        with self._lock:
+            self._expire(marker)
+            return marker in self._built
+
+    def mark_built(self, marker=BUILT_KEY, expire_at=None):
+        with self._lock:
+            self._built.add(marker)
+            if expire_at is not None:
+                self._expires[marker] = expire_at
+
+    def lock(self, marker, timeout):
+        with self._lock:
+            if self._locks.get(marker, 0) > time.time():
+                return False
+            self._locks[marker] = time.time() + timeout
+            return True
+
+    def unlock(self, marker):
+        with self._lock:
+            self._locks.pop(marker, None)
+
+    def is_locked(self, marker):
+        with self._lock:
+            return self._locks.get(marker, 0) > time.time()
+
+
+get_backend = backend_getter(RedisBackend, MemoryBackend())
+
+
+def rebuild(merge=False):
+    """
+    Reload every all-time leaderboard from AllTimeStatistics. With `merge`
+    scores pushed while it runs are kept where higher, instead of replaced.
+    """
+    backend = get_backend()
+    for metric in METRICS:
+        rows = (
+            AllTimeStatistics.objects.filter(**{f"{metric}__gt": 0})
+            .values_list("user_id", metric)
+            .iterator(chunk_size=2000)
+        )
+        backend.replace(_key(metric), rows, merge=merge)
+    backend.mark_built()
+    return backend
+
+
+def rebuild_window(window, day=None, merge=False):
+    """Reload the leaderboards of the window's period containing `day` from its rollup table, see rebuild()."""
+    model, date_field = WINDOWS[window]
+    start, end = current_period(window, day)
+    expire_at = _expires_at(end)
+    backend = get_backend()
+    for metric in METRICS:
+        rows = (
+            model.objects.filter(**{date_field: start, f"{metric}__gt": 0})
+            .values_list("user_id", metric)
+            .iterator(chunk_size=2000)
+        )
+        backend.replace(_key(metric, window, start), rows, expire_at=expire_at, merge=merge)
+    backend.mark_built(_built_key(window, start), expire_at)
+    return backend
+
+
+def _built_backend(window=None, day=None):
+    """Return the backend and the period start of the window, building it first if needed."""
+    backend = get_backend()
+    period = current_period(window, day)[0] if window else None
+    marker = _built_key(window, period)
+    if backend.is_built(marker):
+        return backend, period
+    if backend.lock(marker, BUILD_LOCK_SECONDS):
+        try:
+            # pushes go on while the rows are read, so they are merged rather than replaced
+            if window is None:
+                rebuild(merge=True)
+            else:
+                rebuild_window(window, day, merge=True)
+        finally:
+            backend.unlock(marker)
+    else:
+        # another reader is building it; past the lock's lifetime whatever is there is read
+        deadline = time.monotonic() + BUILD_LOCK_SECONDS
+        while not backend.is_built(marker) and time.monotonic() < deadline:
+            time.sleep(BUILD_POLL_SECONDS)
+    return backend, period
+
+
+def _push(backend, key, user_id, scores, expire_at=None):
+    for metric, score in scores.items():
+        if score and score > 0:
+            backend.set(key(metric), user_id, score, expire_at)
+        else:
+            backend.remove(key(metric), user_id)
+
+
+def update_user(user_id, **scores):
+    """
+    Push a user's new all-time scores, e.g. update_user(1, top_speed=92.0, avg_speed=71.5).
+    Users with a zero score are not ranked, same as the old `__gt=0` filter.
+    """
+    _push(get_backend(), _key, user_id, scores)
+
+
+def update_window(user_id, window, day=None, **scores):
+    """Push a user's scores for the window's period containing `day`."""
+    backend = get_backend()
+    start, end = current_period(window, day)
+    marker = _built_key(window, start)
+    if not backend.is_built(marker) and not backend.is_locked(marker):
+        return  # the first read of the period loads it from the rollup table
+    _push(backend, lambda metric: _key(metric, window, start), user_id, scores, _expires_at(end))
+
+
+def remove_user(user_id):
+    backend = get_backend()
+    today = timezone.localdate()
+    for metric in METRICS:
+        backend.remove(_key(metric), user_id)
+        for window in WINDOWS:
+            # every timezone's today is within a day of the server's
+            for day in (today - timedelta(days=1), today, today + timedelta(days=1)):
+                backend.remove(_key(metric, window, current_period(window, day)[0]), user_id)
+
+
+def sync_user(user_id, days=None):
+    """
+    Push the user's stored all-time scores and their scores for the periods
+    containing `days`, local dates (default the user's today), logging
+    instead of failing the caller.
+    """
+    from accounts.models import User
+
+    scores = AllTimeStatistics.objects.filter(user_id=user_id).values(*METRICS).first()
+    try:
+        if scores is None:
+            remove_user(user_id)
+            return
+        update_user(user_id, **scores)
+        if days is None:
+            days = [User.objects.get(pk=user_id).local_date()]
+        for window, (model, date_field) in WINDOWS.items():
+            for start in sorted({current_period(window, day)[0] for day in days}):
+                period_scores = model.objects.filter(
+                    user_id=user_id, **{date_field: start}
+                ).values(*METRICS).first()
+                update_window(user_id, window, start, **(period_scores or dict.fromkeys(METRICS, 0)))
+    except Exception as e:
+        logger.warning(f"Leaderboard update failed for user {user_id}: {e}")
+
+
+def rank(user_id, metric, window=None, day=None):
+    """Return (1-based position, ranked users) or None when the user is not ranked."""
+    backend, period = _built_backend(window, day)
+    key = _key(metric, window, period)
+    position = backend.rank(key, user_id)
+    if position is None:
+        return None
+    return position + 1, backend.count(key)
+
+
+def count(metric, window=None, day=None):
+    period = current_period(window, day)[0] if window else None
+    return get_backend().count(_key(metric, window, period))
+
+
+def percentile(position, total):
+    return round((total - position) / total * 100, 2)
+
+
+def top(metric, limit=10, window=None, day=None):
+    """Return [(position, user_id, score)] for the best `limit` users."""
+    backend, period = _built_backend(window, day)
+    entries = backend.range(_key(metric, window, period), 0, limit - 1)
+    return [(i + 1, user_id, score) for i, (user_id, score) in enumerate(entries)]
+
+
+def around(user_id, metric, radius=5, window=None, day=None):
+    """Return [(position, user_id, score)] for the users ranked within `radius` of the user."""
+    backend, period = _built_backend(window, day)
+    key = _key(metric, window, period)
+    position = backend.rank(key, user_id)
+    if position is None:
+        return []
+    start = max(position - radius, 0)
+    entries = backend.range(key, start, position + radius)
+    return [(start + i + 1, member, score) for i, (member, score) in enumerate(entries)]
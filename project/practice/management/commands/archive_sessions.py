@@ -0,0 +1,39 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from practice.archive import ArchiveError, archive_cutoff, archive_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold old practice sessions into the statistics, append them to the monthly archive files "
+        "and delete them from the live table in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before", help="Archive sessions before this date (YYYY-MM-DD, default: SESSION_ARCHIVE_AFTER_DAYS ago).",
+        )
+
+    def handle(self, *args, **options):
+        before = archive_cutoff()
+        if options["before"]:
+            try:
+                day = datetime.strptime(options["before"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--before uses YYYY-MM-DD.")
+            before = timezone.make_aware(datetime.combine(day, time.min))
+            if before > archive_cutoff():
+                raise CommandError("--before must not be later than SESSION_ARCHIVE_AFTER_DAYS ago.")
+
+        try:
+            result = archive_sessions(before, progress=lambda n: self.stdout.write(f"{n} sessions archived"))
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        months = ", ".join(result["months"]) or "none"
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result['sessions']} sessions and {result['keystroke_logs']} keystroke logs "
+            f"before {before:%Y-%m-%d %H:%M} (months: {months})."
+        ))
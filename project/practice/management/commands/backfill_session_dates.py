@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from practice.utils import backfill_session_dates
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill session_date, the day of a session in its user's timezone, on sessions stored "
+        "before the column existed. Runs in chunks and can be interrupted and rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Sessions updated per transaction.")
+        parser.add_argument("--user", type=int, help="Only this user id.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        filled = backfill_session_dates(
+            options["user"], options["chunk_size"], progress=lambda n: self.stdout.write(f"{n} sessions filled"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Backfilled session_date on {filled} sessions."))
@@ -0,0 +1,124 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from multiplayer.models import Participant, Room
+from multiplayer.serializers import (
+    LeaderboardEntrySerializer, RoomHistorySerializer, leaderboard_entries, room_history_rows,
+)
+from practice.models import DailyStatistics
+from practice.serializers import GraphDataSerializer, graph_points
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the serializer-free read paths of the graph, room leaderboard and room history "
+        "endpoints against the serializers they replaced. Test rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated row counts.")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers.")
+        if not sizes or min(sizes) < 1 or options["repeat"] < 1:
+            raise CommandError("--sizes and --repeat must be positive.")
+
+        try:
+            with transaction.atomic():
+                users, host, room = self.populate(max(sizes))
+                for size in sizes:
+                    self.stdout.write(f"{size} rows:")
+                    self.compare("graph", size, options["repeat"], *self.graph_paths(host, size))
+                    self.compare("room leaderboard", size, options["repeat"],
+                                 *self.leaderboard_paths(room, users[size - 1]))
+                    self.compare("room history", size, options["repeat"], *self.history_paths(host, size))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, size):
+        self.stdout.write(f"Creating {size} benchmark rows per table...")
+        stamp = time.monotonic_ns()
+        users = User.objects.bulk_create(
+            User(email=f"bench{stamp}-{i}@example.com", username=f"bench{stamp}-{i}", password="!")
+            for i in range(size)
+        )
+        users.sort(key=lambda user: user.pk)
+        host = users[0]
+        start = date(1700, 1, 1)
+        DailyStatistics.objects.bulk_create(
+            (DailyStatistics(user=host, date=start + timedelta(days=i), avg_speed=40 + i % 80,
+                             avg_accuracy=90 + i % 10 / 3) for i in range(size)),
+            batch_size=5000,
+        )
+        now = timezone.now()
+        room = Room.objects.create(code="!bench!", host=host, text="bench")
+        Room.objects.bulk_create(
+            (Room(code=f"~{i:07d}", host=host, text="bench") for i in range(size)), batch_size=5000,
+        )
+        Participant.objects.bulk_create(
+            (Participant(room=room, user=user, wpm=30 + i % 90, accuracy=85 + i % 15,
+                         finished_at=now - timedelta(seconds=i)) for i, user in enumerate(users)),
+            batch_size=5000,
+        )
+        return users, host, room
+
+    def graph_paths(self, user, size):
+        rows = DailyStatistics.objects.filter(user=user).order_by("date")[:size].values_list(
+            "date", "avg_speed", "avg_accuracy")
+
+        def previous():
+            data = [{"date": day, "wpm": wpm, "accuracy": accuracy} for day, wpm, accuracy in rows.all()]
+            return GraphDataSerializer(data, many=True).data
+
+        return previous, lambda: graph_points(rows.all())
+
+    def leaderboard_paths(self, room, last_user):
+        participants = Participant.objects.filter(
+            room=room, wpm__isnull=False, user_id__lte=last_user.pk
+        ).order_by("-wpm", "pk")
+
+        def previous():
+            data = [
+                {"username": p.user.username, "wpm": p.wpm, "accuracy": p.accuracy, "finished_at": p.finished_at}
+                for p in participants.select_related("user")
+            ]
+            return LeaderboardEntrySerializer(data, many=True).data
+
+        return previous, lambda: leaderboard_entries(participants)
+
+    def history_paths(self, host, size):
+        rooms = Room.objects.filter(host=host, code__startswith="~").order_by("-code")[:size]
+        return (
+            lambda: RoomHistorySerializer(rooms.all(), many=True).data,
+            lambda: list(room_history_rows(rooms)),
+        )
+
+    def compare(self, name, size, repeat, previous, fast):
+        def per_row(fn):
+            best = min(self.timed(fn) for _ in range(repeat))
+            return best / size * 1e6
+
+        old_us, new_us = per_row(previous), per_row(fast)
+        self.stdout.write(
+            f"  {name}: {old_us:.2f} -> {new_us:.2f} us/row ({old_us / new_us:.1f}x)"
+        )
+
+    @staticmethod
+    def timed(fn):
+        started = time.perf_counter()
+        fn()
+        return time.perf_counter() - started
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from core.cache import family_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit and miss counts of the tagged and two-tier caches per key family."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Clear the counters after printing them.")
+
+    def handle(self, *args, **options):
+        totals = family_stats.totals()
+        if not totals:
+            self.stdout.write("No cache lookups recorded yet.")
+        for family, counts in sorted(totals.items()):
+            line = (
+                f"{family}: {counts['hits']} hit(s), {counts['misses']} miss(es), "
+                f"{counts['hit_ratio'] * 100:.1f}% hit ratio"
+            )
+            if "local_hits" in counts or "remote_hits" in counts:
+                line += f" (local {counts.get('local_hits', 0)}, redis {counts.get('remote_hits', 0)})"
+            self.stdout.write(line)
+        if options["reset"]:
+            family_stats.reset()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
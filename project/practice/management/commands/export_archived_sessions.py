@@ -0,0 +1,53 @@
+import csv
+import sys
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from practice.archive import ArchiveError, iter_sessions
+
+FIELDS = ("id", "user_id", "timestamp", "session_date", "time_taken", "speed", "accuracy", "keystrokes")
+
+
+class Command(BaseCommand):
+    help = "Stream archived practice sessions as CSV, optionally for one user and a date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only this user id.")
+        parser.add_argument("--from", dest="start", help="First day to export (YYYY-MM-DD).")
+        parser.add_argument("--to", dest="end", help="Last day to export (YYYY-MM-DD).")
+        parser.add_argument("--output", help="CSV file to write (default: stdout).")
+
+    def day(self, value, option):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"{option} uses YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        start = end = None
+        if options["start"]:
+            start = timezone.make_aware(datetime.combine(self.day(options["start"], "--from"), time.min))
+        if options["end"]:
+            end = timezone.make_aware(datetime.combine(self.day(options["end"], "--to") + timedelta(days=1), time.min))
+
+        out = open(options["output"], "w", newline="") if options["output"] else sys.stdout
+        try:
+            writer = csv.writer(out)
+            writer.writerow(FIELDS)
+            exported = 0
+            for session in iter_sessions(options["user"], start, end):
+                writer.writerow([
+                    session.id, session.user_id, session.timestamp.isoformat(), session.session_date or "",
+                    session.time_taken,
+                    session.speed, session.accuracy, "" if session.keystrokes is None else session.keystrokes,
+                ])
+                exported += 1
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"{exported} archived sessions written to {options['output']}."))
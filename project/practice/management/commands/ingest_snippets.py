@@ -0,0 +1,42 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from practice.ingestion import FORMATS, ingest_snippets
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV (index,paragraph) or NDJSON corpus into TextSnippet in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file to ingest.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--checkpoint",
+            help="Checkpoint file used to resume an interrupted run (default: <path>.checkpoint).",
+        )
+        parser.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+        if options["no_resume"] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        def progress(rows, seconds):
+            rate = rows / seconds if seconds else 0
+            self.stdout.write(f"{rows} rows read ({rate:,.0f} rows/sec)")
+
+        result = ingest_snippets(
+            path, fmt=options["format"], batch_size=options["batch_size"],
+            checkpoint=checkpoint, progress=progress,
+        )
+        if result["skipped"]:
+            self.stdout.write(f"Resumed after {result['skipped']} rows from {checkpoint}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['inserted']} new snippets from {result['rows']} rows in {result['seconds']:.1f}s."
+        ))
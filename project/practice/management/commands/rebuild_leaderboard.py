@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from practice import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Reload the top_speed and avg_speed leaderboards from AllTimeStatistics and the current day, week and month rollups."
+
+    def handle(self, *args, **options):
+        leaderboard.rebuild()
+        for window in leaderboard.WINDOWS:
+            leaderboard.rebuild_window(window)
+
+        for metric in leaderboard.METRICS:
+            self.stdout.write(f"{metric}: {leaderboard.count(metric)} ranked user(s)")
+            for window in leaderboard.WINDOWS:
+                self.stdout.write(f"{metric} ({window}): {leaderboard.count(metric, window)} ranked user(s)")
+        self.stdout.write(self.style.SUCCESS("Leaderboards rebuilt."))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from accounts.models import User
+from practice import leaderboard
+from practice.utils import legacy_statistics_users, rebuild_user_statistics
+
+
+class Command(BaseCommand):
+    help = "Recompute daily, all-time and streak statistics from raw practice sessions, live and archived."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", dest="users",
+            help="Only rebuild this user id (can be repeated).",
+        )
+        parser.add_argument(
+            "--legacy", action="store_true",
+            help="Only rebuild users whose statistics predate the running totals (the upgrade step).",
+        )
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Report drift between the running totals and the raw sessions without writing.",
+        )
+
+    def handle(self, *args, **options):
+        users = legacy_statistics_users() if options["legacy"] else User.objects.all()
+        if options["users"]:
+            users = users.filter(pk__in=options["users"])
+        user_ids = users.order_by("id").values_list("id", flat=True)
+        # rebuilding a legacy user takes it out of the queryset, so that one is read upfront
+        user_ids = list(user_ids) if options["legacy"] else user_ids.iterator()
+        commit = not options["check"]
+
+        checked = drifted_users = drifted_rows = 0
+        for user_id in user_ids:
+            checked += 1
+            drifted = rebuild_user_statistics(user_id, commit=commit)
+            if drifted:
+                drifted_users += 1
+                drifted_rows += len(drifted)
+                days = ", ".join("all-time" if day is None else str(day) for day in drifted)
+                self.stdout.write(f"user {user_id}: {len(drifted)} drifted row(s) [{days}]")
+
+        if commit:
+            leaderboard.rebuild()
+            for window in leaderboard.WINDOWS:
+                leaderboard.rebuild_window(window)
+
+        action = "checked" if options["check"] else "rebuilt"
+        self.stdout.write(self.style.SUCCESS(
+            f"{checked} user(s) {action}, {drifted_users} with drift ({drifted_rows} row(s))."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from practice.dispatch import dispatch_metrics
+
+
+class Command(BaseCommand):
+    help = "Show coalesced statistics dispatch counters and the number of users waiting for a drain."
+
+    def handle(self, *args, **options):
+        metrics = dispatch_metrics()
+        for name, value in metrics.items():
+            self.stdout.write(f"{name}: {value}")
+        if metrics["requested"]:
+            ratio = metrics["coalesced"] / metrics["requested"] * 100
+            self.stdout.write(self.style.SUCCESS(f"{ratio:.1f}% of update requests were coalesced."))
@@ -1,31 +1,102 @@
+import hashlib
 from django.db import models
+from django.utils import timezone
 from accounts.models import User
+from .features import snippet_features, to_bytes
 
 class TextSnippet(models.Model):
     index   = models.PositiveIntegerField(unique=True)
     content = models.TextField()
+    content_hash = models.CharField(max_length=40, unique=True, null=True, editable=False)
+    features = models.BinaryField(null=True, editable=False)  # float32 vector, see practice.features
 
     def __str__(self):
         return f"Snippet #{self.index}"
+
+    @staticmethod
+    def hash_content(content):
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.hash_content(self.content)
+        self.features = to_bytes(snippet_features(self.content))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "content" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "content_hash", "features"}
+        super().save(*args, **kwargs)
     
 # Create your models here.
 class PracticeSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="practice_sessions")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+    # the day of `timestamp` in the user's timezone, fixed at insert; NULL only on rows from
+    # before the column existed, until backfill_session_dates has run
+    session_date = models.DateField(null=True)
 
     time_taken = models.PositiveIntegerField()  # in ms or s
     speed = models.FloatField()  
     accuracy = models.FloatField()  
+    stats_applied = models.BooleanField(default=False)  # folded into the running statistics
 
     # text_length = models.PositiveIntegerField()  # total characters in the test
     # errors = models.PositiveIntegerField(default=0)  # total mistakes
 
+    class Meta:
+        indexes = [
+            # the statistics drain looks up a user's not yet applied sessions
+            models.Index(fields=['user'], condition=models.Q(stats_applied=False), name='practice_session_pending'),
+            # a user's sessions in time order, e.g. the archive's chunks
+            models.Index(fields=['user', 'timestamp'], name='practice_session_user_time'),
+            # a user's sessions of a calendar day
+            models.Index(fields=['user', 'session_date'], name='practice_session_user_date'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} session at {self.timestamp}"
+
+    def save(self, *args, **kwargs):
+        if self.session_date is None:
+            self.session_date = self.user.local_date(self.timestamp)
+        super().save(*args, **kwargs)
     
+class KeystrokeLog(models.Model):
+    session = models.OneToOneField(PracticeSession, on_delete=models.CASCADE, related_name="keystroke_log")
+    keystrokes = models.PositiveIntegerField()
+    data = models.BinaryField()  # delta-encoded timeline, see practice.keystrokes
+
+    def __str__(self):
+        return f"{self.keystrokes} keystrokes for session {self.session_id}"
+
+
+class KeystrokeProfile(models.Model):
+    """Per-user running totals of key and bigram timings, [presses, latency_sum_ms, errors] each."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="keystroke_profile")
+    keys = models.JSONField(default=dict)
+    bigrams = models.JSONField(default=dict)
+    sessions = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} keystroke profile"
+
+class SessionBatch(models.Model):
+    """An offline batch upload, kept so a retried batch is not counted twice."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="session_batches")
+    idempotency_key = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    result = models.JSONField(default=dict)
+
+    class Meta:
+      constraints = [
+          models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_user_idempotency_key')
+      ]
+
+    def __str__(self):
+        return f"{self.user.username} batch {self.idempotency_key}"
+
 class DailyStatistics(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_statistics")
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate)
     
     total_time = models.PositiveIntegerField(default=0)  # in seconds
     lessons_completed = models.PositiveIntegerField(default=0)
@@ -34,6 +105,11 @@ class DailyStatistics(models.Model):
     top_accuracy = models.FloatField(default=0)
     avg_accuracy = models.FloatField(default=0)
 
+    # running sums, the averages above are derived from these
+    time_taken_sum = models.PositiveBigIntegerField(default=0)  # in ms
+    speed_sum = models.FloatField(default=0)
+    accuracy_sum = models.FloatField(default=0)
+
     class Meta:
       constraints = [
           models.UniqueConstraint(fields=['user', 'date'], name='unique_user_date')
@@ -43,6 +119,51 @@ class DailyStatistics(models.Model):
         return f"{self.user.username} -> {self.date}"
 
 
+class PeriodStatistics(models.Model):
+    """Rollup of the daily statistics over a calendar period, kept in step with them."""
+    period_start = models.DateField()
+
+    total_time = models.PositiveIntegerField(default=0)  # in seconds
+    lessons_completed = models.PositiveIntegerField(default=0)
+    top_speed = models.FloatField(default=0)
+    avg_speed = models.FloatField(default=0)
+    top_accuracy = models.FloatField(default=0)
+    avg_accuracy = models.FloatField(default=0)
+
+    time_taken_sum = models.PositiveBigIntegerField(default=0)  # in ms
+    speed_sum = models.FloatField(default=0)
+    accuracy_sum = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.period_start}"
+
+
+class WeeklyStatistics(PeriodStatistics):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="weekly_statistics")  # period_start is a Monday
+
+    class Meta:
+      constraints = [
+          models.UniqueConstraint(fields=['user', 'period_start'], name='unique_user_week')
+      ]
+
+
+class MonthlyStatistics(PeriodStatistics):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="monthly_statistics")  # period_start is the 1st
+
+    class Meta:
+      constraints = [
+          models.UniqueConstraint(fields=['user', 'period_start'], name='unique_user_month')
+      ]
+
+
+# bumped when the statistics gain something only a rebuild can fill in, see
+# practice.utils.legacy_statistics_users
+STATISTICS_VERSION = 1
+
+
 class AllTimeStatistics(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     
@@ -52,9 +173,35 @@ class AllTimeStatistics(models.Model):
     avg_speed = models.FloatField(default=0)
     top_accuracy = models.FloatField(default=0)  
     avg_accuracy = models.FloatField(default=0)
+
+    # running sums, the averages above are per session, not per day
+    time_taken_sum = models.PositiveBigIntegerField(default=0)  # in ms
+    speed_sum = models.FloatField(default=0)
+    accuracy_sum = models.FloatField(default=0)
+
+    # STATISTICS_VERSION once rebuilt, 0 for rows from before the running totals
+    statistics_version = models.PositiveSmallIntegerField(default=0)
     
+    class Meta:
+        indexes = [
+            # leaderboard rebuilds and top-N reads
+            models.Index(fields=['-top_speed'], name='all_time_top_speed'),
+            models.Index(fields=['-avg_speed'], name='all_time_avg_speed'),
+        ]
+
     def __str__(self):
         return self.user.username
+
+
+class Streak(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="streak")
+
+    current_streak = models.PositiveIntegerField(default=0)  # consecutive days ending at last_active_date
+    longest_streak = models.PositiveIntegerField(default=0)
+    last_active_date = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.current_streak} day(s)"
     
 # class Leaderboard(models.Model):
 #     user = models.OneToOneField(User, on_delete=models.CASCADE)
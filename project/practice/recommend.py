@@ -0,0 +1,192 @@
+"""
+Adaptive snippet recommendations.
+
+Every snippet's feature vector (see practice.features) is held in one dense
+float32 matrix per process. A user's weakness vector is built from their
+keystroke profile, so picking the next snippet is a single matrix-vector
+product over the whole corpus plus a penalty for straying from the user's
+target difficulty.
+
+The index follows the snippet pool's version counter. New snippets are
+appended to the matrix; an update or delete also bumps the reset counter
+and forces a full reload.
+"""
+import logging
+import random
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .features import (
+    BIGRAMS, BIGRAM_OFFSET, DIFFICULTY, DIMENSIONS, LETTERS, LETTER_OFFSET, RARE_KEYS,
+    from_bytes, snippet_features, to_bytes,
+)
+from .models import AllTimeStatistics, KeystrokeProfile, TextSnippet
+from .snippets import RESET_KEY, VERSION_KEY
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 10
+DIFFICULTY_WEIGHT = 1.0
+ERROR_WEIGHT = 5.0  # an error rate of 10% weighs like a key 50% slower than average
+RARE_CHARS = set("qzxjkv0123456789") | set("!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~")
+
+
+def target_difficulty(avg_speed, avg_accuracy):
+    """Map a user's averages onto the 0..1 difficulty scale of the features."""
+    if not avg_speed:
+        return 0.3
+    return float(np.clip(avg_speed / 120 * (avg_accuracy or 0) / 100, 0.1, 0.9))
+
+
+def weakness_vector(profile):
+    """
+    Weight every letter and bigram dimension by how much slower than the
+    user's mean latency it is typed, plus its error rate. Rare keys get the
+    mean weakness of digits, punctuation and q z x j k v.
+    """
+    weights = np.zeros(DIMENSIONS, dtype=np.float32)
+    if profile is None or not profile.keys:
+        return weights
+
+    presses = sum(stats[0] for stats in profile.keys.values())
+    latency = sum(stats[1] for stats in profile.keys.values())
+    if not presses or not latency:
+        return weights
+    mean_latency = latency / presses
+
+    def weakness(stats):
+        key_presses, key_latency, key_errors = stats
+        if not key_presses:
+            return 0.0
+        slow = key_latency / key_presses / mean_latency - 1
+        return max(slow, 0.0) + ERROR_WEIGHT * key_errors / key_presses
+
+    for i, letter in enumerate(LETTERS):
+        stats = profile.keys.get(letter)
+        if stats is not None:
+            weights[LETTER_OFFSET + i] = weakness(stats)
+    for i, bigram in enumerate(BIGRAMS):
+        stats = profile.bigrams.get(bigram)
+        if stats is not None:
+            weights[BIGRAM_OFFSET + i] = weakness(stats)
+
+    rare = [weakness(stats) for key, stats in profile.keys.items() if key.lower() in RARE_CHARS]
+    if rare:
+        weights[RARE_KEYS] = sum(rare) / len(rare)
+    return weights
+
+
+class SnippetIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # snippet indexes, column-normalized features, raw difficulty
+        self._data = (np.zeros(0, dtype=np.int64), np.zeros((0, DIMENSIONS), dtype=np.float32),
+                      np.zeros(0, dtype=np.float32))
+        self._raw = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self._max_pk = 0
+        self._version = None
+        self._reset = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.appends = 0
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+    def _remote(self):
+        try:
+            return cache.get_many([VERSION_KEY, RESET_KEY])
+        except Exception as e:
+            logger.warning(f"Could not read snippet index version: {e}")
+            return {VERSION_KEY: self._version or 0, RESET_KEY: self._reset or 0}
+
+    def _refresh(self):
+        interval = getattr(settings, "SNIPPET_POOL_CHECK_INTERVAL", 30)
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < interval:
+            return
+
+        with self._lock:
+            if self._version is not None and now - self._checked_at < interval:
+                return
+            remote = self._remote()
+            version, reset = remote.get(VERSION_KEY, 0), remote.get(RESET_KEY, 0)
+            if self._version is None or reset != self._reset:
+                self._load(full=True)
+            elif version != self._version:
+                self._load(full=False)
+            self._version, self._reset = version, reset
+            self._checked_at = now
+
+    def _fetch(self, rows):
+        indexes, vectors, missing = [], [], []
+        for pk, index, content, blob in rows.iterator(chunk_size=2000):
+            if blob is None:
+                vector = snippet_features(content)
+                missing.append(TextSnippet(pk=pk, features=to_bytes(vector)))
+            else:
+                vector = from_bytes(blob)
+            indexes.append(index)
+            vectors.append(vector)
+            self._max_pk = max(self._max_pk, pk)
+
+        if missing:
+            # rows stored before features existed, persist them for the next process
+            TextSnippet.objects.bulk_update(missing, ["features"], batch_size=1000)
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, DIMENSIONS), dtype=np.float32)
+        return np.asarray(indexes, dtype=np.int64), matrix
+
+    def _load(self, full):
+        rows = TextSnippet.objects.order_by("pk").values_list("pk", "index", "content", "features")
+        if full:
+            self._max_pk = 0
+            indexes, raw = self._fetch(rows)
+            self.reloads += 1
+        else:
+            new_indexes, new_raw = self._fetch(rows.filter(pk__gt=self._max_pk))
+            indexes = np.concatenate([self._data[0], new_indexes])
+            raw = np.vstack([self._raw, new_raw])
+            self.appends += 1
+
+        scale = raw.max(axis=0) if len(raw) else np.ones(DIMENSIONS, dtype=np.float32)
+        scale[scale == 0] = 1
+        self._raw = raw
+        self._data = (indexes, raw / scale, raw[:, DIFFICULTY].copy())
+
+    def recommend(self, weights, target, k=TOP_K):
+        """
+        Return the snippet index picked at random among the `k` best scores
+        of `features @ weights - |difficulty - target|`, or None if empty.
+        """
+        self._refresh()
+        indexes, matrix, difficulty = self._data
+        if not len(indexes):
+            return None
+
+        total = weights.sum()
+        scores = matrix @ (weights / total) if total > 0 else np.zeros(len(indexes), dtype=np.float32)
+        scores -= DIFFICULTY_WEIGHT * np.abs(difficulty - target)
+        k = min(k, len(scores))
+        best = np.argpartition(scores, -k)[-k:]
+        return int(indexes[random.choice(best)])
+
+    def stats(self):
+        return {"size": len(self), "version": self._version, "reloads": self.reloads, "appends": self.appends}
+
+
+snippet_index = SnippetIndex()
+
+
+def recommend_for(user):
+    """Pick the next snippet index for the user, or None if there are no snippets."""
+    profile = KeystrokeProfile.objects.filter(user=user).first()
+    averages = AllTimeStatistics.objects.filter(user=user).values_list("avg_speed", "avg_accuracy").first()
+    target = target_difficulty(*averages) if averages else target_difficulty(0, 0)
+    return snippet_index.recommend(weakness_vector(profile), target)
@@ -1,4 +1,8 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
+from core.rows import as_date, as_float
 from .models import *
 
 class TextSnippetSerializer(serializers.ModelSerializer):
@@ -24,6 +28,57 @@ class PracticeSessionSerializer(serializers.ModelSerializer):
         session = PracticeSession.objects.create(**validated_data)
         return session
     
+class SessionBatchItemSerializer(serializers.ModelSerializer):
+    client_timestamp = serializers.DateTimeField(source="timestamp", required=False)
+
+    class Meta:
+        model = PracticeSession
+        fields = ['time_taken', 'speed', 'accuracy', 'client_timestamp']
+
+    def validate_client_timestamp(self, value):
+        now = timezone.now()
+        if value > now + timedelta(minutes=5):
+            raise serializers.ValidationError("Session timestamp cannot be in the future.")
+        if value < now - timedelta(days=settings.SESSION_BATCH_MAX_AGE_DAYS):
+            raise serializers.ValidationError(
+                f"Session timestamp cannot be more than {settings.SESSION_BATCH_MAX_AGE_DAYS} days old."
+            )
+        return value
+
+
+class SessionBatchSerializer(serializers.Serializer):
+    idempotency_key = serializers.CharField(max_length=64)
+    sessions = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.SESSION_BATCH_MAX_SIZE,
+    )
+
+
+class KeystrokeSerializer(serializers.Serializer):
+    keys = serializers.CharField(trim_whitespace=False, max_length=settings.KEYSTROKE_MAX_EVENTS)
+    timestamps = serializers.ListField(
+        child=serializers.IntegerField(min_value=0), max_length=settings.KEYSTROKE_MAX_EVENTS
+    )
+    errors = serializers.ListField(
+        child=serializers.IntegerField(min_value=0), max_length=settings.KEYSTROKE_MAX_EVENTS,
+        required=False, default=list,
+    )
+
+    def validate(self, attrs):
+        n = len(attrs['keys'])
+        timestamps = attrs['timestamps']
+        if len(timestamps) != n:
+            raise serializers.ValidationError("There must be one timestamp per key.")
+        if any(b < a for a, b in zip(timestamps, timestamps[1:])):
+            raise serializers.ValidationError("Timestamps must not decrease.")
+        if len(attrs['errors']) > n:
+            raise serializers.ValidationError("There can be at most one error position per key.")
+        if any(i >= n for i in attrs['errors']):
+            raise serializers.ValidationError("Error positions must point at a key.")
+        return attrs
+
+    
 class DailyStatisticsSerializer(serializers.ModelSerializer):
     class Meta:
         model = DailyStatistics
@@ -43,9 +98,18 @@ class AllTimeStatisticsSerializer(serializers.ModelSerializer):
 
 class StreakSerializer(serializers.Serializer):
     current_streak = serializers.IntegerField()
+    longest_streak = serializers.IntegerField()
 
 class GraphDataSerializer(serializers.Serializer):
     date = serializers.DateField()
     wpm = serializers.FloatField()
     accuracy = serializers.FloatField()
 
+
+def graph_points(rows):
+    """GraphDataSerializer's output for (date, wpm, accuracy) tuples, without a serializer."""
+    return [
+        {"date": as_date(day), "wpm": as_float(wpm), "accuracy": as_float(accuracy)}
+        for day, wpm, accuracy in rows
+    ]
+
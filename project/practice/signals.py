@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core import cache as tagged_cache
+from .models import AllTimeStatistics, DailyStatistics, PracticeSession, TextSnippet
+from .snippets import bump_version
+from .recommend import snippet_index
+from . import leaderboard
+
+
+@receiver(post_save, sender=AllTimeStatistics)
+def update_leaderboard(sender, instance, **kwargs):
+    # saves outside apply_sessions(), e.g. admin edits; its queryset updates sync themselves
+    scores = {metric: getattr(instance, metric) for metric in leaderboard.METRICS}
+    transaction.on_commit(lambda: leaderboard.update_user(instance.user_id, **scores))
+
+
+@receiver(post_delete, sender=AllTimeStatistics)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    leaderboard.remove_user(instance.user_id)
+
+
+@receiver(post_save, sender=TextSnippet)
+@receiver(post_delete, sender=TextSnippet)
+def reload_snippet_pool(sender, instance, **kwargs):
+    # new snippets are appended to the recommendation index, anything else rebuilds it
+    bump_version(reset=not kwargs.get("created", False))
+    snippet_index.invalidate()
+    tagged_cache.forget("text_snippet", instance.index)
+
+
+@receiver(post_save, sender=PracticeSession)
+@receiver(post_delete, sender=PracticeSession)
+@receiver(post_save, sender=DailyStatistics)
+@receiver(post_delete, sender=DailyStatistics)
+def invalidate_user_cache(sender, instance, **kwargs):
+    tagged_cache.bump_on_commit(tagged_cache.user_tag(instance.user_id))
+
+
+@receiver(post_save, sender=AllTimeStatistics)
+@receiver(post_delete, sender=AllTimeStatistics)
+def invalidate_rankings_cache(sender, instance, **kwargs):
+    tagged_cache.bump_on_commit(tagged_cache.user_tag(instance.user_id), tagged_cache.LEADERBOARD_TAG)
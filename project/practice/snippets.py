@@ -0,0 +1,140 @@
+"""
+Per-process pool of text snippets for TextSnippetView.
+
+The whole corpus is loaded once into one string plus an offsets array, so
+picking a random snippet is O(1) with no database or cache round-trip. A
+shared version counter in the cache is bumped whenever the corpus changes;
+each process polls it at most every SNIPPET_POOL_CHECK_INTERVAL seconds
+and reloads when it moved.
+"""
+import logging
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import cache as tagged_cache
+from .models import TextSnippet
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "text_snippet:version"
+RESET_KEY = "text_snippet:reset"  # bumped when existing snippets changed, not just new ones added
+
+
+def bump_version(reset=False):
+    """Mark the corpus as changed so every process reloads its pool."""
+    try:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        cache.incr(VERSION_KEY)
+        if reset:
+            cache.add(RESET_KEY, 0, timeout=None)
+            cache.incr(RESET_KEY)
+    except Exception as e:
+        logger.warning(f"Could not bump snippet pool version: {e}")
+    snippet_pool.invalidate()
+
+
+class SnippetPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = (array("I"), array("Q", [0]), "")  # indexes, offsets, joined contents
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def invalidate(self):
+        self._version = None
+
+    def _remote_version(self):
+        try:
+            return cache.get(VERSION_KEY, 0)
+        except Exception as e:
+            logger.warning(f"Could not read snippet pool version: {e}")
+            return self._version or 0
+
+    def _refresh(self):
+        interval = getattr(settings, "SNIPPET_POOL_CHECK_INTERVAL", 30)
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < interval:
+            return
+
+        with self._lock:
+            if self._version is not None and now - self._checked_at < interval:
+                return
+            version = self._remote_version()
+            if version != self._version:
+                self._load(version)
+            self._checked_at = now
+
+    def _load(self, version):
+        indexes, offsets, parts = array("I"), array("Q", [0]), []
+        rows = TextSnippet.objects.order_by("index").values_list("index", "content")
+        for index, content in rows.iterator(chunk_size=2000):
+            indexes.append(index)
+            parts.append(content)
+            offsets.append(offsets[-1] + len(content))
+
+        self._data = (indexes, offsets, "".join(parts))
+        self._version = version
+        self.reloads += 1
+        tagged_cache.local_cache.clear("text_snippet")
+
+    def random(self):
+        """Return {"index", "content"} for a uniformly random snippet, or None if there are none."""
+        self._refresh()
+        indexes, offsets, text = self._data  # one snapshot, safe against a concurrent reload
+        if not indexes:
+            self.misses += 1
+            return None
+
+        i = random.randrange(len(indexes))
+        self.hits += 1
+        return {"index": indexes[i], "content": text[offsets[i]:offsets[i + 1]]}
+
+    def get(self, index):
+        """Return {"index", "content"} for a snippet index, or None if the pool does not hold it."""
+        self._refresh()
+        indexes, offsets, text = self._data
+        i = bisect_left(indexes, index)
+        if i == len(indexes) or indexes[i] != index:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"index": index, "content": text[offsets[i]:offsets[i + 1]]}
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+snippet_pool = SnippetPool()
+
+
+def get_snippet(index):
+    """
+    Return {"index", "content"} for a snippet index from the pool, falling
+    back to the two-tier text_snippet cache and the database for snippets
+    the pool has not picked up yet. None if there is no such snippet.
+    """
+    snippet = snippet_pool.get(index)
+    if snippet is not None:
+        return snippet
+    return tagged_cache.get_or_load(
+        "text_snippet", index,
+        lambda: TextSnippet.objects.filter(index=index).values("index", "content").first(),
+    )
@@ -1,3 +1,1389 @@
-from django.test import TestCase
+import gzip
+import tempfile
+import threading
+import time
+import timeit
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.conf import settings
+from django.core.management import call_command
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from core import cache as tagged_cache, prerender
+from core.testing import QueryPlanMixin
+from . import archive, checks, dispatch, ingestion, keystrokes, leaderboard
+from .models import (
+    AllTimeStatistics, DailyStatistics, KeystrokeLog, KeystrokeProfile, MonthlyStatistics, PracticeSession, SessionBatch,
+    STATISTICS_VERSION, Streak, TextSnippet, WeeklyStatistics,
+)
+from .features import DIMENSIONS, FEATURE_NAMES, to_bytes
+from .recommend import SnippetIndex, recommend_for, weakness_vector
+from .serializers import GraphDataSerializer, graph_points
+from .snippets import SnippetPool, snippet_pool
+from .utils import (
+    apply_sessions, backfill_session_dates, compute_streak, legacy_statistics_users, rebuild_user_statistics,
+)
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM)
+class StampedeProtectionTests(SimpleTestCase):
+    THREADS = 200
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def compute(self):
+        with self.calls_lock:
+            self.calls += 1
+            value = self.calls
+        time.sleep(0.1)
+        return [{"username": "u", "wpm": value}]
+
+    def hammer(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def request():
+            barrier.wait()
+            results.append(tagged_cache.get_or_compute(
+                "leaderboard", "top_speed:all", [tagged_cache.LEADERBOARD_TAG], self.compute
+            ))
+
+        threads = [threading.Thread(target=request) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def expire(self):
+        key = tagged_cache.versioned_key("leaderboard", "top_speed:all", [tagged_cache.LEADERBOARD_TAG])
+        value, _, delta = cache.get(key)
+        cache.set(key, (value, time.time() - 1, delta), timeout=60)
+
+    def test_expired_key_is_recomputed_once_while_others_get_the_stale_value(self):
+        self.hammer()
+        self.expire()
+        results = self.hammer()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual({result[0]["wpm"] for result in results} - {1, 2}, set())
+
+    def test_tag_bump_is_recomputed_once(self):
+        self.hammer()
+        tagged_cache.bump(tagged_cache.LEADERBOARD_TAG)
+        results = self.hammer()
+        self.assertEqual(self.calls, 2)
+        self.assertTrue(all(result[0]["wpm"] == 2 for result in results))
+
+
+@override_settings(CACHES=LOCMEM)
+class LeaderboardStampedeTests(TransactionTestCase):
+    THREADS = 50
+
+    def setUp(self):
+        cache.clear()
+        users = User.objects.bulk_create(
+            User(email=f"st{i}@example.com", username=f"stampede{i}", password="!") for i in range(20)
+        )
+        AllTimeStatistics.objects.bulk_create(
+            AllTimeStatistics(user=user, top_speed=40 + i, avg_speed=30 + i) for i, user in enumerate(users)
+        )
+        leaderboard.get_backend().clear()
+        self.addCleanup(leaderboard.get_backend().clear)
+
+    def test_cold_key_is_computed_once(self):
+        barrier = threading.Barrier(self.THREADS)
+        results_lock = threading.Lock()
+        responses, queries = [], []
+
+        def request():
+            with CaptureQueriesContext(connection) as captured:
+                barrier.wait()
+                response = Client().get(reverse("leaderboard"))
+            with results_lock:
+                responses.append(response)
+                queries.extend(query["sql"] for query in captured.captured_queries)
+
+        range_read = leaderboard.MemoryBackend.range
+        with mock.patch.object(leaderboard.MemoryBackend, "range", autospec=True, side_effect=range_read) as reads:
+            threads = [threading.Thread(target=request) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [200] * self.THREADS)
+        self.assertEqual(len({response.content for response in responses}), 1)
+        # one top-10 read of the sorted set, one load of it, one username lookup
+        self.assertEqual(reads.call_count, 1)
+        all_time, users = AllTimeStatistics._meta.db_table, User._meta.db_table
+        self.assertEqual(sum(all_time in sql for sql in queries), len(leaderboard.METRICS))
+        self.assertEqual(sum(users in sql for sql in queries), 1)
+
+
+class QueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f"u{i}@example.com", username=f"user{i}", password="!") for i in range(200)
+        )
+        cls.user = users[0]
+        now = timezone.now()
+        PracticeSession.objects.bulk_create(
+            PracticeSession(user=user, timestamp=now - timedelta(hours=i),
+                            session_date=timezone.localdate(now - timedelta(hours=i)), time_taken=60000,
+                            speed=40 + i % 50, accuracy=95, stats_applied=i % 7 != 0)
+            for user in users for i in range(20)
+        )
+        DailyStatistics.objects.bulk_create(
+            DailyStatistics(user=user, date=date(2024, 1, 1) + timedelta(days=i), avg_speed=50)
+            for user in users for i in range(20)
+        )
+        AllTimeStatistics.objects.bulk_create(
+            AllTimeStatistics(user=user, top_speed=50 + i, avg_speed=40 + i % 30) for i, user in enumerate(users)
+        )
+        cls.analyze()
+
+    def test_pending_sessions(self):
+        self.assertUsesIndex(
+            PracticeSession.objects.filter(user=self.user, stats_applied=False), "practice_session_pending"
+        )
+
+    def test_sessions_of_a_day(self):
+        self.assertUsesIndex(
+            PracticeSession.objects.filter(user=self.user, session_date=self.user.local_date()),
+            "practice_session_user_date",
+        )
+
+    def test_archive_chunk_in_user_and_time_order(self):
+        before = timezone.now() - timedelta(hours=10)
+        self.assertUsesIndex(
+            PracticeSession.objects.filter(timestamp__lt=before, stats_applied=True, user_id__gte=self.user.pk)
+            .order_by("user_id", "timestamp", "id")[:100],
+            "practice_session_user_time",
+        )
+
+    def test_daily_statistics_newest_first(self):
+        self.assertUsesIndex(
+            DailyStatistics.objects.filter(user=self.user).order_by("-date"),
+            self.index_name(DailyStatistics, "unique_user_date"),
+        )
+
+    def test_graph_range(self):
+        for model, field, constraint in (
+            (DailyStatistics, "date", "unique_user_date"), (WeeklyStatistics, "period_start", "unique_user_week"),
+        ):
+            self.assertUsesIndex(
+                model.objects.filter(user=self.user, **{f"{field}__range": (date(2024, 1, 1), date(2024, 2, 1))})
+                .order_by(f"-{field}").values_list(field, "avg_speed", "avg_accuracy"),
+                self.index_name(model, constraint), model.__name__,
+            )
+
+    def test_all_time_top(self):
+        for metric in ("top_speed", "avg_speed"):
+            self.assertUsesIndex(AllTimeStatistics.objects.order_by(f"-{metric}")[:10], f"all_time_{metric}", metric)
+
+@override_settings(CACHES=LOCMEM, SESSION_ARCHIVE_AFTER_DAYS=365, SESSION_ARCHIVE_CHUNK_ROWS=50,
+                   SESSION_ARCHIVE_DELETE_ROWS=7)
+class SessionArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(email=f"a{i}@example.com", username=f"archived{i}", password="!") for i in range(4)
+        )
+        now = timezone.now()
+        PracticeSession.objects.bulk_create(
+            PracticeSession(user=user, timestamp=now - timedelta(days=5 * i, minutes=u), time_taken=30000 + i,
+                            speed=40 + i % 37 + u, accuracy=90 + i % 9)
+            for u, user in enumerate(cls.users) for i in range(120)
+        )
+        for user in cls.users[1:]:
+            rebuild_user_statistics(user.pk)  # the first user's sessions are left for archival to apply
+        cls.old = list(
+            PracticeSession.objects.filter(timestamp__lt=archive.archive_cutoff()).order_by("id")
+            .values_list("id", "user_id", "timestamp", "time_taken", "speed", "accuracy")
+        )
+        cls.logged = PracticeSession.objects.filter(pk=cls.old[0][0]).get()
+        keystrokes.record_keystrokes(cls.logged, "archive", [0, 90, 200, 310, 400, 520, 600], [2])
+        cls.blob = bytes(cls.logged.keystroke_log.data)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archive_settings = override_settings(SESSION_ARCHIVE_DIR=Path(directory.name))
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+
+    def archived(self, **filters):
+        return sorted(
+            (s.id, s.user_id, s.timestamp, s.time_taken, s.speed, s.accuracy)
+            for s in archive.iter_sessions(**filters)
+        )
+
+    def test_old_sessions_move_to_the_archive_with_statistics_intact(self):
+        result = archive.archive_sessions()
+
+        self.assertEqual(result["sessions"], len(self.old))
+        self.assertEqual(result["keystroke_logs"], 1)
+        self.assertFalse(PracticeSession.objects.filter(timestamp__lt=archive.archive_cutoff()).exists())
+        self.assertEqual(PracticeSession.objects.count(), 4 * 120 - len(self.old))
+        self.assertEqual(self.archived(), sorted(self.old))
+        self.assertEqual(len(archive.partitions()), len({row[2].strftime("%Y-%m") for row in self.old}))
+
+        # pending sessions were applied first, and rebuilds read the archive back
+        self.assertFalse(PracticeSession.objects.filter(stats_applied=False).exists())
+        for user in self.users:
+            self.assertEqual(rebuild_user_statistics(user.pk, commit=False), [], user.pk)
+
+        session = next(archive.iter_sessions(user_id=self.logged.user_id, start=self.logged.timestamp,
+                                             end=self.logged.timestamp + timedelta(microseconds=1)))
+        self.assertEqual((session.keystrokes, session.keystroke_data), (7, self.blob))
+
+    def test_reads_filter_by_user_and_time(self):
+        archive.archive_sessions()
+        user = self.users[2]
+        start, end = timezone.now() - timedelta(days=500), timezone.now() - timedelta(days=400)
+        expected = sorted(row for row in self.old if row[1] == user.pk and start <= row[2] < end)
+        self.assertTrue(expected)
+        self.assertEqual(self.archived(user_id=user.pk, start=start, end=end), expected)
+
+    def test_appending_keeps_earlier_blocks(self):
+        archive.archive_sessions(before=archive.archive_cutoff() - timedelta(days=100))
+        first = self.archived()
+        archive.archive_sessions()
+        self.assertEqual(self.archived(), sorted(self.old))
+        self.assertTrue(set(first) < set(self.archived()))
+
+    def test_sessions_after_the_whole_history_is_archived_apply_without_a_rebuild(self):
+        user = self.users[1]
+        archive.archive_sessions(before=timezone.now() + timedelta(days=1))
+        self.assertFalse(PracticeSession.objects.filter(user=user).exists())
+        lessons = AllTimeStatistics.objects.get(user=user).total_lessons_completed
+
+        PracticeSession.objects.create(user=user, time_taken=30000, speed=50, accuracy=95)
+        with mock.patch("practice.utils.rebuild_user_statistics") as rebuild:
+            self.assertEqual(apply_sessions(user.pk), 1)
+        rebuild.assert_not_called()
+        self.assertEqual(AllTimeStatistics.objects.get(user=user).total_lessons_completed, lessons + 1)
+        self.assertFalse(legacy_statistics_users().exists())
+        self.assertEqual(checks.legacy_statistics(None, databases=["default"]), [])
+        self.assertEqual(rebuild_user_statistics(user.pk, commit=False), [])
+
+    def test_uploads_after_an_archive_run_are_added_to_the_totals(self):
+        archive.archive_sessions()
+        dispatch.get_backend().clear()
+        self.addCleanup(dispatch.get_backend().clear)
+        before = {user.pk: AllTimeStatistics.objects.get(user=user).total_lessons_completed for user in self.users}
+
+        for user in self.users:
+            self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+            with mock.patch("practice.tasks.drain_statistics_task.apply_async"), \
+                    self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("sessions-batch"), {
+                    "idempotency_key": f"after-archive-{user.pk}",
+                    "sessions": [{"time_taken": 30000, "speed": 55, "accuracy": 96}] * 2,
+                }, content_type="application/json")
+            self.assertEqual(response.status_code, 201)
+        with mock.patch("practice.utils.rebuild_user_statistics") as rebuild:
+            self.assertEqual(dispatch.drain(), len(self.users))
+        rebuild.assert_not_called()
+
+        for user in self.users:
+            self.assertEqual(AllTimeStatistics.objects.get(user=user).total_lessons_completed, before[user.pk] + 2)
+            self.assertEqual(rebuild_user_statistics(user.pk, commit=False), [], user.pk)
+
+    def test_interrupted_delete_is_finished_by_the_next_run(self):
+        with mock.patch.object(archive, "_delete", side_effect=RuntimeError("killed")):
+            with self.assertRaises(RuntimeError):
+                archive.archive_sessions()
+        # the written block already holds the chunk, rebuilds count it once
+        for user in self.users:
+            self.assertEqual(rebuild_user_statistics(user.pk, commit=False), [], user.pk)
+        with self.assertLogs("practice.archive", "WARNING"):
+            archive.recover()
+        archive.archive_sessions()
+        self.assertEqual(self.archived(), sorted(self.old))
+        self.assertFalse(PracticeSession.objects.filter(timestamp__lt=archive.archive_cutoff()).exists())
+
+    def test_interrupted_write_is_cut_off(self):
+        with mock.patch.object(archive, "_append", side_effect=[None, RuntimeError("disk full")]):
+            with self.assertRaises(RuntimeError):
+                archive.archive_sessions()
+        with self.assertLogs("practice.archive", "WARNING"):
+            archive.recover()
+        archive.archive_sessions()
+        self.assertEqual(self.archived(), sorted(self.old))
+
+
+@override_settings(CACHES=LOCMEM)
+class SessionDateTests(TestCase):
+    def setUp(self):
+        # 02:00 UTC is still the previous day in Los Angeles and already 07:30 in Kolkata
+        self.moment = timezone.make_aware(datetime(2025, 3, 10, 2), dt_timezone.utc)
+        self.west = User.objects.create(email="w@example.com", username="west", password="!",
+                                        timezone="America/Los_Angeles")
+        self.east = User.objects.create(email="e@example.com", username="east", password="!")
+
+    def test_sessions_are_dated_in_their_users_timezone(self):
+        for user in (self.west, self.east):
+            session = PracticeSession.objects.create(user=user, timestamp=self.moment, time_taken=60000,
+                                                     speed=50, accuracy=95)
+            apply_sessions(user.pk)
+            self.assertEqual(session.session_date, user.local_date(self.moment))
+        self.assertEqual(PracticeSession.objects.get(user=self.west).session_date, date(2025, 3, 9))
+        self.assertEqual(PracticeSession.objects.get(user=self.east).session_date, date(2025, 3, 10))
+        self.assertTrue(DailyStatistics.objects.filter(user=self.west, date=date(2025, 3, 9)).exists())
+        self.assertTrue(DailyStatistics.objects.filter(user=self.east, date=date(2025, 3, 10)).exists())
+
+    def test_today_is_the_users_day(self):
+        self.client.force_login(self.west)
+        today = self.west.local_date()
+        DailyStatistics.objects.create(user=self.west, date=today, lessons_completed=1, avg_speed=50)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(self.west).access_token}"
+        response = self.client.get(reverse("daily_stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["date"], today.isoformat())
+
+    def test_backfill_fills_old_rows_in_chunks(self):
+        PracticeSession.objects.bulk_create(
+            PracticeSession(user=user, timestamp=self.moment + timedelta(hours=h), time_taken=60000, speed=50,
+                            accuracy=95, stats_applied=True)
+            for user in (self.west, self.east) for h in range(12)
+        )
+        before = {user.pk: rebuild_user_statistics(user.pk) for user in (self.west, self.east)}
+        self.assertTrue(all(before.values()))  # the rows were missing, unbackfilled sessions still count
+
+        chunks = []
+        self.assertEqual(backfill_session_dates(chunk_size=5, progress=chunks.append), 24)
+        self.assertEqual(chunks, [5, 10, 15, 20, 24])
+        self.assertFalse(PracticeSession.objects.filter(session_date__isnull=True).exists())
+        for session in PracticeSession.objects.select_related("user"):
+            self.assertEqual(session.session_date, session.user.local_date(session.timestamp))
+        for user in (self.west, self.east):
+            self.assertEqual(rebuild_user_statistics(user.pk, commit=False), [])
+
+
+@override_settings(CACHES=LOCMEM)
+class StatisticsEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="s@example.com", username="stats", password="!")
+
+    def session(self, day, speed, accuracy=90, time_taken=60000, applied=False):
+        return PracticeSession.objects.create(
+            user=self.user, timestamp=timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=12)),
+            session_date=day, time_taken=time_taken, speed=speed, accuracy=accuracy, stats_applied=applied,
+        )
+
+    def snapshot(self):
+        return {
+            model.__name__: sorted(model.objects.filter(user=self.user).values_list(*fields))
+            for model, fields in (
+                (DailyStatistics, ("date", "lessons_completed", "total_time", "avg_speed", "top_speed", "avg_accuracy")),
+                (WeeklyStatistics, ("period_start", "lessons_completed", "avg_speed")),
+                (MonthlyStatistics, ("period_start", "lessons_completed", "avg_speed")),
+                (AllTimeStatistics, ("total_lessons_completed", "total_time_spent", "avg_speed", "top_speed")),
+                (Streak, ("current_streak", "longest_streak", "last_active_date")),
+            )
+        }
+
+    def test_averages_are_weighted_by_session(self):
+        self.session(date(2025, 1, 6), 30)
+        for _ in range(3):
+            self.session(date(2025, 1, 7), 90)
+        self.assertEqual(apply_sessions(self.user.pk), 4)
+
+        daily = dict(DailyStatistics.objects.filter(user=self.user).values_list("date", "avg_speed"))
+        self.assertEqual(daily, {date(2025, 1, 6): 30, date(2025, 1, 7): 90})
+        all_time = AllTimeStatistics.objects.get(user=self.user)
+        # per session, not the mean of the daily averages (60)
+        self.assertEqual((all_time.total_lessons_completed, all_time.avg_speed), (4, 75))
+        self.assertEqual(WeeklyStatistics.objects.get(user=self.user).avg_speed, 75)
+
+    def test_reapplying_is_a_no_op(self):
+        first = self.session(date(2025, 1, 6), 40)
+        apply_sessions(self.user.pk)
+        before = self.snapshot()
+        self.assertEqual(apply_sessions(self.user.pk), 0)
+        self.assertEqual(apply_sessions(self.user.pk, session_ids=[first.pk]), 0)
+        self.assertEqual(self.snapshot(), before)
+
+        second = self.session(date(2025, 1, 6), 80)
+        self.assertEqual(apply_sessions(self.user.pk, session_ids=[second.pk]), 1)
+        self.assertEqual(apply_sessions(self.user.pk, session_ids=[first.pk, second.pk]), 0)
+        self.assertEqual(AllTimeStatistics.objects.get(user=self.user).total_lessons_completed, 2)
+
+    def test_incremental_totals_match_a_rebuild(self):
+        # across a week and a month boundary, applied in several steps
+        days = [date(2025, 1, 30), date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 3), date(2025, 2, 3)]
+        for i, day in enumerate(days):
+            self.session(day, 40 + 7 * i, accuracy=85 + i, time_taken=30000 + 1000 * i)
+            if i % 2:
+                apply_sessions(self.user.pk)
+        apply_sessions(self.user.pk)
+        incremental = self.snapshot()
+        self.assertEqual(rebuild_user_statistics(self.user.pk, commit=False), [])
+
+        for model in (DailyStatistics, WeeklyStatistics, MonthlyStatistics, AllTimeStatistics, Streak):
+            model.objects.filter(user=self.user).delete()
+        PracticeSession.objects.filter(user=self.user).update(stats_applied=False)
+        rebuild_user_statistics(self.user.pk)
+        rebuilt = self.snapshot()
+        for name, rows in incremental.items():
+            self.assertEqual(len(rows), len(rebuilt[name]), name)
+            for row, other in zip(rows, rebuilt[name]):
+                self.assertEqual(row[0], other[0], name)
+                for value, expected in zip(row[1:], other[1:]):
+                    self.assertAlmostEqual(value, expected, msg=name)
+
+    def test_statistics_from_before_the_running_totals_are_upgraded(self):
+        day = date(2025, 1, 6)
+        # what the aggregating implementation left behind: counts and averages, no sums, nothing applied
+        self.session(day, 30)
+        self.session(day, 90)
+        DailyStatistics.objects.create(user=self.user, date=day, total_time=120, lessons_completed=2,
+                                       top_speed=90, avg_speed=60, top_accuracy=90, avg_accuracy=90)
+        AllTimeStatistics.objects.create(user=self.user, total_time_spent=120, total_lessons_completed=2,
+                                         top_speed=90, avg_speed=60, top_accuracy=90, avg_accuracy=90)
+        self.assertEqual(list(legacy_statistics_users()), [self.user])
+        self.assertEqual([w.id for w in checks.legacy_statistics(None, databases=["default"])], ["practice.W001"])
+
+        self.session(day, 60)
+        self.assertEqual(apply_sessions(self.user.pk), 3)
+
+        all_time = AllTimeStatistics.objects.get(user=self.user)
+        self.assertEqual((all_time.total_lessons_completed, all_time.avg_speed), (3, 60))
+        self.assertEqual(DailyStatistics.objects.get(user=self.user).lessons_completed, 3)
+        self.assertFalse(legacy_statistics_users().exists())
+        self.assertEqual(checks.legacy_statistics(None, databases=["default"]), [])
+        self.assertEqual(rebuild_user_statistics(self.user.pk, commit=False), [])
+
+    def test_upgrade_command_rebuilds_only_legacy_users(self):
+        current = User.objects.create(email="c@example.com", username="current", password="!")
+        PracticeSession.objects.create(user=current, time_taken=1000, speed=50, accuracy=99)
+        apply_sessions(current.pk)
+        self.session(date(2025, 1, 6), 30)
+        DailyStatistics.objects.create(user=self.user, date=date(2025, 1, 6), lessons_completed=1, avg_speed=30)
+        AllTimeStatistics.objects.create(user=self.user, total_lessons_completed=1, avg_speed=30)
+
+        out = StringIO()
+        call_command("rebuild_statistics", "--legacy", stdout=out)
+        self.assertIn("1 user(s) rebuilt", out.getvalue())
+        self.assertIn(f"user {self.user.pk}:", out.getvalue())
+        self.assertNotIn(f"user {current.pk}:", out.getvalue())
+        self.assertFalse(legacy_statistics_users().exists())
+        self.assertEqual(AllTimeStatistics.objects.get(user=self.user).speed_sum, 30)
+
+
+@override_settings(CACHES=LOCMEM)
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="k@example.com", username="streaky", password="!")
+        self.today = self.user.local_date()
+
+    def practice(self, *days):
+        for day in days:
+            PracticeSession.objects.create(user=self.user, session_date=day, time_taken=1000, speed=50, accuracy=95)
+        apply_sessions(self.user.pk)
+        return Streak.objects.filter(user=self.user).values_list(
+            "current_streak", "longest_streak", "last_active_date").get()
+
+    def test_compute_streak(self):
+        d = date(2025, 1, 1)
+        self.assertEqual(compute_streak([]), (0, 0, None))
+        self.assertEqual(compute_streak([d, d, d + timedelta(days=1)]), (2, 2, d + timedelta(days=1)))
+        # a gap restarts the current run, the longest survives it
+        days = [d, d + timedelta(days=1), d + timedelta(days=2), d + timedelta(days=4), d + timedelta(days=5)]
+        self.assertEqual(compute_streak(days), (2, 3, d + timedelta(days=5)))
+
+    def test_same_day_sessions_count_once(self):
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(self.practice(yesterday, yesterday), (1, 1, yesterday))
+        self.assertEqual(self.practice(self.today), (2, 2, self.today))
+        self.assertEqual(self.practice(self.today, self.today), (2, 2, self.today))
+
+    def test_gap_restarts_the_current_run(self):
+        start = self.today - timedelta(days=10)
+        self.practice(start, start + timedelta(days=1), start + timedelta(days=2))
+        self.assertEqual(self.practice(start + timedelta(days=5)), (1, 3, start + timedelta(days=5)))
+        self.assertEqual(self.practice(start + timedelta(days=6)), (2, 3, start + timedelta(days=6)))
+
+    def test_late_sessions_before_the_end_are_rescanned(self):
+        start = self.today - timedelta(days=10)
+        self.practice(start, start + timedelta(days=2))
+        # an offline upload fills the gap after the fact
+        self.assertEqual(self.practice(start + timedelta(days=1)), (3, 3, start + timedelta(days=2)))
+        self.assertEqual(rebuild_user_statistics(self.user.pk, commit=False), [])
+
+    def test_current_streak_must_reach_today(self):
+        self.practice(self.today - timedelta(days=3), self.today - timedelta(days=2))
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+        self.assertEqual(self.client.get(reverse("streak")).json()["current_streak"], 0)
+        self.practice(self.today)
+        self.assertEqual(self.client.get(reverse("streak")).json()["current_streak"], 1)
+
+    def test_upgrade_seeds_missing_streaks(self):
+        # rows from before streaks were materialized: applied sessions, daily rows, no streak
+        days = [self.today - timedelta(days=1), self.today]
+        for day in days:
+            PracticeSession.objects.create(user=self.user, session_date=day, time_taken=1000, speed=50,
+                                           accuracy=95, stats_applied=True)
+        rebuild_user_statistics(self.user.pk)
+        Streak.objects.filter(user=self.user).delete()
+        AllTimeStatistics.objects.filter(user=self.user).update(statistics_version=0)
+        self.assertEqual(list(legacy_statistics_users()), [self.user])
+
+        call_command("rebuild_statistics", "--legacy", stdout=StringIO())
+        self.assertEqual(
+            Streak.objects.filter(user=self.user).values_list("current_streak", "longest_streak").get(), (2, 2)
+        )
+        self.assertFalse(legacy_statistics_users().exists())
+
+
+@override_settings(CACHES=LOCMEM)
+class GraphTests(TestCase):
+    FIRST = date(2024, 1, 1)  # a Monday
+    DAYS = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="g@example.com", username="grapher", password="!")
+        PracticeSession.objects.bulk_create(
+            PracticeSession(user=cls.user, timestamp=timezone.now(), session_date=cls.FIRST + timedelta(days=i),
+                            time_taken=1000, speed=i, accuracy=90, stats_applied=True)
+            for i in range(cls.DAYS)
+        )
+        rebuild_user_statistics(cls.user.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+
+    def graph(self, **params):
+        return self.client.get(reverse("graph"), params)
+
+    def test_invalid_parameters(self):
+        for params in ({"bucket": "year"}, {"from": "2024-13-01"}, {"to": "yesterday"}, {"points": "many"},
+                       {"from": "2024-02-01", "to": "2024-01-01"}):
+            self.assertEqual(self.graph(**params).status_code, 400, params)
+
+    def test_too_little_history(self):
+        DailyStatistics.objects.filter(user=self.user, date__gte=self.FIRST + timedelta(days=29)).delete()
+        self.assertEqual(self.graph().status_code, 400)
+
+    def test_periods_are_calendar_weeks_and_months(self):
+        # from a Wednesday and a mid-month day, the rollups start at the Monday and the 1st
+        weeks = self.graph(bucket="week", **{"from": "2024-01-10", "to": "2024-01-21"}).json()
+        self.assertEqual([p["date"] for p in weeks], ["2024-01-15", "2024-01-08"])
+        self.assertEqual(weeks[1]["wpm"], sum(range(7, 14)) / 7)
+
+        months = self.graph(bucket="month", **{"from": "2024-02-15", "to": "2024-03-31"}).json()
+        self.assertEqual([p["date"] for p in months], ["2024-03-01", "2024-02-01"])
+        self.assertEqual(months[1]["wpm"], sum(range(31, 60)) / 29)  # 2024 is a leap year
+
+    def test_auto_picks_the_finest_rollup_that_fits(self):
+        def dates(**params):
+            return [p["date"] for p in self.graph(**params).json()]
+
+        self.assertEqual(len(dates(**{"from": "2024-01-01", "to": "2024-07-18"})), 200)  # 200 days
+        self.assertEqual(len(dates(**{"from": "2024-01-01", "to": "2024-07-19"})), 29)   # 201 days, weeks
+        self.assertEqual(dates(points=20)[:2], ["2025-02-01", "2025-01-01"])             # 400 days, months
+        self.assertEqual(dates(points=20)[-1], "2024-01-01")
+
+    def test_forced_buckets_are_capped_at_points(self):
+        points = self.graph(bucket="day", points=50).json()
+        self.assertEqual(len(points), 50)
+        self.assertEqual(points[0]["date"], (self.FIRST + timedelta(days=self.DAYS - 1)).isoformat())
+        self.assertEqual(len(self.graph(bucket="day", points=5000).json()), self.DAYS)  # clamped to 1000
+
+    def test_upgrade_seeds_missing_rollups(self):
+        WeeklyStatistics.objects.filter(user=self.user).delete()
+        MonthlyStatistics.objects.filter(user=self.user).delete()
+        AllTimeStatistics.objects.filter(user=self.user).update(statistics_version=0)
+        self.assertEqual(list(legacy_statistics_users()), [self.user])
+        call_command("rebuild_statistics", "--legacy", stdout=StringIO())
+        self.assertEqual(WeeklyStatistics.objects.filter(user=self.user).count(), 58)
+        self.assertEqual(MonthlyStatistics.objects.filter(user=self.user).count(), 14)
+        self.assertEqual(rebuild_user_statistics(self.user.pk, commit=False), [])
+
+
+@override_settings(CACHES=LOCMEM)
+class LocalPeriodLeaderboardTests(TestCase):
+    # 02:00 UTC: Mar 10 on the server (Asia/Kolkata), still Mar 9 in Los Angeles
+    NOW = datetime(2025, 3, 10, 2, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        leaderboard.get_backend().clear()
+        cache.clear()
+        for clock in (mock.patch("django.utils.timezone.now", return_value=self.NOW),
+                      mock.patch.object(leaderboard.time, "time", return_value=self.NOW.timestamp())):
+            clock.start()
+            self.addCleanup(clock.stop)
+        self.west = User.objects.create(email="lw@example.com", username="west", password="!",
+                                        timezone="America/Los_Angeles")
+        self.east = User.objects.create(email="le@example.com", username="east", password="!")
+        for user, speed in ((self.west, 80), (self.east, 60)):
+            PracticeSession.objects.create(user=user, timestamp=self.NOW, time_taken=1000, speed=speed, accuracy=95)
+            with self.captureOnCommitCallbacks(execute=True):
+                apply_sessions(user.pk)
+
+    def get(self, user, name, **params):
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        return self.client.get(reverse(name), params)
+
+    def test_periods_follow_the_readers_local_date(self):
+        self.assertEqual(self.west.local_date(), date(2025, 3, 9))
+        west_day, east_day = self.west.local_date(), self.east.local_date()
+        self.assertEqual(leaderboard.top("top_speed", window="day", day=west_day), [(1, self.west.pk, 80)])
+        self.assertEqual(leaderboard.top("top_speed", window="day", day=east_day), [(1, self.east.pk, 60)])
+        self.assertEqual(leaderboard.rank(self.west.pk, "top_speed", "day", west_day), (1, 1))
+        # Sunday Mar 9 closes a week, Monday Mar 10 opens the next; the month holds both
+        self.assertEqual(leaderboard.top("top_speed", window="week", day=west_day), [(1, self.west.pk, 80)])
+        self.assertEqual(len(leaderboard.top("top_speed", window="month", day=east_day)), 2)
+
+        self.assertEqual(self.get(self.west, "user_rank", window="day").json()["world_rank"], 1)
+        self.assertEqual(self.get(self.west, "leaderboard", window="day").json(), [{"username": "west", "wpm": 80.0}])
+        self.assertEqual(self.get(self.east, "leaderboard", window="day").json(), [{"username": "east", "wpm": 60.0}])
+        around = self.get(self.west, "leaderboard-around", window="month").json()
+        self.assertEqual([entry["username"] for entry in around], ["west", "east"])
+
+    def test_pushes_reach_a_built_period_of_the_users_local_date(self):
+        west_day = self.west.local_date()
+        leaderboard.rank(self.west.pk, "top_speed", "day", west_day)  # builds the Mar 9 board
+        PracticeSession.objects.create(user=self.west, timestamp=self.NOW, time_taken=1000, speed=95, accuracy=95)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_sessions(self.west.pk)
+        self.assertEqual(leaderboard.top("top_speed", window="day", day=west_day), [(1, self.west.pk, 95)])
+
+
+class MemoryLeaderboardBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = leaderboard.MemoryBackend()
+
+    def test_rank_count_and_range_are_best_first(self):
+        for member, score in ((1, 90), (2, 70), (3, 80)):
+            self.backend.set("board", member, score)
+        self.assertEqual(self.backend.range("board", 0, -1), [(1, 90), (3, 80), (2, 70)])
+        self.assertEqual(self.backend.range("board", 1, 1), [(3, 80)])
+        self.assertEqual(self.backend.rank("board", 2), 2)
+        self.assertIsNone(self.backend.rank("board", 4))
+        self.assertEqual(self.backend.count("board"), 3)
+
+        self.backend.set("board", 2, 95)  # a new score moves the member
+        self.assertEqual(self.backend.rank("board", 2), 0)
+        self.assertEqual(self.backend.count("board"), 3)
+
+    def test_ties_are_ordered_like_redis(self):
+        # ZREVRANGE puts equal scores in descending member byte order: "9" before "10"
+        for member in (10, 9, 11):
+            self.backend.set("board", member, 50)
+        self.assertEqual([member for member, _ in self.backend.range("board", 0, -1)], [9, 11, 10])
+        self.assertEqual([self.backend.rank("board", member) for member in (9, 11, 10)], [0, 1, 2])
+
+    def test_remove_and_replace(self):
+        self.backend.set("board", 1, 90)
+        self.backend.set("board", 2, 70)
+        self.backend.remove("board", 1)
+        self.backend.remove("board", 3)  # not ranked, no-op
+        self.assertEqual(self.backend.range("board", 0, -1), [(2, 70)])
+        self.backend.replace("board", iter([(5, 10), (6, 20)]))
+        self.assertEqual(self.backend.range("board", 0, -1), [(6, 20), (5, 10)])
+        self.backend.replace("board", iter([]))
+        self.assertEqual(self.backend.count("board"), 0)
+
+    def test_a_merging_replace_keeps_scores_pushed_meanwhile(self):
+        self.backend.set("board", 1, 90)
+
+        def rows():
+            yield 1, 60
+            # pushed while the rows are read
+            self.backend.set("board", 2, 75)
+            self.backend.set("board", 3, 80)
+            yield 2, 70
+
+        self.backend.replace("board", rows(), merge=True)
+        self.assertEqual(self.backend.range("board", 0, -1), [(1, 90), (3, 80), (2, 75)])
+        self.backend.replace("board", iter([(2, 70)]))
+        self.assertEqual(self.backend.range("board", 0, -1), [(2, 70)])
+
+    def test_build_locks(self):
+        self.assertTrue(self.backend.lock("built", 30))
+        self.assertFalse(self.backend.lock("built", 30))
+        self.assertTrue(self.backend.is_locked("built"))
+        self.backend.unlock("built")
+        self.assertFalse(self.backend.is_locked("built"))
+        self.assertTrue(self.backend.lock("lapsed", -1))
+        self.assertTrue(self.backend.lock("lapsed", 30))  # the holder died, the lock lapsed
+
+    def test_percentile(self):
+        self.assertEqual(leaderboard.percentile(1, 4), 75.0)
+        self.assertEqual(leaderboard.percentile(4, 4), 0.0)
+        self.assertEqual(leaderboard.percentile(1, 3), 66.67)
+
+    def test_expired_keys_and_markers_are_dropped(self):
+        self.backend.set("old", 1, 50, expire_at=time.time() - 1)
+        self.backend.set("new", 1, 50, expire_at=time.time() + 60)
+        self.backend.mark_built("old:built", time.time() - 1)
+        self.assertEqual((self.backend.count("old"), self.backend.count("new")), (0, 1))
+        self.assertFalse(self.backend.is_built("old:built"))
+        self.backend.replace("new", iter([(2, 10)]))  # a rebuild without an expiry keeps the key
+        self.assertEqual(self.backend.count("new"), 1)
+
+
+@override_settings(CACHES=LOCMEM)
+class LeaderboardBuildTests(SimpleTestCase):
+    THREADS = 20
+
+    def setUp(self):
+        self.backend = leaderboard.get_backend()
+        self.backend.clear()
+        self.addCleanup(self.backend.clear)
+
+    def test_concurrent_cold_readers_build_once(self):
+        builds = []
+
+        def rebuild(merge=False):
+            builds.append(merge)
+            time.sleep(0.1)
+            self.backend.replace(leaderboard._key("top_speed"), iter([(1, 50)]), merge=merge)
+            self.backend.mark_built()
+
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def read():
+            barrier.wait()
+            results.append(leaderboard.top("top_speed"))
+
+        with mock.patch.object(leaderboard, "rebuild", rebuild):
+            threads = [threading.Thread(target=read) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(builds, [True])
+        self.assertEqual(results, [[(1, 1, 50)]] * self.THREADS)
+
+    def test_pushes_reach_a_period_being_built(self):
+        day = timezone.localdate()
+        marker = leaderboard._built_key("day", day)
+        leaderboard.update_window(1, "day", day, top_speed=50, avg_speed=40)
+        self.assertEqual(leaderboard.count("top_speed", "day", day), 0)  # nobody reads it, nothing kept
+
+        self.assertTrue(self.backend.lock(marker, 30))
+        leaderboard.update_window(1, "day", day, top_speed=50, avg_speed=40)
+        self.assertEqual(leaderboard.count("top_speed", "day", day), 1)
+
+
+@override_settings(CACHES=LOCMEM)
+class AllTimeLeaderboardTests(TestCase):
+    def setUp(self):
+        leaderboard.get_backend().clear()
+        self.users = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, speed in enumerate((60, 90, 75, 75, 0)):
+                user = User.objects.create(email=f"rank{i}@example.com", username=f"rank{i}", password="!")
+                AllTimeStatistics.objects.create(user=user, top_speed=speed, avg_speed=speed)
+                self.users.append(user)
+
+    def test_rank_top_and_around(self):
+        first, second, third, fourth, unranked = (user.pk for user in self.users)
+        self.assertEqual(leaderboard.rank(second, "top_speed"), (1, 4))
+        self.assertEqual(leaderboard.rank(first, "top_speed"), (4, 4))
+        self.assertIsNone(leaderboard.rank(unranked, "top_speed"))  # zero scores are not ranked
+        tied = [user_id for _, user_id, _ in leaderboard.top("top_speed", 4)[1:3]]
+        self.assertEqual(sorted(tied), [third, fourth])
+        self.assertEqual([entry[0] for entry in leaderboard.around(first, "top_speed", radius=1)], [3, 4])
+        self.assertEqual(leaderboard.around(unranked, "top_speed"), [])
+
+    def test_saves_outside_apply_sessions_update_the_board(self):
+        statistics = AllTimeStatistics.objects.get(user=self.users[0])
+        leaderboard.rank(statistics.user_id, "top_speed")  # built
+        statistics.top_speed = 100
+        with self.captureOnCommitCallbacks(execute=True):
+            statistics.save()  # e.g. an admin edit
+        self.assertEqual(leaderboard.rank(statistics.user_id, "top_speed"), (1, 4))
+
+    def test_deleted_statistics_leave_the_board(self):
+        leaderboard.rank(self.users[1].pk, "top_speed")  # built
+        AllTimeStatistics.objects.filter(user=self.users[1]).delete()
+        self.assertIsNone(leaderboard.rank(self.users[1].pk, "top_speed"))
+        self.assertEqual(leaderboard.rank(self.users[2].pk, "top_speed")[1], 3)
+
+
+@override_settings(CACHES=LOCMEM)
+class WindowRotationTests(TestCase):
+    # noon on Wednesday Mar 12 in the server's timezone
+    NOW = datetime(2025, 3, 12, 6, 30, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        leaderboard.get_backend().clear()
+        cache.clear()
+        self.now = self.NOW
+        for clock in (mock.patch("django.utils.timezone.now", side_effect=lambda: self.now),
+                      mock.patch.object(leaderboard.time, "time", side_effect=lambda: self.now.timestamp())):
+            clock.start()
+            self.addCleanup(clock.stop)
+        self.user = User.objects.create(email="rot@example.com", username="rot", password="!")
+        PracticeSession.objects.create(user=self.user, timestamp=self.NOW, time_taken=1000, speed=80, accuracy=95)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_sessions(self.user.pk)
+
+    def test_a_new_period_starts_empty(self):
+        self.assertEqual(leaderboard.top("top_speed", window="day"), [(1, self.user.pk, 80)])
+        self.now = self.NOW + timedelta(days=1)
+        self.assertEqual(leaderboard.top("top_speed", window="day"), [])
+        self.assertEqual(leaderboard.top("top_speed", window="week"), [(1, self.user.pk, 80)])
+        self.now = self.NOW + timedelta(days=5)  # Monday
+        self.assertEqual(leaderboard.top("top_speed", window="week"), [])
+        self.assertEqual(leaderboard.top("top_speed", window="month"), [(1, self.user.pk, 80)])
+
+    def test_finished_periods_expire_after_the_grace_day(self):
+        leaderboard.top("top_speed", window="day")
+        key = leaderboard._key("top_speed", "day", date(2025, 3, 12))
+        backend = leaderboard.get_backend()
+        self.now = self.NOW + timedelta(days=1)  # Mar 13, still kept for late readers
+        self.assertEqual(backend.count(key), 1)
+        self.now = datetime(2025, 3, 13, 18, 30, tzinfo=dt_timezone.utc)  # Mar 14 00:00 local
+        self.assertEqual(backend.count(key), 0)
+        self.assertFalse(backend.is_built(leaderboard._built_key("day", date(2025, 3, 12))))
+
+    def test_pushes_wait_for_the_period_to_be_built(self):
+        self.now = self.NOW + timedelta(days=1)
+        PracticeSession.objects.create(user=self.user, timestamp=self.now, time_taken=1000, speed=70, accuracy=95)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_sessions(self.user.pk)
+        backend = leaderboard.get_backend()
+        self.assertEqual(backend.count(leaderboard._key("top_speed", "day", date(2025, 3, 13))), 0)
+        # the first read loads the period from the rollup table
+        self.assertEqual(leaderboard.top("top_speed", window="day"), [(1, self.user.pk, 70)])
+
+
+@override_settings(CACHES=LOCMEM)
+class StatisticsDispatchTests(TestCase):
+    def setUp(self):
+        self.backend = dispatch.get_backend()
+        self.backend.clear()
+        self.addCleanup(self.backend.clear)
+        task = mock.patch("practice.tasks.drain_statistics_task.apply_async")
+        self.apply_async = task.start()
+        self.addCleanup(task.stop)
+        self.user = User.objects.create(email="burst@example.com", username="burst", password="!")
+
+    def record(self, speed):
+        PracticeSession.objects.create(user=self.user, time_taken=1000, speed=speed, accuracy=95)
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch.schedule_statistics(self.user.pk)
+
+    def delta(self, before):
+        after = self.backend.metrics()
+        return {name: after[name] - before[name] for name in dispatch.METRIC_NAMES if after[name] != before[name]}
+
+    def test_a_burst_is_applied_by_one_drain(self):
+        before = self.backend.metrics()
+        for speed in (50, 60, 70):
+            self.record(speed)
+        self.assertEqual(self.apply_async.call_count, 1)
+        self.assertEqual(self.backend.pending(), 1)
+
+        self.assertEqual(dispatch.drain(), 1)
+        self.assertEqual(self.delta(before), {
+            "requested": 3, "coalesced": 2, "drains_scheduled": 1, "users_drained": 1, "sessions_applied": 3,
+        })
+        self.assertEqual(AllTimeStatistics.objects.get(user=self.user).total_lessons_completed, 3)
+        self.assertEqual(self.backend.pending(), 0)
+
+        self.record(80)  # the drain released the schedule
+        self.assertEqual(self.apply_async.call_count, 2)
+
+    def test_failed_users_stay_dirty(self):
+        self.record(50)
+        before = self.backend.metrics()
+        with mock.patch.object(dispatch, "apply_sessions", side_effect=RuntimeError("database is down")), \
+                self.assertLogs("practice.dispatch", "ERROR"):
+            self.assertEqual(dispatch.drain(), 0)
+        self.assertEqual(self.delta(before), {"failures": 1})
+        self.assertEqual(self.backend.pending(), 1)
+        self.assertEqual(dispatch.drain(), 1)
+        self.assertTrue(PracticeSession.objects.get(user=self.user).stats_applied)
+
+    def test_users_of_a_crashed_drain_are_recovered(self):
+        self.record(50)
+        claimed = time.time()
+        self.assertEqual(self.backend.claim_dirty(10), [self.user.pk])  # the drain dies here
+        self.assertEqual(self.backend.pending(), 0)
+        with mock.patch.object(dispatch.time, "time", return_value=claimed + settings.STATS_CLAIM_LEASE + 1):
+            self.assertEqual(dispatch.drain(), 1)
+        self.assertTrue(PracticeSession.objects.get(user=self.user).stats_applied)
+
+    def test_a_concurrent_drain_leaves_live_claims_alone(self):
+        self.record(50)
+        self.assertEqual(self.backend.claim_dirty(10), [self.user.pk])  # another drain is applying them
+        self.assertEqual(dispatch.drain(), 0)
+        self.assertFalse(PracticeSession.objects.get(user=self.user).stats_applied)
+        self.assertEqual(self.backend.pending(), 0)
+
+
+@override_settings(CACHES=LOCMEM, SNIPPET_POOL_CHECK_INTERVAL=0)
+class SnippetPoolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        snippet_pool.invalidate()
+        self.addCleanup(snippet_pool.invalidate)
+
+    def login(self):
+        user = User.objects.create(email="pool@example.com", username="pool", password="!")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+
+    def test_random_picks_cover_the_first_and_last_snippet(self):
+        for index, content in ((3, "alpha"), (7, "bravo charlie"), (9, "delta")):
+            TextSnippet.objects.create(index=index, content=content)
+        with mock.patch("practice.snippets.random.randrange", side_effect=[0, 2]) as randrange:
+            self.assertEqual(snippet_pool.random(), {"index": 3, "content": "alpha"})
+            self.assertEqual(snippet_pool.random(), {"index": 9, "content": "delta"})
+        randrange.assert_called_with(3)
+        self.assertEqual(snippet_pool.get(7), {"index": 7, "content": "bravo charlie"})
+        self.assertIsNone(snippet_pool.get(8))
+
+    def test_an_empty_pool_has_no_snippet(self):
+        self.assertIsNone(snippet_pool.random())
+        self.assertEqual(len(snippet_pool), 0)
+        self.login()
+        self.assertEqual(self.client.get(reverse("texts")).status_code, 404)
+
+    def test_other_processes_reload_after_an_ingestion(self):
+        other = SnippetPool()  # another worker's pool, loaded before the ingestion
+        self.assertIsNone(other.random())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "snippets.csv"
+            path.write_text("index,paragraph\n1,first paragraph\n2,second paragraph\n", encoding="utf-8")
+            call_command("ingest_snippets", str(path), stdout=StringIO())
+        self.assertEqual(other.get(2), {"index": 2, "content": "second paragraph"})
+        self.assertEqual(other.stats()["reloads"], 2)
+        self.login()
+        self.assertIn(self.client.get(reverse("texts")).json()["index"], (1, 2))
+
+
+@override_settings(CACHES=LOCMEM)
+class IngestionTests(TestCase):
+    ROWS = [
+        (1, "the quick brown fox"),
+        (2, "jumps over the lazy dog"),
+        (3, "the quick brown fox"),      # same content as 1
+        (2, "a different paragraph"),    # same index as 2
+        (4, "pack my box"),
+        (5, "with five dozen jugs"),
+        (6, "jumps over the lazy dog"),  # same content as 2, in a later batch
+        (7, "of liquor"),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "snippets.csv"
+        self.path.write_text(
+            "index,paragraph\n" + "".join(f"{index},{content}\n" for index, content in self.ROWS), encoding="utf-8"
+        )
+        self.checkpoint = f"{self.path}.checkpoint"
+
+    def stored(self):
+        return dict(TextSnippet.objects.values_list("index", "content"))
+
+    def test_duplicates_by_index_and_content_are_dropped(self):
+        TextSnippet.objects.create(index=7, content="already stored")
+        result = ingestion.ingest_snippets(self.path, batch_size=3)
+        self.assertEqual((result["rows"], result["inserted"]), (8, 4))
+        self.assertEqual(self.stored(), {
+            1: "the quick brown fox", 2: "jumps over the lazy dog", 4: "pack my box",
+            5: "with five dozen jugs", 7: "already stored",
+        })
+
+    def test_batches_hold_at_most_batch_size_snippets(self):
+        progress = mock.Mock()
+        with mock.patch.object(ingestion, "_write_batch", wraps=ingestion._write_batch) as write:
+            ingestion.ingest_snippets(self.path, batch_size=2, progress=progress)
+        # dedup is per batch, the rest is left to the unique constraints
+        self.assertEqual([len(call.args[0]) for call in write.call_args_list], [2, 2, 2, 2])
+        self.assertEqual([call.args[0] for call in progress.call_args_list], [2, 4, 6, 8])
+
+    def test_an_interrupted_run_resumes_after_the_last_batch(self):
+        write, writes = ingestion._write_batch, []
+
+        def fail_second_batch(batch):
+            writes.append(batch)
+            if len(writes) == 2:
+                raise KeyboardInterrupt
+            write(batch)
+
+        with mock.patch.object(ingestion, "_write_batch", side_effect=fail_second_batch), \
+                self.assertRaises(KeyboardInterrupt):
+            ingestion.ingest_snippets(self.path, batch_size=3, checkpoint=self.checkpoint)
+        self.assertEqual(sorted(self.stored()), [1, 2, 4])
+
+        result = ingestion.ingest_snippets(self.path, batch_size=3, checkpoint=self.checkpoint)
+        self.assertEqual((result["skipped"], result["inserted"]), (5, 2))
+        self.assertEqual(sorted(self.stored()), [1, 2, 4, 5, 7])
+        self.assertFalse(Path(self.checkpoint).exists())
+
+    def test_bundled_corpus_dedups_to_its_distinct_paragraphs(self):
+        result = ingestion.ingest_snippets(Path(settings.BASE_DIR) / "data" / "paragraphs.csv")
+        self.assertEqual((result["rows"], result["inserted"]), (238, 28))
+
+
+@override_settings(CACHES=LOCMEM, SESSION_BATCH_MAX_AGE_DAYS=30)
+class SessionBatchTests(TestCase):
+    SESSION = {"time_taken": 30000, "speed": 60, "accuracy": 95}
+
+    def setUp(self):
+        self.user = User.objects.create(email="batch@example.com", username="batch", password="!")
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+
+    def post(self, key, sessions):
+        return self.client.post(
+            reverse("sessions-batch"), {"idempotency_key": key, "sessions": sessions}, content_type="application/json"
+        )
+
+    def test_a_replayed_batch_returns_the_first_result(self):
+        first = self.post("upload-1", [self.SESSION, self.SESSION])
+        self.assertEqual(first.status_code, 201)
+        replay = self.post("upload-1", [self.SESSION, self.SESSION, self.SESSION])
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(PracticeSession.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.post("upload-2", [self.SESSION]).status_code, 201)
+
+    def test_invalid_items_are_reported_without_failing_the_batch(self):
+        now = timezone.now()
+        response = self.post("upload-1", [
+            self.SESSION,
+            {**self.SESSION, "speed": "fast"},
+            {**self.SESSION, "client_timestamp": (now + timedelta(hours=1)).isoformat()},
+            {**self.SESSION, "client_timestamp": (now - timedelta(days=31)).isoformat()},
+            {**self.SESSION, "client_timestamp": (now - timedelta(days=29)).isoformat()},
+        ])
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 3))
+        self.assertEqual([item["status"] for item in body["results"]],
+                         ["created", "invalid", "invalid", "invalid", "created"])
+        self.assertEqual(set(body["results"][1]["errors"]), {"speed"})
+        self.assertIn("30 days old", body["results"][3]["errors"]["client_timestamp"][0])
+
+    def test_a_batch_without_valid_items_is_not_recorded(self):
+        response = self.post("upload-1", [{**self.SESSION, "accuracy": None}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SessionBatch.objects.exists())
+        self.assertEqual(self.post("upload-1", [self.SESSION]).status_code, 201)  # the key is still free
+
+    def test_other_integrity_errors_are_not_taken_for_a_replay(self):
+        with mock.patch.object(PracticeSession.objects, "bulk_create", side_effect=IntegrityError("CHECK failed")), \
+                self.assertRaises(IntegrityError):
+            self.post("upload-1", [self.SESSION])
+        self.assertFalse(SessionBatch.objects.exists())
+
+
+class KeystrokeCodecTests(SimpleTestCase):
+    def test_round_trip(self):
+        keys = "héllo 😀"
+        timestamps = [0, 120, 250, 70000, 70100, 70300, 70450]
+        codes, deltas, errors = keystrokes.decode(keystrokes.encode(keys, timestamps, [1, 6]))
+        self.assertEqual(codes.tolist(), [ord(c) for c in keys[:-1]] + [keystrokes.REPLACEMENT_CODE])
+        self.assertEqual(deltas.tolist(), [0, 120, 130, 65535, 100, 200, 150])  # clipped at u16
+        self.assertEqual(errors.tolist(), [False, True, False, False, False, False, True])
+
+        codes, deltas, errors = keystrokes.decode(keystrokes.encode("", []))
+        self.assertEqual((len(codes), len(deltas), len(errors)), (0, 0, 0))
+
+    def test_unknown_versions_are_rejected(self):
+        blob = zlib.compress(keystrokes.HEADER.pack(keystrokes.VERSION + 1, 0))
+        with self.assertRaises(ValueError):
+            keystrokes.decode(blob)
+
+    def test_heatmap_of_keys_and_bigrams(self):
+        stats = keystrokes.analyze(*keystrokes.decode(keystrokes.encode("abab", [0, 100, 300, 400], [2])))
+        self.assertEqual(stats["keys"], {"a": [1, 200.0, 1], "b": [2, 200.0, 0]})
+        self.assertEqual(stats["bigrams"], {"ab": [2, 200.0, 0], "ba": [1, 200.0, 1]})
+        self.assertEqual(keystrokes.heatmap(stats["keys"]), [
+            {"key": "a", "presses": 1, "avg_latency": 200.0, "error_rate": 100.0},
+            {"key": "b", "presses": 2, "avg_latency": 100.0, "error_rate": 0.0},
+        ])
+        self.assertEqual([row["key"] for row in keystrokes.heatmap(stats["bigrams"], limit=1)], ["ba"])
+
+    def test_a_thousand_keys_are_small_and_analyzed_in_milliseconds(self):
+        keys = ("the quick brown fox jumps over the lazy dog " * 25)[:1000]
+        blob = keystrokes.encode(keys, [i * 180 for i in range(1000)], range(0, 1000, 37))
+        self.assertLess(len(blob), 4.2 * 1000)
+        best = min(timeit.repeat(lambda: keystrokes.analyze(*keystrokes.decode(blob)), number=1, repeat=5))
+        self.assertLess(best * 1000, 10)
+
+
+@override_settings(CACHES=LOCMEM)
+class KeystrokeViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="keys@example.com", username="keys", password="!")
+        self.session = PracticeSession.objects.create(user=self.user, time_taken=1000, speed=60, accuracy=95)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+        self.url = reverse("session-keystrokes", args=[self.session.pk])
+
+    def post(self, **timeline):
+        return self.client.post(self.url, {"keys": "abc", "timestamps": [0, 100, 200], **timeline},
+                                content_type="application/json")
+
+    def test_a_session_is_recorded_once(self):
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(self.post().status_code, 409)
+        self.assertEqual(self.client.get(reverse("keystroke-heatmap")).json()["sessions"], 1)
+
+    def test_a_concurrent_upload_is_a_conflict(self):
+        # the other request passed the same existence check first
+        self.post()
+        with mock.patch.object(KeystrokeLog.objects, "filter", return_value=KeystrokeLog.objects.none()):
+            self.assertEqual(self.post().status_code, 409)
+        self.assertEqual(KeystrokeProfile.objects.get(user=self.user).sessions, 1)
+
+    def test_timelines_are_bounded(self):
+        self.assertEqual(self.post(errors=[0, 1, 2, 2]).status_code, 400)
+        response = self.post(keys="a" * (settings.KEYSTROKE_MAX_EVENTS + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(KeystrokeLog.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM, SNIPPET_POOL_CHECK_INTERVAL=0)
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="weak@example.com", username="weak", password="!")
+        TextSnippet.objects.create(index=1, content="the other one said that they went there and then")
+        TextSnippet.objects.create(index=2, content="quiz the jazz vixen and jinx the quick kazoo")
+
+    def test_weak_keys_pick_the_snippets_that_train_them(self):
+        profile = KeystrokeProfile.objects.create(user=self.user, sessions=1, keys={
+            "t": [50, 5000.0, 0], "h": [50, 5000.0, 0], "e": [50, 5000.0, 0],
+            "q": [5, 2500.0, 2], "z": [5, 2500.0, 2], "x": [5, 2500.0, 1],
+        })
+        weights = weakness_vector(profile)
+        self.assertGreater(weights[FEATURE_NAMES.index("z")], weights[FEATURE_NAMES.index("t")])
+        self.assertEqual(SnippetIndex().recommend(weights, 0.3, k=1), 2)
+        self.assertIn(recommend_for(self.user), (1, 2))
+
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+        self.assertIn(self.client.get(reverse("texts-recommended")).json()["index"], (1, 2))
+
+    def test_the_index_follows_snippet_changes(self):
+        index = SnippetIndex()
+        index.recommend(np.zeros(DIMENSIONS, dtype=np.float32), 0.3)
+        self.assertEqual((len(index), index.reloads, index.appends), (2, 1, 0))
+
+        TextSnippet.objects.create(index=3, content="zzz zzz zzz")
+        weights = np.zeros(DIMENSIONS, dtype=np.float32)
+        weights[FEATURE_NAMES.index("z")] = 1
+        self.assertEqual(index.recommend(weights, 0.3, k=1), 3)  # appended, not reloaded
+        self.assertEqual((len(index), index.reloads, index.appends), (3, 1, 1))
+
+        snippet = TextSnippet.objects.get(index=3)
+        snippet.content = "plain words"
+        snippet.save()
+        TextSnippet.objects.filter(index=1).delete()
+        self.assertEqual(index.recommend(weights, 0.3, k=1), 2)
+        self.assertEqual((len(index), index.reloads), (2, 2))
+
+    @override_settings(SNIPPET_POOL_CHECK_INTERVAL=30)
+    def test_scoring_is_served_from_memory_within_5_ms(self):
+        rng = np.random.default_rng(0)
+        TextSnippet.objects.bulk_create(
+            TextSnippet(index=100 + i, content=f"snippet {i}", content_hash=str(i),
+                        features=to_bytes(rng.random(DIMENSIONS, dtype=np.float32)))
+            for i in range(20000)
+        )
+        index = SnippetIndex()
+        weights = rng.random(DIMENSIONS, dtype=np.float32)
+        index.recommend(weights, 0.5)  # loads the matrix
+        self.assertEqual(len(index), 20002)
+        with self.assertNumQueries(0):
+            best = min(timeit.repeat(lambda: index.recommend(weights, 0.5), number=1, repeat=20))
+        self.assertLess(best * 1000, 5)
+
+
+@override_settings(CACHES=LOCMEM)
+class UserTagInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create(email=f"tag{i}@example.com", username=f"tag{i}", password="!") for i in range(2)
+        ]
+        for user in self.users:
+            AllTimeStatistics.objects.create(user=user, total_lessons_completed=1,
+                                             statistics_version=STATISTICS_VERSION)
+
+    def lessons(self, user):
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        return self.client.get(reverse("all_time_stats")).json()["total_lessons_completed"]
+
+    def test_a_session_write_bumps_the_user_tag(self):
+        user, other = self.users
+        keys = [tagged_cache.versioned_key("all_time_stats", u.pk, [tagged_cache.user_tag(u.pk)]) for u in self.users]
+        with self.captureOnCommitCallbacks(execute=True):
+            PracticeSession.objects.create(user=user, time_taken=1000, speed=60, accuracy=95)
+        self.assertNotEqual(
+            tagged_cache.versioned_key("all_time_stats", user.pk, [tagged_cache.user_tag(user.pk)]), keys[0]
+        )
+        self.assertEqual(
+            tagged_cache.versioned_key("all_time_stats", other.pk, [tagged_cache.user_tag(other.pk)]), keys[1]
+        )
+
+    def test_stale_entries_miss_after_a_write(self):
+        user, other = self.users
+        self.assertEqual((self.lessons(user), self.lessons(other)), (1, 1))
+        AllTimeStatistics.objects.update(total_lessons_completed=5)  # no signals, the cached values stay
+        self.assertEqual((self.lessons(user), self.lessons(other)), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PracticeSession.objects.create(user=user, time_taken=1000, speed=60, accuracy=95)
+        self.assertEqual((self.lessons(user), self.lessons(other)), (5, 1))
+
+
+class LocalLRUTests(SimpleTestCase):
+    def setUp(self):
+        value = "x" * 100
+        self.entry = tagged_cache.LocalLRU.sizeof(value)
+        self.lru = tagged_cache.LocalLRU(max_bytes=3 * self.entry, timeout=60)
+        self.value = value
+
+    def test_least_recently_used_entries_are_evicted_first(self):
+        for key in "abc":
+            self.lru.set(key, self.value)
+        self.lru.get("a")
+        self.lru.set("d", self.value)
+        self.assertEqual([key for key in "abcd" if self.lru.get(key) is not None], ["a", "c", "d"])
+        self.assertEqual(self.lru.evictions, 1)
+
+    def test_size_stays_within_the_bound(self):
+        for i in range(10):
+            self.lru.set(i, self.value)
+            self.assertLessEqual(self.lru.size, self.lru.max_bytes)
+        self.assertEqual((len(self.lru), self.lru.size), (3, 3 * self.entry))
+        self.lru.set("huge", "x" * 1000)  # larger than the whole tier, not stored
+        self.assertIsNone(self.lru.get("huge"))
+        self.assertEqual(len(self.lru), 3)
+
+    def test_entries_expire(self):
+        self.lru.set("a", self.value)
+        with mock.patch.object(tagged_cache.time, "monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(self.lru.get("a"))
+        self.assertEqual(self.lru.size, 0)
+
+
+@override_settings(CACHES=LOCMEM, IMMUTABLE_CACHE_FAMILIES=("room_text",))
+class LocalTierRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        tagged_cache.local_cache.clear()
+        self.addCleanup(tagged_cache.local_cache.clear)
+
+    def test_only_immutable_families_use_the_local_tier(self):
+        load = mock.Mock(return_value="text")
+        for family in ("room_text", "graph_data"):
+            self.assertEqual(tagged_cache.get_or_load(family, "k", load), "text")
+        self.assertEqual(tagged_cache.local_cache.get("room_text:k"), "text")
+        self.assertIsNone(tagged_cache.local_cache.get("graph_data:k"))
+
+        cache.clear()  # the local tier still serves the immutable family
+        self.assertEqual(tagged_cache.get_or_load("room_text", "k", load), "text")
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(tagged_cache.get_or_load("graph_data", "k", load), "text")
+        self.assertEqual(load.call_count, 3)
+
+    def test_forget_drops_both_tiers(self):
+        tagged_cache.get_or_load("room_text", "k", lambda: "text")
+        tagged_cache.forget("room_text", "k")
+        self.assertIsNone(tagged_cache.local_cache.get("room_text:k"))
+        self.assertIsNone(cache.get("room_text:k"))
+
+
+@override_settings(RESPONSE_CACHE_GZIP=True, RESPONSE_CACHE_GZIP_MIN_BYTES=0)
+class PrerenderTests(SimpleTestCase):
+    def setUp(self):
+        self.rendered = prerender.render({"rows": list(range(50))})
+
+    def respond(self, **headers):
+        return prerender.respond(RequestFactory().get("/", **headers), self.rendered)
+
+    def test_gzip_is_negotiated_with_q_values(self):
+        for header, gzipped in (
+            ("gzip, deflate, br", True), ("br;q=1.0, gzip;q=0.5", True), ("*", True),
+            ("gzip;q=0", False), ("gzip;q=0.000, *", False), ("*;q=0", False), ("identity", False), ("", False),
+        ):
+            with self.subTest(header):
+                response = self.respond(HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.get("Content-Encoding") == "gzip", gzipped)
+                self.assertEqual(response.content, self.rendered.gzipped if gzipped else self.rendered.body)
+                self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_each_representation_has_its_own_etag(self):
+        identity = self.respond()
+        gzipped = self.respond(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(identity["ETag"], self.rendered.etag)
+        self.assertNotEqual(gzipped["ETag"], identity["ETag"])
+        self.assertEqual(gzip.decompress(gzipped.content), identity.content)
+
+    def test_if_none_match_gets_a_304_for_the_same_representation(self):
+        etag = self.respond(HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        not_modified = self.respond(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b""))
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertIn("Accept-Encoding", not_modified["Vary"])
+        # a cached gzip body is no use to a client that stopped accepting gzip
+        self.assertEqual(self.respond(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.respond(HTTP_IF_NONE_MATCH="*").status_code, 304)
+
+    def test_small_bodies_are_not_compressed_but_still_vary(self):
+        with self.settings(RESPONSE_CACHE_GZIP_MIN_BYTES=10 ** 6):
+            self.rendered = prerender.render({"rows": []})
+        response = self.respond(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["ETag"], self.rendered.etag)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+
+@override_settings(CACHES=LOCMEM)
+class CachedResponseTests(TestCase):
+    def test_cached_endpoint_answers_if_none_match_with_304(self):
+        cache.clear()
+        user = User.objects.create(email="etag@example.com", username="etag", password="!")
+        AllTimeStatistics.objects.create(user=user, total_lessons_completed=3)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        first = self.client.get(reverse("all_time_stats"))
+        self.assertEqual(first.status_code, 200)
+        again = self.client.get(reverse("all_time_stats"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual((again.status_code, again["ETag"]), (304, first["ETag"]))
+
+
+class GraphPointsTests(TestCase):
+    def test_rows_render_like_the_serializer(self):
+        user = User.objects.create(email="points@example.com", username="points", password="!")
+        DailyStatistics.objects.bulk_create([
+            DailyStatistics(user=user, date=date(2025, 1, 1), avg_speed=40, avg_accuracy=97.123456789),
+            DailyStatistics(user=user, date=date(2025, 1, 2), avg_speed=0.1 + 0.2, avg_accuracy=0),
+        ])
+        rows = DailyStatistics.objects.filter(user=user).order_by("date").values_list("date", "avg_speed", "avg_accuracy")
+        data = [{"date": day, "wpm": wpm, "accuracy": accuracy} for day, wpm, accuracy in rows]
+        self.assertEqual(
+            prerender.render(graph_points(rows)).body, prerender.render(GraphDataSerializer(data, many=True).data).body
+        )
@@ -3,11 +3,16 @@ from .views import *
 
 urlpatterns = [
     path('texts/', TextSnippetView.as_view(), name='texts'),
+    path('texts/recommended/', RecommendedSnippetView.as_view(), name='texts-recommended'),
     path('sessions/', PracticeSessionView.as_view(), name='sessions'),
+    path('sessions/batch/', PracticeSessionBatchView.as_view(), name='sessions-batch'),
+    path('sessions/<int:session_id>/keystrokes/', KeystrokeView.as_view(), name='session-keystrokes'),
+    path('keystrokes/heatmap/', KeystrokeHeatmapView.as_view(), name='keystroke-heatmap'),
     path('daily_stats/', DailyStatisticsView.as_view(), name='daily_stats'),
     path('all_time_stats/', AllTimeStatisticsView.as_view(), name='all_time_stats'),
     path('streak/', StreakView.as_view(), name='streak'),
     path('user_rank/', UserRankView.as_view(), name='user_rank'),
     path('graph/', GraphDataView.as_view(), name='graph'),
     path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    path('leaderboard/around/', LeaderboardAroundView.as_view(), name='leaderboard-around'),
 ]
\ No newline at end of file
@@ -1,62 +1,418 @@
-from .models import PracticeSession, DailyStatistics, AllTimeStatistics
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from accounts.models import User
+from .models import (
+    PracticeSession, DailyStatistics, WeeklyStatistics, MonthlyStatistics, AllTimeStatistics, Streak,
+    STATISTICS_VERSION,
+)
+from . import archive, leaderboard
+from core import cache as tagged_cache
 from django.utils import timezone
-from django.db.models import Avg, Max, Sum, Count
+from django.db import transaction
+from django.db.models import Max, Sum, Count, F, Value
+from django.db.models.functions import Greatest
 
 
-def update_daily_statistics(user):
-    today = timezone.now().date()
-    sessions = PracticeSession.objects.filter(user=user, timestamp__date=today)
+STAT_FIELDS = [
+    "time_taken_sum", "speed_sum", "accuracy_sum",
+    "top_speed", "avg_speed", "top_accuracy", "avg_accuracy",
+]
+DAILY_FIELDS = ["total_time", "lessons_completed"] + STAT_FIELDS
+ALL_TIME_FIELDS = ["total_time_spent", "total_lessons_completed"] + STAT_FIELDS
 
-    if not sessions.exists():
-        return
 
-    agg = sessions.aggregate(
-        total_time=Sum('time_taken'),
-        lessons_completed=Count('id'),
-        top_speed=Max('speed'),
-        avg_speed=Avg('speed'),
-        top_accuracy=Max('accuracy'),
-        avg_accuracy=Avg('accuracy'),
-    )
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+# (model, date field, period of a day) for every per-period statistics table
+ROLLUPS = [
+    (DailyStatistics, "date", lambda day: day),
+    (WeeklyStatistics, "period_start", week_start),
+    (MonthlyStatistics, "period_start", month_start),
+]
+
+
+def _empty_delta():
+    return {
+        "time_taken_sum": 0, "lessons": 0, "speed_sum": 0.0, "accuracy_sum": 0.0,
+        "top_speed": 0.0, "top_accuracy": 0.0,
+    }
+
+
+def _merge(delta, other):
+    delta["time_taken_sum"] += other["time_taken_sum"]
+    delta["lessons"] += other["lessons"]
+    delta["speed_sum"] += other["speed_sum"]
+    delta["accuracy_sum"] += other["accuracy_sum"]
+    delta["top_speed"] = max(delta["top_speed"], other["top_speed"])
+    delta["top_accuracy"] = max(delta["top_accuracy"], other["top_accuracy"])
+
+
+def _session_delta(session):
+    return {
+        "time_taken_sum": session["time_taken"], "lessons": 1,
+        "speed_sum": session["speed"], "accuracy_sum": session["accuracy"],
+        "top_speed": session["speed"], "top_accuracy": session["accuracy"],
+    }
+
+
+def _row_delta(row):
+    return {
+        "time_taken_sum": row["time_taken_sum"], "lessons": row["lessons_completed"],
+        "speed_sum": row["speed_sum"], "accuracy_sum": row["accuracy_sum"],
+        "top_speed": row["top_speed"], "top_accuracy": row["top_accuracy"],
+    }
 
-    agg['total_time'] = int((agg['total_time'] or 0) / 1000)  # ms → s
 
-    stats, _ = DailyStatistics.objects.get_or_create(user=user, date=today)
-    stats.total_time = agg['total_time']
-    stats.lessons_completed = agg['lessons_completed'] or 0
-    stats.top_speed = agg['top_speed'] or 0
-    stats.avg_speed = agg['avg_speed'] or 0
-    stats.top_accuracy = agg['top_accuracy'] or 0
-    stats.avg_accuracy = agg['avg_accuracy'] or 0
-    stats.save()
+def _delta_row(delta, time_field="total_time", lessons_field="lessons_completed"):
+    return {
+        time_field: delta["time_taken_sum"] // 1000,
+        lessons_field: delta["lessons"],
+        "time_taken_sum": delta["time_taken_sum"],
+        "speed_sum": delta["speed_sum"],
+        "accuracy_sum": delta["accuracy_sum"],
+        "top_speed": delta["top_speed"],
+        "avg_speed": delta["speed_sum"] / delta["lessons"],
+        "top_accuracy": delta["top_accuracy"],
+        "avg_accuracy": delta["accuracy_sum"] / delta["lessons"],
+    }
 
 
-def update_all_time_statistics(user):
-    try:
-        daily_stats = DailyStatistics.objects.filter(user=user)
+def _increment(model, lookup, delta, time_field="total_time", lessons_field="lessons_completed", defaults=None):
+    """
+    Upsert one statistics row and fold `delta` into it with a single
+    F-expression UPDATE, so concurrent writers never lose an increment.
+    """
+    obj, _ = model.objects.get_or_create(**lookup, defaults=defaults)
 
-        if not daily_stats.exists():
-            return  
+    time_taken_sum = F("time_taken_sum") + delta["time_taken_sum"]
+    lessons = F(lessons_field) + delta["lessons"]
+    speed_sum = F("speed_sum") + delta["speed_sum"]
+    accuracy_sum = F("accuracy_sum") + delta["accuracy_sum"]
 
-        agg = daily_stats.aggregate(
-            total_time_spent=Sum('total_time'),
-            total_lessons_completed=Sum('lessons_completed'),
-            top_speed=Max('top_speed'),
-            avg_speed=Avg('avg_speed'),
-            top_accuracy=Max('top_accuracy'),
-            avg_accuracy=Avg('avg_accuracy'),
+    model.objects.filter(pk=obj.pk).update(**{
+        "time_taken_sum": time_taken_sum,
+        time_field: time_taken_sum / 1000,  # ms → s
+        lessons_field: lessons,
+        "speed_sum": speed_sum,
+        "accuracy_sum": accuracy_sum,
+        "avg_speed": speed_sum / lessons,
+        "avg_accuracy": accuracy_sum / lessons,
+        "top_speed": Greatest("top_speed", Value(delta["top_speed"])),
+        "top_accuracy": Greatest("top_accuracy", Value(delta["top_accuracy"])),
+    })
+
+
+def backfill_session_dates(user_id=None, chunk_size=5000, progress=None):
+    """
+    Fill session_date of sessions stored before the column existed, in
+    primary key order and one transaction per chunk. Returns the rows filled.
+    """
+    pending = PracticeSession.objects.filter(session_date__isnull=True)
+    if user_id is not None:
+        pending = pending.filter(user_id=user_id)
+    filled = last = 0
+    while True:
+        chunk = list(pending.filter(pk__gt=last).order_by("pk").values_list("pk", "user_id", "timestamp")[:chunk_size])
+        if not chunk:
+            return filled
+        zones = dict(User.objects.filter(pk__in={user for _, user, _ in chunk}).values_list("pk", "timezone"))
+        with transaction.atomic():
+            PracticeSession.objects.bulk_update([
+                PracticeSession(pk=pk, session_date=timezone.localdate(moment, ZoneInfo(zones[user])))
+                for pk, user, moment in chunk
+            ], ["session_date"])
+        filled += len(chunk)
+        last = chunk[-1][0]
+        if progress is not None:
+            progress(filled)
+
+
+def legacy_statistics_users():
+    """
+    Users whose statistics predate the running totals: their all-time row
+    has not been stamped with STATISTICS_VERSION, so the rows may carry
+    counts without sums, no streak and no weekly or monthly rollups. Adding
+    to those rows would count the history twice; they have to be rebuilt
+    from the sessions first (rebuild_statistics --legacy), which stamps the
+    row. Rows created by apply_sessions() start out stamped.
+    """
+    return User.objects.filter(alltimestatistics__statistics_version__lt=STATISTICS_VERSION)
+
+
+def apply_sessions(user_id, session_ids=None):
+    """
+    Fold the user's not yet applied sessions (optionally only `session_ids`)
+    into the running daily, weekly, monthly and all-time statistics. Every
+    affected period costs one upsert regardless of history length, and a
+    session is never counted twice. Returns the number of sessions applied.
+    """
+    with transaction.atomic():
+        pending = PracticeSession.objects.select_for_update().filter(
+            user_id=user_id, stats_applied=False
         )
+        if session_ids is not None:
+            pending = pending.filter(pk__in=session_ids)
+
+        sessions = list(pending.values("id", "timestamp", "session_date", "time_taken", "speed", "accuracy"))
+        if not sessions:
+            return 0
+        version = AllTimeStatistics.objects.filter(user_id=user_id).values_list(
+            "statistics_version", flat=True
+        ).first()
+        if version is not None and version < STATISTICS_VERSION:
+            # not upgraded yet, the rebuild seeds the sums and applies every pending session
+            rebuild_user_statistics(user_id)
+            return len(sessions)
+
+        PracticeSession.objects.filter(pk__in=[s["id"] for s in sessions]).update(stats_applied=True)
+
+        by_day, user = {}, None
+        for session in sessions:
+            day = session["session_date"]
+            if day is None:
+                # stored before session_date existed and not yet backfilled
+                user = user or User.objects.get(pk=user_id)
+                day = user.local_date(session["timestamp"])
+            _merge(by_day.setdefault(day, _empty_delta()), _session_delta(session))
+
+        for model, date_field, period_of in ROLLUPS:
+            by_period = {}
+            for day, delta in by_day.items():
+                _merge(by_period.setdefault(period_of(day), _empty_delta()), delta)
+            for period, delta in sorted(by_period.items()):
+                _increment(model, {"user_id": user_id, date_field: period}, delta)
+
+        total = _empty_delta()
+        for delta in by_day.values():
+            _merge(total, delta)
+        _increment(AllTimeStatistics, {"user_id": user_id}, total,
+                   "total_time_spent", "total_lessons_completed", {"statistics_version": STATISTICS_VERSION})
+        _advance_streak(user_id, by_day)
+        transaction.on_commit(lambda: leaderboard.sync_user(user_id, list(by_day)))
+        # the upserts above are queryset updates, which send no post_save
+        tagged_cache.bump_on_commit(tagged_cache.user_tag(user_id), tagged_cache.LEADERBOARD_TAG)
+
+    return len(sessions)
+
+
+def compute_streak(dates):
+    """
+    Walk an ascending list of active dates once and return
+    (current_streak, longest_streak, last_active_date), where the current
+    streak is the run of consecutive days ending at the last active date.
+    """
+    current = longest = 0
+    last = None
+    for day in dates:
+        if last is not None and day == last + timedelta(days=1):
+            current += 1
+        elif day != last:
+            current = 1
+        longest = max(longest, current)
+        last = day
+    return current, longest, last
+
+
+def rebuild_streak(user_id, commit=True):
+    """
+    Recompute the materialized streak from a single date-list fetch.
+    Returns True when the stored streak had drifted.
+    """
+    dates = DailyStatistics.objects.filter(user_id=user_id).order_by("date").values_list("date", flat=True)
+    current, longest, last = compute_streak(dates)
+
+    stored = Streak.objects.filter(user_id=user_id).values_list(
+        "current_streak", "longest_streak", "last_active_date").first()
+    drifted = stored != (current, longest, last) and not (stored is None and last is None)
+
+    if commit and drifted:
+        Streak.objects.update_or_create(user_id=user_id, defaults={
+            "current_streak": current, "longest_streak": longest, "last_active_date": last,
+        })
+    return drifted
+
+
+def _advance_streak(user_id, days):
+    streak, _ = Streak.objects.select_for_update().get_or_create(user_id=user_id)
+
+    for day in sorted(days):
+        last = streak.last_active_date
+        if last is not None and day < last:
+            # replayed history landed before the streak end, fall back to one date-list scan
+            rebuild_streak(user_id)
+            return
+        if last is not None and day == last + timedelta(days=1):
+            streak.current_streak += 1
+        elif day != last:
+            streak.current_streak = 1
+        streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+        streak.last_active_date = day
+
+    streak.save()
+
+
+def _archived_deltas(user_id):
+    """Per-day deltas of the user's archived sessions, see practice.archive."""
+    by_day = {}
+    user = None
+    for columns in archive.iter_blocks(user_id=user_id):
+        ids = columns["id"]
+        # a chunk interrupted between writing and deleting is still counted on the live side
+        live = set(
+            PracticeSession.objects.filter(user_id=user_id, pk__range=(int(ids.min()), int(ids.max())))
+            .values_list("pk", flat=True)
+        )
+        days = columns["session_date"]
+        if days is None:
+            # blocks written before session dates were archived
+            user = user or User.objects.get(pk=user_id)
+            days = [user.local_date(archive.to_datetime(moment)) for moment in columns["timestamp"]]
+        else:
+            days = [archive.to_date(day) for day in days]
+        for i, session_id in enumerate(ids.tolist()):
+            if session_id in live:
+                continue
+            session = {
+                "time_taken": int(columns["time_taken"][i]),
+                "speed": float(columns["speed"][i]),
+                "accuracy": float(columns["accuracy"][i]),
+            }
+            _merge(by_day.setdefault(days[i], _empty_delta()), _session_delta(session))
+    return by_day
+
+
+def _daily_rows_from_sessions(user_id, applied_only=False):
+    sessions = PracticeSession.objects.filter(user_id=user_id)
+    if applied_only:
+        sessions = sessions.filter(stats_applied=True)
+
+    rows = (
+        sessions.values("session_date")
+        .annotate(
+            time_taken_sum=Sum("time_taken"),
+            lessons_completed=Count("id"),
+            speed_sum=Sum("speed"),
+            accuracy_sum=Sum("accuracy"),
+            top_speed=Max("speed"),
+            top_accuracy=Max("accuracy"),
+        )
+        .order_by("session_date")
+    )
+    by_day = {}
+    for row in rows:
+        if row["session_date"] is not None:
+            _merge(by_day.setdefault(row["session_date"], _empty_delta()), _row_delta(row))
+            continue
+        # sessions stored before session_date existed and not yet backfilled
+        user = User.objects.get(pk=user_id)
+        for session in sessions.filter(session_date__isnull=True).values("timestamp", "time_taken", "speed", "accuracy"):
+            _merge(by_day.setdefault(user.local_date(session["timestamp"]), _empty_delta()), _session_delta(session))
+    # archived sessions were all applied before they were archived
+    for day, delta in _archived_deltas(user_id).items():
+        _merge(by_day.setdefault(day, _empty_delta()), delta)
+    return {day: _delta_row(delta) for day, delta in sorted(by_day.items())}
+
+
+def _rollup(daily, period_of):
+    periods = {}
+    for day, row in daily.items():
+        _merge(periods.setdefault(period_of(day), _empty_delta()), _row_delta(row))
+    return {period: _delta_row(delta) for period, delta in periods.items()}
+
+
+def _differs(stored, expected, fields):
+    if stored is None:
+        return True
+    for field in fields:
+        if abs((stored[field] or 0) - expected[field]) > 1e-6 * max(1, abs(expected[field])):
+            return True
+    return False
+
+
+def rebuild_user_statistics(user_id, commit=True):
+    """
+    Recompute a user's daily, weekly, monthly, all-time and streak
+    statistics from the raw sessions.
+
+    With `commit=False` nothing is written and only already applied sessions
+    are considered, so the result shows drift in the running totals. Returns
+    the list of drifted daily dates, with "week:<start>" and "month:<start>"
+    for rollups, None for the all-time row and "streak" for the streak.
+    """
+    with transaction.atomic():
+        if commit:
+            # hold off concurrent apply_sessions() calls for this user
+            list(PracticeSession.objects.select_for_update()
+                 .filter(user_id=user_id, stats_applied=False).values_list("id", flat=True))
+
+        daily = _daily_rows_from_sessions(user_id, applied_only=not commit)
+
+        drifted, rewrites = [], []
+        for model, date_field, period_of in ROLLUPS:
+            expected = daily if model is DailyStatistics else _rollup(daily, period_of)
+            stored = {
+                row[date_field]: row
+                for row in model.objects.filter(user_id=user_id).values(date_field, *DAILY_FIELDS)
+            }
+            model_drift = [
+                period for period in sorted(set(expected) | set(stored))
+                if period not in expected or _differs(stored.get(period), expected[period], DAILY_FIELDS)
+            ]
+            if model is DailyStatistics:
+                drifted += model_drift
+            else:
+                prefix = "week" if model is WeeklyStatistics else "month"
+                drifted += [f"{prefix}:{period}" for period in model_drift]
+            if model_drift:
+                rewrites.append((model, date_field, expected))
+
+        stored_all_time = AllTimeStatistics.objects.filter(user_id=user_id).values(*ALL_TIME_FIELDS).first()
+        all_time = None
+        if daily:
+            total = _empty_delta()
+            for row in daily.values():
+                _merge(total, _row_delta(row))
+            all_time = _delta_row(total, "total_time_spent", "total_lessons_completed")
+        if (all_time is None) != (stored_all_time is None) or (
+            all_time is not None and _differs(stored_all_time, all_time, ALL_TIME_FIELDS)
+        ):
+            drifted.append(None)
+
+        if not commit:
+            if rebuild_streak(user_id, commit=False):
+                drifted.append("streak")
+            return drifted
 
-        profile, _ = AllTimeStatistics.objects.get_or_create(user=user)
+        PracticeSession.objects.filter(user_id=user_id, stats_applied=False).update(stats_applied=True)
 
-        profile.total_time_spent = agg["total_time_spent"] or 0
-        profile.total_lessons_completed = agg["total_lessons_completed"] or 0
-        profile.top_speed = agg["top_speed"] or 0
-        profile.avg_speed = agg["avg_speed"] or 0
-        profile.top_accuracy = agg["top_accuracy"] or 0
-        profile.avg_accuracy = agg["avg_accuracy"] or 0
+        for model, date_field, expected in rewrites:
+            model.objects.filter(user_id=user_id).delete()
+            model.objects.bulk_create(
+                model(user_id=user_id, **{date_field: period}, **row) for period, row in expected.items()
+            )
+        if None in drifted:
+            if all_time is None:
+                AllTimeStatistics.objects.filter(user_id=user_id).delete()
+            else:
+                AllTimeStatistics.objects.update_or_create(
+                    user_id=user_id, defaults={**all_time, "statistics_version": STATISTICS_VERSION}
+                )
+            transaction.on_commit(lambda: leaderboard.sync_user(user_id))
+        else:
+            AllTimeStatistics.objects.filter(
+                user_id=user_id, statistics_version__lt=STATISTICS_VERSION
+            ).update(statistics_version=STATISTICS_VERSION)
 
-        profile.save()
+        if rebuild_streak(user_id):
+            drifted.append("streak")
+        if drifted:
+            tagged_cache.bump_on_commit(tagged_cache.user_tag(user_id), tagged_cache.LEADERBOARD_TAG)
 
-    except Exception as e:
-        print(f"Error updating all-time stats: {e}")
+    return drifted
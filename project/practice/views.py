@@ -1,4 +1,3 @@
-import random
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, serializers
@@ -6,11 +5,17 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from .serializers import *
 from .models import *
 from accounts.renderers import UserRenderer
-from django.utils import timezone
-from datetime import timedelta
-from .tasks import update_daily_statistics_task, update_all_time_statistics_task
+from datetime import date
+from .dispatch import schedule_statistics
 from .utils import *
-from django.core.cache import cache
+from . import leaderboard
+from .snippets import get_snippet, snippet_pool
+from .recommend import recommend_for
+from . import keystrokes
+from accounts.models import User
+from core import cache as tagged_cache
+from core import prerender
+from django.db import IntegrityError, transaction
 
 
 class TextSnippetView(APIView):
@@ -18,27 +23,30 @@ class TextSnippetView(APIView):
     renderer_classes = [UserRenderer]
 
     def get(self, request, format=None):
-        count = TextSnippet.objects.count()
-        if count == 0:
+        snippet = snippet_pool.random()
+        if snippet is None:
             return Response(
                 {"detail": "No text snippets available."},
                 status=status.HTTP_404_NOT_FOUND
             )
-
-        # random offset in [0, count–1]
-        index = random.randint(0, count - 1)
-        cache_key = f"text_snippet:{index}"
-        data = cache.get(cache_key)
-        if not data:
-            try:
-                snippet = TextSnippet.objects.get(index=index)
-            except TextSnippet.DoesNotExist:
-                return Response({"detail":"Not found."}, status=status.HTTP_404_NOT_FOUND)
-            data = TextSnippetSerializer(snippet).data
-            cache.set(cache_key, data, timeout=60*60)  # 1hr
-        return Response(data, status=status.HTTP_200_OK)
+        return Response(snippet, status=status.HTTP_200_OK)
     
 
+class RecommendedSnippetView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request, format=None):
+        index = recommend_for(request.user)
+        snippet = get_snippet(index) if index is not None else None
+        if snippet is None:
+            return Response(
+                {"detail": "No text snippets available."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(snippet, status=status.HTTP_200_OK)
+
+
 class PracticeSessionView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
@@ -52,11 +60,10 @@ class PracticeSessionView(APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            session = serializer.save()  # user is injected automatically
+            serializer.save()  # user is injected automatically
 
-             # Async updates
-            update_daily_statistics_task.delay(request.user.id)
-            update_all_time_statistics_task.delay(request.user.id)
+             # Async incremental stats update, coalesced per user
+            schedule_statistics(request.user.id)
 
             return Response(
                 {"msg": "Session recorded successfully."},
@@ -78,13 +85,127 @@ class PracticeSessionView(APIView):
             )
 
 
-   
+class PracticeSessionBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def post(self, request, format=None):
+        serializer = SessionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        key = serializer.validated_data["idempotency_key"]
+
+        replayed = self._recorded_result(request.user, key)
+        if replayed is not None:
+            return Response(replayed, status=status.HTTP_200_OK)
+
+        sessions, results = [], []
+        for i, item in enumerate(serializer.validated_data["sessions"]):
+            item_serializer = SessionBatchItemSerializer(data=item)
+            if item_serializer.is_valid():
+                session = PracticeSession(user=request.user, **item_serializer.validated_data)
+                session.session_date = request.user.local_date(session.timestamp)  # bulk_create skips save()
+                sessions.append(session)
+                results.append({"index": i, "status": "created"})
+            else:
+                errors = {field: [str(e) for e in errs] for field, errs in item_serializer.errors.items()}
+                results.append({"index": i, "status": "invalid", "errors": errors})
+
+        response_data = {"created": len(sessions), "failed": len(results) - len(sessions), "results": results}
+        if not sessions:
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                SessionBatch.objects.create(user=request.user, idempotency_key=key, result=response_data)
+                PracticeSession.objects.bulk_create(sessions)
+        except IntegrityError:
+            replayed = self._recorded_result(request.user, key)
+            if replayed is None:
+                raise  # another constraint failed, not a concurrent retry of this batch
+            # a concurrent retry of the same batch got there first
+            return Response(replayed, status=status.HTTP_200_OK)
+
+        # one upsert per affected day, however many sessions the batch held
+        schedule_statistics(request.user.id)
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    def _recorded_result(self, user, key):
+        return SessionBatch.objects.filter(user=user, idempotency_key=key).values_list("result", flat=True).first()
+
+
+class KeystrokeView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def post(self, request, session_id, format=None):
+        try:
+            session = PracticeSession.objects.get(pk=session_id, user=request.user)
+        except PracticeSession.DoesNotExist:
+            return Response({"detail": "Session not found."}, status=status.HTTP_404_NOT_FOUND)
+        if KeystrokeLog.objects.filter(session=session).exists():
+            return self._already_recorded()
+
+        serializer = KeystrokeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            log, _ = keystrokes.record_keystrokes(session, **serializer.validated_data)
+        except IntegrityError:
+            # a concurrent upload for the same session got there first
+            return self._already_recorded()
+        return Response(
+            {"msg": "Keystrokes recorded successfully.", "keystrokes": log.keystrokes, "bytes": len(log.data)},
+            status=status.HTTP_201_CREATED
+        )
+
+    @staticmethod
+    def _already_recorded():
+        return Response(
+            {"detail": "Keystrokes were already recorded for this session."},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    def get(self, request, session_id, format=None):
+        log = KeystrokeLog.objects.filter(session_id=session_id, session__user=request.user).first()
+        if log is None:
+            return Response({"detail": "No keystrokes recorded for this session."}, status=status.HTTP_404_NOT_FOUND)
+
+        stats = keystrokes.analyze(*keystrokes.decode(log.data))
+        return Response(
+            {"keys": keystrokes.heatmap(stats["keys"]), "bigrams": keystrokes.heatmap(stats["bigrams"], limit=50)},
+            status=status.HTTP_200_OK
+        )
+
+
+class KeystrokeHeatmapView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request, format=None):
+        profile = KeystrokeProfile.objects.filter(user=request.user).first()
+        if profile is None:
+            return Response({"detail": "No keystroke data yet."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            limit = min(max(int(request.query_params.get("limit", 50)), 1), 1000)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "sessions": profile.sessions,
+                "keys": keystrokes.heatmap(profile.keys),
+                "bigrams": keystrokes.heatmap(profile.bigrams, limit=limit),
+            },
+            status=status.HTTP_200_OK
+        )
+
+
 class DailyStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
 
     def get(self, request, format=None):
-        today = timezone.now().date()
+        today = request.user.local_date()
         try:
             stats = DailyStatistics.objects.get(user=request.user, date=today)
         except DailyStatistics.DoesNotExist:
@@ -102,10 +223,11 @@ class AllTimeStatisticsView(APIView):
     renderer_classes = [UserRenderer]
 
     def get(self, request, format=None):
-        cache_key = f"all_time_stats:{request.user.id}"
-        cached_data = cache.get(cache_key)
+        cache_key, cached_data = tagged_cache.get(
+            "all_time_stats", request.user.id, [tagged_cache.user_tag(request.user.id)]
+        )
         if cached_data:
-            return Response(cached_data, status=status.HTTP_200_OK)
+            return prerender.respond(request, cached_data)
 
         try:
             stats = AllTimeStatistics.objects.get(user=request.user)
@@ -115,7 +237,7 @@ class AllTimeStatisticsView(APIView):
                     {"detail": "No historical data available to compute all-time statistics."},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            update_all_time_statistics(request.user)
+            rebuild_user_statistics(request.user.id)
             try:
                 stats = AllTimeStatistics.objects.get(user=request.user)
             except AllTimeStatistics.DoesNotExist:
@@ -125,8 +247,9 @@ class AllTimeStatisticsView(APIView):
                 )
 
         serializer = AllTimeStatisticsSerializer(stats)
-        cache.set(cache_key, serializer.data, timeout=300)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        rendered = prerender.render(serializer.data)
+        tagged_cache.set(cache_key, rendered)
+        return prerender.respond(request, rendered)
 
 
 
@@ -136,14 +259,16 @@ class StreakView(APIView):
 
     def get(self, request, format=None):
         try:
-            streak = 0
-            day = timezone.now().date()
+            streak = Streak.objects.filter(user=request.user).values(
+                "current_streak", "longest_streak", "last_active_date").first()
+            if streak is None:
+                streak = {"current_streak": 0, "longest_streak": 0, "last_active_date": None}
 
-            while DailyStatistics.objects.filter(user=request.user, date=day).exists():
-                streak += 1
-                day -= timedelta(days=1)
+            # the run only counts as current while it reaches today
+            if streak["last_active_date"] != request.user.local_date():
+                streak["current_streak"] = 0
 
-            serializer = StreakSerializer({"current_streak": streak})
+            serializer = StreakSerializer(streak)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except Exception:
@@ -157,49 +282,115 @@ class UserRankView(APIView):
     renderer_classes = [UserRenderer]
 
     def get(self, request, format=None):
-        cache_key = f"user_rank:{request.user.id}"
-        cached = cache.get(cache_key)
-        if cached:
-            return Response(cached, status=status.HTTP_200_OK)
+        window = request.query_params.get("window")
+        if window is not None and window not in leaderboard.WINDOWS:
+            return _invalid_window()
 
-        stats_qs = AllTimeStatistics.objects.filter(top_speed__gt=0).order_by('-top_speed')
-        total = stats_qs.count()
+        day = request.user.local_date()
+        cache_key, cached = tagged_cache.get(
+            "user_rank", f"{request.user.id}:{_window_period(window, day)}", [tagged_cache.LEADERBOARD_TAG]
+        )
+        if cached:
+            return prerender.respond(request, cached)
 
-        try:
-            position = list(stats_qs.values_list('user_id', flat=True)).index(request.user.id) + 1
-        except ValueError:
+        ranked = leaderboard.rank(request.user.id, "top_speed", window, day)
+        if ranked is None:
             return Response({"detail": "No typing data."}, status=status.HTTP_404_NOT_FOUND)
 
-        percentile = round((total - position) / total * 100, 2)
+        position, total = ranked
+        percentile = leaderboard.percentile(position, total)
         response_data = {"world_rank": position, "rank_percentile": percentile}
-        cache.set(cache_key, response_data, timeout=300)
-        return Response(response_data, status=status.HTTP_200_OK)
+        rendered = prerender.render(response_data)
+        tagged_cache.set(cache_key, rendered)
+        return prerender.respond(request, rendered)
 
 
 class GraphDataView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
 
+    # bucket -> (model, date field, period start of a day, approximate days per point)
+    BUCKETS = {
+        "day": (DailyStatistics, "date", lambda day: day, 1),
+        "week": (WeeklyStatistics, "period_start", week_start, 7),
+        "month": (MonthlyStatistics, "period_start", month_start, 30),
+    }
+
     def get(self, request, format=None):
         user = request.user
-        cache_key = f"user:{user.id}:graph_data"
+        params = request.query_params
+        bucket = params.get("bucket", "auto")
+        if bucket != "auto" and bucket not in self.BUCKETS:
+            return Response(
+                {"detail": "Invalid parameter. Use 'bucket=day', 'week', 'month' or 'auto'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            date_to = date.fromisoformat(params["to"]) if "to" in params else user.local_date()
+            date_from = date.fromisoformat(params["from"]) if "from" in params else None
+            points = min(max(int(params.get("points", 200)), 1), 1000)
+        except ValueError:
+            return Response(
+                {"detail": "Invalid parameter. Dates use YYYY-MM-DD and 'points' is an integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        cached_data = cache.get(cache_key)
+        cache_key, cached_data = tagged_cache.get(
+            "graph_data", f"{user.id}:{bucket}:{date_from}:{date_to}:{points}", [tagged_cache.user_tag(user.id)]
+        )
         if cached_data:
-            return Response(cached_data, status=status.HTTP_200_OK)
+            return prerender.respond(request, cached_data)
 
-        stats = DailyStatistics.objects.filter(user=user).order_by('-date')
-
-        if stats.count() < 30:
+        if DailyStatistics.objects.filter(user=user).count() < 30:
             return Response(
                 {"detail": "Complete at least 30 lessons to unlock the graph."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        serializer = GraphDataSerializer(stats, many=True)
-        cache.set(cache_key, serializer.data, timeout=60 * 15) 
+        if date_from is None:
+            date_from = DailyStatistics.objects.filter(user=user).order_by("date").values_list("date", flat=True).first()
+        if date_from > date_to:
+            return Response({"detail": "'from' must not be after 'to'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if bucket == "auto":
+            # finest rollup that still fits the requested number of points
+            span = (date_to - date_from).days + 1
+            bucket = next(
+                (name for name, (*_, days) in self.BUCKETS.items() if span / days <= points), "month"
+            )
+        model, date_field, period_of, _ = self.BUCKETS[bucket]
+
+        rows = (
+            model.objects.filter(user=user, **{f"{date_field}__range": (period_of(date_from), date_to)})
+            .order_by(f"-{date_field}")
+            .values_list(date_field, "avg_speed", "avg_accuracy")[:points]  # the newest when a bucket was forced
+        )
+        rendered = prerender.render(graph_points(rows))
+        tagged_cache.set(cache_key, rendered)
+
+        return prerender.respond(request, rendered)
+
+def _usernames(user_ids):
+    """Resolve leaderboard members to usernames with one primary key lookup."""
+    return dict(User.objects.filter(pk__in=user_ids).values_list("id", "username"))
+
+
+def _window_period(window, day=None):
+    """Cache key part naming the ranking a window reads from on the local date `day`."""
+    return f"{window}:{leaderboard.current_period(window, day)[0]}" if window else "all"
+
+
+def _local_date(request):
+    """The reader's date for windowed rankings, the server's for anonymous readers."""
+    return request.user.local_date() if request.user.is_authenticated else None
+
+
+def _invalid_window():
+    return Response(
+        {"detail": "Invalid parameter. Use 'window=day', 'window=week' or 'window=month'."},
+        status=status.HTTP_400_BAD_REQUEST
+    )
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
 
 class LeaderboardView(APIView):
     permission_classes = [AllowAny]
@@ -207,25 +398,64 @@ class LeaderboardView(APIView):
 
     def get(self, request, format=None):
         sort_by = request.query_params.get("sort_by", "top_speed")
-        if sort_by not in ["top_speed", "avg_speed"]:
+        if sort_by not in leaderboard.METRICS:
             return Response(
                 {"detail": "Invalid parameter. Use 'sort_by=top_speed' or 'sort_by=avg_speed'."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        cache_key = f"leaderboard:{sort_by}"
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data, status=status.HTTP_200_OK)
-
-        stats_qs = AllTimeStatistics.objects.filter(
-            **{f"{sort_by}__gt": 0}).order_by(f"-{sort_by}")[:10]
-        if not stats_qs.exists():
+        window = request.query_params.get("window")
+        if window is not None and window not in leaderboard.WINDOWS:
+            return _invalid_window()
+
+        day = _local_date(request)
+
+        def compute():
+            entries = leaderboard.top(sort_by, 10, window, day)
+            usernames = _usernames([user_id for _, user_id, _ in entries])
+            data = [
+                {"username": usernames[user_id], "wpm": score}
+                for _, user_id, score in entries if user_id in usernames
+            ]
+            return prerender.render(data) if data else None
+
+        # public and hot, so recomputed by one request at a time
+        rendered = tagged_cache.get_or_compute(
+            "leaderboard", f"{sort_by}:{_window_period(window, day)}", [tagged_cache.LEADERBOARD_TAG], compute
+        )
+        if rendered is None:
             return Response(
                 {"detail": f"No leaderboard data found for '{sort_by}'."},
                 status=status.HTTP_404_NOT_FOUND
             )
+        return prerender.respond(request, rendered)
+
+
+class LeaderboardAroundView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request, format=None):
+        sort_by = request.query_params.get("sort_by", "top_speed")
+        if sort_by not in leaderboard.METRICS:
+            return Response(
+                {"detail": "Invalid parameter. Use 'sort_by=top_speed' or 'sort_by=avg_speed'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        window = request.query_params.get("window")
+        if window is not None and window not in leaderboard.WINDOWS:
+            return _invalid_window()
+        try:
+            radius = min(max(int(request.query_params.get("radius", 5)), 1), 50)
+        except ValueError:
+            return Response({"detail": "radius must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = leaderboard.around(request.user.id, sort_by, radius, window, request.user.local_date())
+        if not entries:
+            return Response({"detail": "No typing data."}, status=status.HTTP_404_NOT_FOUND)
 
-        data = [{"username": stat.user.username, "wpm": getattr(stat, sort_by)} for stat in stats_qs]
-        cache.set(cache_key, data, timeout=120)
+        usernames = _usernames([user_id for _, user_id, _ in entries])
+        data = [
+            {"rank": position, "username": usernames[user_id], "wpm": score}
+            for position, user_id, score in entries if user_id in usernames
+        ]
         return Response(data, status=status.HTTP_200_OK)